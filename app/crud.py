@@ -1,9 +1,62 @@
+import threading
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from app.models import Building, Floor, Fingerprint, AccessPoint
-from app.schemas import BuildingCreate, FloorCreate, FingerprintCreate
+from sqlalchemy import func, insert, and_, or_
+from sqlalchemy.dialects import postgresql, sqlite
+from app.models import (
+    Building,
+    Floor,
+    Fingerprint,
+    FingerprintScans,
+    FingerprintArchive,
+    AccessPointStats,
+    FloorSurveyStats,
+    SurveySession,
+    FloorActiveSurvey,
+    RadioMapRevision,
+    RadioMapChange,
+    AccessPoint,
+    FloorLocalizationSettings,
+    RadioMapArtifact,
+    DeviceCalibration
+)
+from app.schemas import BuildingCreate, FloorCreate, FingerprintCreate, SurveySessionCreate
+from app.localization import (
+    RadioMapMatrix,
+    FloorDetectionIndex,
+    GridEngine,
+    DeviceCalibrationTable,
+    DEFAULT_ENGINE,
+    COMPACTION_TOLERANCE_M,
+    aggregate_fingerprints,
+    scan_moments,
+    merge_moments,
+    unmerge_moments,
+    build_radiomap_grid,
+    dump_grid,
+    load_grid,
+    load_grid_resolution,
+    fit_device_calibration,
+    pack_scans,
+    pack_scan_moments,
+    unpack_scans,
+    packed_access_point_ids,
+    radiomap_cache,
+    floor_detection_cache,
+    calibration_cache
+)
 from typing import List, Optional
 
+# Rows per statement for bulk inserts and IN lists
+BULK_CHUNK_SIZE = 500
+
+# Radio map deltas: revisions kept in the change log, and the delta size past which a
+# full snapshot is sent instead
+RADIOMAP_CHANGE_LOG_REVISIONS = 1000
+RADIOMAP_DELTA_MAX_CHANGES = 5000
+
+# Survey sessions that still accept fingerprints
+OPEN_SURVEY_STATUSES = ("collecting", "active")
+
 # Building CRUD
 def get_building(db: Session, building_id: int):
     return db.query(Building).filter(Building.id == building_id).first()
@@ -36,50 +89,763 @@ def create_floor(db: Session, floor: FloorCreate):
 def get_fingerprint(db: Session, fingerprint_id: int):
     return db.query(Fingerprint).filter(Fingerprint.id == fingerprint_id).first()
 
-def get_fingerprints_by_floor(db: Session, floor_id: int, skip: int = 0, limit: int = 1000):
-    return db.query(Fingerprint).filter(Fingerprint.floor_id == floor_id).offset(skip).limit(limit).all()
+def _live_fingerprints(db: Session, floor_id: int):
+    """Filter selecting the fingerprints of a floor's active survey session
+
+    Every radio map, statistic and listing goes through this, so switching the active
+    session swaps the floor's whole fingerprint set at once.
+    """
+    active_session_id = get_active_survey_session_id(db, floor_id)
+    if active_session_id is None:
+        return and_(Fingerprint.floor_id == floor_id, Fingerprint.survey_session_id.is_(None))
+    return and_(Fingerprint.floor_id == floor_id, Fingerprint.survey_session_id == active_session_id)
+
+def get_fingerprints_by_floor(
+    db: Session,
+    floor_id: int,
+    skip: int = 0,
+    limit: int = 1000,
+    after_id: Optional[int] = None,
+    survey_session_id: Optional[int] = None
+):
+    if survey_session_id is not None:
+        query = db.query(Fingerprint).filter(Fingerprint.floor_id == floor_id, Fingerprint.survey_session_id == survey_session_id)
+    else:
+        query = db.query(Fingerprint).filter(_live_fingerprints(db, floor_id))
+    if after_id is not None:
+        # Keyset page: seeks on (floor_id, id) instead of scanning past skipped rows
+        query = query.filter(Fingerprint.id > after_id)
+    return query.order_by(Fingerprint.id).offset(skip).limit(limit).all()
+
+def iter_floor_fingerprints(db: Session, floor_id: int, page_size: int = BULK_CHUNK_SIZE):
+    """Yield a floor's fingerprints as lightweight rows in id order, one keyset page at a time"""
+    live = _live_fingerprints(db, floor_id)
+    after_id = 0
+    while True:
+        page = db.query(
+            Fingerprint.id, Fingerprint.floor_id, Fingerprint.x, Fingerprint.y,
+            Fingerprint.device_model, Fingerprint.timestamp, Fingerprint.wifi_scans
+        ).filter(live, Fingerprint.id > after_id).order_by(Fingerprint.id).limit(page_size).all()
+        if not page:
+            return
+        yield from page
+        after_id = page[-1].id
 
 def create_fingerprint(db: Session, fingerprint: FingerprintCreate):
-    # Convert wifi_scans to dict format for JSON storage
-    fingerprint_data = fingerprint.dict()
-    wifi_scans = [{"bssid": scan["bssid"], "rssi": scan["rssi"]} for scan in fingerprint_data["wifi_scans"]]
-    fingerprint_data["wifi_scans"] = wifi_scans
-    
-    db_fingerprint = Fingerprint(**fingerprint_data)
-    db.add(db_fingerprint)
-    
-    # Update or create access points
-    for scan in wifi_scans:
-        ap = db.query(AccessPoint).filter(AccessPoint.bssid == scan["bssid"]).first()
-        if ap:
-            ap.last_seen = func.now()
-        else:
-            ap = AccessPoint(bssid=scan["bssid"])
-            db.add(ap)
-    
+    # Stored through the bulk path so the packed scans are written alongside the JSON
+    fingerprint_id = _insert_fingerprints(db, [fingerprint])[0]
     db.commit()
-    db.refresh(db_fingerprint)
-    return db_fingerprint
+    _invalidate_floor(fingerprint.floor_id)
+    return db.get(Fingerprint, fingerprint_id)
 
 def create_fingerprints_batch(db: Session, fingerprints: List[FingerprintCreate]):
+    # One access point upsert, one multi-row insert and a single commit for the whole batch
+    fingerprint_ids = _insert_fingerprints(db, fingerprints)
+    db.commit()
+    for floor_id in {fingerprint.floor_id for fingerprint in fingerprints}:
+        _invalidate_floor(floor_id)
+    
     db_fingerprints = []
-    for fingerprint in fingerprints:
-        db_fingerprint = create_fingerprint(db, fingerprint)
-        db_fingerprints.append(db_fingerprint)
+    for start in range(0, len(fingerprint_ids), BULK_CHUNK_SIZE):
+        chunk = fingerprint_ids[start:start + BULK_CHUNK_SIZE]
+        db_fingerprints.extend(
+            db.query(Fingerprint).filter(Fingerprint.id.in_(chunk)).order_by(Fingerprint.id).all()
+        )
     return db_fingerprints
 
+def import_fingerprints(db: Session, fingerprints: List[FingerprintCreate]) -> int:
+    """Bulk insert and commit one import chunk without loading the rows back"""
+    fingerprint_ids = _insert_fingerprints(db, fingerprints)
+    db.commit()
+    for floor_id in {fingerprint.floor_id for fingerprint in fingerprints}:
+        _invalidate_floor(floor_id)
+    return len(fingerprint_ids)
+
+def check_fingerprint_targets(db: Session, fingerprints: List[FingerprintCreate]):
+    """Raise LookupError for unknown floors and ValueError for survey sessions not open on the fingerprint's floor"""
+    floor_ids = {fingerprint.floor_id for fingerprint in fingerprints}
+    known = {floor_id for (floor_id,) in db.query(Floor.id).filter(Floor.id.in_(floor_ids)).all()}
+    missing = floor_ids - known
+    if missing:
+        raise LookupError(f"Floor {min(missing)} not found")
+    _check_survey_sessions(db, fingerprints)
+
+def _check_survey_sessions(db: Session, fingerprints: List[FingerprintCreate]):
+    session_ids = {fingerprint.survey_session_id for fingerprint in fingerprints} - {None}
+    if not session_ids:
+        return
+    open_sessions = dict(db.query(SurveySession.id, SurveySession.floor_id).filter(
+        SurveySession.id.in_(session_ids), SurveySession.status.in_(OPEN_SURVEY_STATUSES)
+    ).all())
+    for fingerprint in fingerprints:
+        if fingerprint.survey_session_id is not None and open_sessions.get(fingerprint.survey_session_id) != fingerprint.floor_id:
+            raise ValueError(f"Survey session {fingerprint.survey_session_id} is not open for floor {fingerprint.floor_id}")
+
+def _insert_fingerprints(db: Session, fingerprints: List[FingerprintCreate]):
+    """Bulk insert fingerprints and upsert their access points without committing; returns ids in order
+
+    Each fingerprint's scans are also written packed against the interned access point ids,
+    which is what radio map compilation reads.
+    """
+    if not fingerprints:
+        return []
+    floor_ids = {fingerprint.floor_id for fingerprint in fingerprints}
+    active_sessions = dict(db.query(FloorActiveSurvey.floor_id, FloorActiveSurvey.survey_session_id).filter(
+        FloorActiveSurvey.floor_id.in_(floor_ids)
+    ).all())
+    _check_survey_sessions(db, fingerprints)
+    
+    rows = []
+    bssids = set()
+    for fingerprint in fingerprints:
+        wifi_scans = [_scan_dict(scan) for scan in fingerprint.wifi_scans]
+        bssids.update(scan["bssid"] for scan in wifi_scans)
+        rows.append({
+            "floor_id": fingerprint.floor_id,
+            "x": fingerprint.x,
+            "y": fingerprint.y,
+            "device_model": fingerprint.device_model,
+            "wifi_scans": wifi_scans,
+            "survey_session_id": (
+                fingerprint.survey_session_id if fingerprint.survey_session_id is not None
+                else active_sessions.get(fingerprint.floor_id)
+            )
+        })
+    
+    ap_ids = _upsert_access_points(db, bssids)
+    statement = insert(Fingerprint).returning(Fingerprint.id, sort_by_parameter_order=True)
+    fingerprint_ids = list(db.scalars(statement, rows))
+    db.execute(insert(FingerprintScans), [
+        {
+            "fingerprint_id": fingerprint_id, "floor_id": row["floor_id"],
+            "payload": pack_scans(row["wifi_scans"], ap_ids), "moments": pack_scan_moments(row["wifi_scans"])
+        }
+        for fingerprint_id, row in zip(fingerprint_ids, rows)
+    ])
+    
+    # Only fingerprints joining the live set change the radio map; sessions still being
+    # collected are accounted for when they are activated
+    live_by_floor = {}
+    for fingerprint_id, row in zip(fingerprint_ids, rows):
+        if row["survey_session_id"] == active_sessions.get(row["floor_id"]):
+            live_by_floor.setdefault(row["floor_id"], []).append((fingerprint_id, row))
+    for floor_id, live_rows in live_by_floor.items():
+        _record_radiomap_changes(db, floor_id, added_ids=[fingerprint_id for fingerprint_id, _ in live_rows])
+        _update_access_point_stats(db, floor_id, [(row["x"], row["y"], row["wifi_scans"]) for _, row in live_rows], ap_ids)
+    return fingerprint_ids
+
+def backfill_packed_scans(db: Session, batch_size: int = BULK_CHUNK_SIZE) -> int:
+    """Write packed scans for fingerprints stored before packed storage existed; returns rows converted"""
+    converted = 0
+    floor_ids = set()
+    last_id = 0
+    while True:
+        batch = db.query(Fingerprint.id, Fingerprint.floor_id, Fingerprint.wifi_scans).outerjoin(
+            FingerprintScans, FingerprintScans.fingerprint_id == Fingerprint.id
+        ).filter(FingerprintScans.fingerprint_id.is_(None), Fingerprint.id > last_id).order_by(
+            Fingerprint.id
+        ).limit(batch_size).all()
+        if not batch:
+            break
+        
+        ap_ids = _upsert_access_points(db, {scan["bssid"] for row in batch for scan in row.wifi_scans or []})
+        db.execute(insert(FingerprintScans), [
+            {
+                "fingerprint_id": row.id, "floor_id": row.floor_id,
+                "payload": pack_scans(row.wifi_scans or [], ap_ids), "moments": pack_scan_moments(row.wifi_scans or [])
+            }
+            for row in batch
+        ])
+        db.commit()
+        converted += len(batch)
+        floor_ids.update(row.floor_id for row in batch)
+        last_id = batch[-1].id
+    
+    for floor_id in floor_ids:
+        _invalidate_floor(floor_id)
+    return converted
+
+def _scan_dict(scan):
+    # Aggregate statistics are only stored on compacted reference points
+    entry = {"bssid": scan.bssid, "rssi": scan.rssi}
+    if scan.count is not None:
+        entry["rssi_std"] = scan.rssi_std
+        entry["count"] = scan.count
+    return entry
+
+def _upsert_access_points(db: Session, bssids):
+    """Create unseen access points and bump last_seen on known ones; returns {bssid: access point id}"""
+    bssids = sorted(bssids)
+    ap_ids = {}
+    dialect = db.get_bind().dialect.name
+    if dialect not in ("postgresql", "sqlite"):
+        # Generic fallback: bump and look up the known ones, then add the missing ones
+        for start in range(0, len(bssids), BULK_CHUNK_SIZE):
+            chunk = bssids[start:start + BULK_CHUNK_SIZE]
+            db.query(AccessPoint).filter(AccessPoint.bssid.in_(chunk)).update(
+                {AccessPoint.last_seen: func.now()}, synchronize_session=False
+            )
+            ap_ids.update(db.query(AccessPoint.bssid, AccessPoint.id).filter(AccessPoint.bssid.in_(chunk)).all())
+        new_access_points = [AccessPoint(bssid=bssid) for bssid in bssids if bssid not in ap_ids]
+        db.add_all(new_access_points)
+        db.flush()
+        ap_ids.update((access_point.bssid, access_point.id) for access_point in new_access_points)
+        return ap_ids
+    
+    # One INSERT ... ON CONFLICT DO UPDATE per chunk; RETURNING covers inserted and updated rows
+    dialect_insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    for start in range(0, len(bssids), BULK_CHUNK_SIZE):
+        statement = dialect_insert(AccessPoint).values([{"bssid": bssid} for bssid in bssids[start:start + BULK_CHUNK_SIZE]])
+        statement = statement.on_conflict_do_update(
+            index_elements=[AccessPoint.bssid],
+            set_={"last_seen": func.now()}
+        ).returning(AccessPoint.bssid, AccessPoint.id)
+        ap_ids.update(db.execute(statement).all())
+    return ap_ids
+
+def compact_floor_fingerprints(db: Session, floor_id: int, tolerance: float = COMPACTION_TOLERANCE_M, archive: bool = False):
+    """Replace co-located fingerprints of one device model with aggregated reference points"""
+    rows = db.query(
+        Fingerprint.id, Fingerprint.x, Fingerprint.y, Fingerprint.device_model, Fingerprint.wifi_scans
+    ).filter(_live_fingerprints(db, floor_id)).order_by(Fingerprint.id).all()
+    groups = aggregate_fingerprints(rows, tolerance=tolerance)
+    removed_ids = [fingerprint_id for group in groups for fingerprint_id in group["ids"]]
+    
+    if groups:
+        aggregated_ids = _insert_fingerprints(db, [
+            FingerprintCreate(
+                floor_id=floor_id,
+                x=group["x"],
+                y=group["y"],
+                device_model=group["device_model"],
+                wifi_scans=group["wifi_scans"]
+            )
+            for group in groups
+        ])
+        compacted_into = {
+            fingerprint_id: aggregated_id
+            for group, aggregated_id in zip(groups, aggregated_ids)
+            for fingerprint_id in group["ids"]
+        }
+        for start in range(0, len(removed_ids), BULK_CHUNK_SIZE):
+            chunk = removed_ids[start:start + BULK_CHUNK_SIZE]
+            if archive:
+                raw_rows = db.query(
+                    Fingerprint.id, Fingerprint.floor_id, Fingerprint.x, Fingerprint.y,
+                    Fingerprint.device_model, Fingerprint.timestamp, Fingerprint.wifi_scans
+                ).filter(Fingerprint.id.in_(chunk)).all()
+                db.execute(insert(FingerprintArchive), [
+                    {**row._asdict(), "compacted_into": compacted_into[row.id]} for row in raw_rows
+                ])
+            db.query(FingerprintScans).filter(FingerprintScans.fingerprint_id.in_(chunk)).delete(synchronize_session=False)
+            db.query(Fingerprint).filter(Fingerprint.id.in_(chunk)).delete(synchronize_session=False)
+        removed = set(removed_ids)
+        removed_rows = [(row.x, row.y, row.wifi_scans) for row in rows if row.id in removed]
+        _update_access_point_stats(db, floor_id, removed_rows, _access_point_ids(db, _row_bssids(removed_rows)), removing=True)
+        _record_radiomap_changes(db, floor_id, removed_ids=removed_ids)
+        db.commit()
+        _invalidate_floor(floor_id)
+    
+    return {
+        "floor_id": floor_id,
+        "fingerprints_before": len(rows),
+        "fingerprints_after": len(rows) - len(removed_ids) + len(groups),
+        "aggregated_points": len(groups),
+        "archived": len(removed_ids) if archive else 0
+    }
+
+def _invalidate_floor(floor_id: int):
+    # Drop every compiled structure derived from the floor's fingerprints
+    radiomap_cache.invalidate(floor_id)
+    floor_detection_cache.invalidate()
+
+# Survey sessions
+def get_active_survey_session_id(db: Session, floor_id: int):
+    return db.query(FloorActiveSurvey.survey_session_id).filter(FloorActiveSurvey.floor_id == floor_id).scalar()
+
+def get_open_survey_session_ids(db: Session, floor_id: int):
+    """Ids of the floor's survey sessions that fingerprints may still be added to"""
+    return {survey_session_id for (survey_session_id,) in db.query(SurveySession.id).filter(
+        SurveySession.floor_id == floor_id, SurveySession.status.in_(OPEN_SURVEY_STATUSES)
+    ).all()}
+
+def get_survey_session(db: Session, survey_session_id: int):
+    return db.query(SurveySession).filter(SurveySession.id == survey_session_id).first()
+
+def get_survey_sessions(db: Session, floor_id: int):
+    counts = dict(db.query(Fingerprint.survey_session_id, func.count(Fingerprint.id)).filter(
+        Fingerprint.floor_id == floor_id, Fingerprint.survey_session_id.isnot(None)
+    ).group_by(Fingerprint.survey_session_id).all())
+    survey_sessions = db.query(SurveySession).filter(SurveySession.floor_id == floor_id).order_by(SurveySession.id).all()
+    for survey_session in survey_sessions:
+        survey_session.fingerprint_count = counts.get(survey_session.id, 0)
+    return survey_sessions
+
+def create_survey_session(db: Session, floor_id: int, survey_session: SurveySessionCreate):
+    db_survey_session = SurveySession(floor_id=floor_id, name=survey_session.name, status="collecting")
+    db.add(db_survey_session)
+    db.commit()
+    db.refresh(db_survey_session)
+    return db_survey_session
+
+def activate_survey_session(db: Session, survey_session: SurveySession):
+    """Make a session the floor's live fingerprint set; returns the id of the session it replaced
+
+    The switch is a single pointer update, so localization keeps serving the previous set
+    until the commit. None means the replaced set was the floor's sessionless fingerprints.
+    AP statistics still describe the previous set until rebuild_access_point_stats runs
+    after the commit, which keeps the full rebuild out of the switch's transaction.
+    """
+    floor_id = survey_session.floor_id
+    state = db.query(FloorActiveSurvey).filter(FloorActiveSurvey.floor_id == floor_id).with_for_update().first()
+    if state is None:
+        state = FloorActiveSurvey(floor_id=floor_id)
+        db.add(state)
+    previous_session_id = state.survey_session_id
+    if previous_session_id is not None:
+        db.query(SurveySession).filter(SurveySession.id == previous_session_id).update({"status": "retired"})
+    state.survey_session_id = survey_session.id
+    survey_session.status = "active"
+    survey_session.activated_at = func.now()
+    db.flush()
+    
+    # Radio map clients have to resync against the new set
+    _record_radiomap_changes(db, floor_id, reset=True)
+    db.commit()
+    _invalidate_floor(floor_id)
+    db.refresh(survey_session)
+    return previous_session_id
+
+def clear_floor_survey(db: Session, floor_id: int):
+    """Switch a floor to a new empty session; returns (fingerprints cleared, replaced session id)"""
+    cleared_count = db.query(func.count(Fingerprint.id)).filter(_live_fingerprints(db, floor_id)).scalar()
+    empty_session = SurveySession(floor_id=floor_id, name="cleared", status="collecting")
+    db.add(empty_session)
+    db.flush()
+    return cleared_count, activate_survey_session(db, empty_session)
+
+def purge_survey_fingerprints(db: Session, floor_id: int, survey_session_id: Optional[int], batch_size: int = BULK_CHUNK_SIZE) -> int:
+    """Delete a replaced session's fingerprints in small committed batches; returns rows deleted
+
+    survey_session_id None purges the floor's sessionless fingerprints. The live set is never purged.
+    """
+    if survey_session_id == get_active_survey_session_id(db, floor_id):
+        raise ValueError(f"Survey session {survey_session_id} is live on floor {floor_id}")
+    if survey_session_id is None:
+        in_session = Fingerprint.survey_session_id.is_(None)
+    else:
+        in_session = Fingerprint.survey_session_id == survey_session_id
+        db.query(SurveySession).filter(SurveySession.id == survey_session_id).update({"status": "purging"})
+        db.commit()
+    
+    deleted_count = 0
+    while True:
+        ids = [fingerprint_id for (fingerprint_id,) in db.query(Fingerprint.id).filter(
+            Fingerprint.floor_id == floor_id, in_session
+        ).order_by(Fingerprint.id).limit(batch_size).all()]
+        if not ids:
+            break
+        db.query(FingerprintScans).filter(FingerprintScans.fingerprint_id.in_(ids)).delete(synchronize_session=False)
+        db.query(Fingerprint).filter(Fingerprint.id.in_(ids)).delete(synchronize_session=False)
+        # Short transactions so purging never holds long locks
+        db.commit()
+        deleted_count += len(ids)
+    
+    if survey_session_id is not None:
+        db.query(SurveySession).filter(SurveySession.id == survey_session_id).update({"status": "purged"})
+        db.commit()
+    return deleted_count
+
+# Radio map revisions
+def _record_radiomap_changes(db: Session, floor_id: int, added_ids=(), removed_ids=(), reset: bool = False):
+    """Bump the floor's radio map revision and log the change in the caller's transaction"""
+    state = db.query(RadioMapRevision).filter(RadioMapRevision.floor_id == floor_id).with_for_update().first()
+    if state is None:
+        # Fingerprints older than the revision log can only be synced from a snapshot
+        state = RadioMapRevision(floor_id=floor_id, revision=0, reset_revision=1)
+        db.add(state)
+    state.revision += 1
+    if reset:
+        state.reset_revision = state.revision
+        db.query(RadioMapChange).filter(RadioMapChange.floor_id == floor_id).delete()
+    
+    oldest_kept = state.revision - RADIOMAP_CHANGE_LOG_REVISIONS
+    if oldest_kept > state.reset_revision:
+        state.reset_revision = oldest_kept
+        db.query(RadioMapChange).filter(
+            RadioMapChange.floor_id == floor_id, RadioMapChange.revision <= oldest_kept
+        ).delete()
+    
+    changes = [(fingerprint_id, "add") for fingerprint_id in added_ids]
+    changes += [(fingerprint_id, "remove") for fingerprint_id in removed_ids]
+    if changes:
+        db.execute(insert(RadioMapChange), [
+            {"floor_id": floor_id, "revision": state.revision, "fingerprint_id": fingerprint_id, "operation": operation}
+            for fingerprint_id, operation in changes
+        ])
+    return state.revision
+
+def get_radiomap_revision(db: Session, floor_id: int) -> int:
+    revision = db.query(RadioMapRevision.revision).filter(RadioMapRevision.floor_id == floor_id).scalar()
+    return revision or 0
+
+def get_radiomap_changes(db: Session, floor_id: int, since: int):
+    """Fingerprints added and removed after revision `since`, or a full snapshot when that is not possible"""
+    state = db.query(RadioMapRevision).filter(RadioMapRevision.floor_id == floor_id).first()
+    revision = state.revision if state else 0
+    
+    if state is not None and state.reset_revision <= since <= revision:
+        changes = db.query(RadioMapChange.fingerprint_id, RadioMapChange.operation).filter(
+            RadioMapChange.floor_id == floor_id, RadioMapChange.revision > since
+        ).order_by(RadioMapChange.id).limit(RADIOMAP_DELTA_MAX_CHANGES + 1).all()
+        if len(changes) <= RADIOMAP_DELTA_MAX_CHANGES:
+            added = {fingerprint_id for fingerprint_id, operation in changes if operation == "add"}
+            removed = {fingerprint_id for fingerprint_id, operation in changes if operation == "remove"}
+            # Points added and removed within the window never reached the client
+            added, removed = added - removed, removed - added
+            points = []
+            sorted_added = sorted(added)
+            for start in range(0, len(sorted_added), BULK_CHUNK_SIZE):
+                points.extend(_radiomap_points(db, Fingerprint.id.in_(sorted_added[start:start + BULK_CHUNK_SIZE])))
+            return {
+                "floor_id": floor_id,
+                "since": since,
+                "revision": revision,
+                "full": False,
+                "added": points,
+                "removed": sorted(removed)
+            }
+    
+    return {
+        "floor_id": floor_id,
+        "since": since,
+        "revision": revision,
+        "full": True,
+        "added": _radiomap_points(db, _live_fingerprints(db, floor_id)),
+        "removed": []
+    }
+
 # Radio map for localization
 def get_radiomap(db: Session, floor_id: int):
-    fingerprints = get_fingerprints_by_floor(db, floor_id)
+    return _radiomap_points(db, _live_fingerprints(db, floor_id))
+
+def _radiomap_points(db: Session, criterion):
+    """Radio map points of the matching fingerprints in id order, decoded from their packed scans"""
+    rows = db.query(
+        Fingerprint.id, Fingerprint.x, Fingerprint.y, FingerprintScans.payload, FingerprintScans.moments
+    ).outerjoin(FingerprintScans, FingerprintScans.fingerprint_id == Fingerprint.id).filter(
+        criterion
+    ).order_by(Fingerprint.id).all()
+    # Fingerprints written before packed storage; migrate_database.py backfills them
+    unpacked = [row.id for row in rows if row.payload is None]
+    legacy_scans = {}
+    for start in range(0, len(unpacked), BULK_CHUNK_SIZE):
+        legacy_scans.update(db.query(Fingerprint.id, Fingerprint.wifi_scans).filter(
+            Fingerprint.id.in_(unpacked[start:start + BULK_CHUNK_SIZE])
+        ).all())
+    ap_bssids = _access_point_bssids(db, packed_access_point_ids(row.payload for row in rows if row.payload is not None))
     return [
         {
-            "x": fp.x,
-            "y": fp.y,
-            "wifi_scans": fp.wifi_scans
+            "id": row.id,
+            "x": row.x,
+            "y": row.y,
+            "wifi_scans": legacy_scans[row.id] if row.payload is None else unpack_scans(row.payload, ap_bssids, row.moments)
         }
-        for fp in fingerprints
+        for row in rows
     ]
 
+def _access_point_bssids(db: Session, ap_ids):
+    ap_bssids = {}
+    for start in range(0, len(ap_ids), BULK_CHUNK_SIZE):
+        chunk = ap_ids[start:start + BULK_CHUNK_SIZE]
+        ap_bssids.update(db.query(AccessPoint.id, AccessPoint.bssid).filter(AccessPoint.id.in_(chunk)).all())
+    return ap_bssids
+
+def get_compiled_radiomap(db: Session, floor_id: int):
+    radio_map = radiomap_cache.get(floor_id)
+    if radio_map is not None:
+        return radio_map
+    
+    generation = radiomap_cache.generation(floor_id)
+    calibration_table = get_calibration_table(db)
+    rows = db.query(
+        Fingerprint.id, Fingerprint.x, Fingerprint.y, FingerprintScans.payload, Fingerprint.device_model
+    ).outerjoin(FingerprintScans, FingerprintScans.fingerprint_id == Fingerprint.id).filter(
+        _live_fingerprints(db, floor_id)
+    ).order_by(Fingerprint.id).all()
+    if rows and any(row.payload is None for row in rows):
+        # Fingerprints written before packed storage; migrate_database.py backfills them
+        rows = db.query(
+            Fingerprint.id, Fingerprint.x, Fingerprint.y, Fingerprint.wifi_scans, Fingerprint.device_model
+        ).filter(_live_fingerprints(db, floor_id)).order_by(Fingerprint.id).all()
+    # Normalise every device onto the reference scale so one radio map serves all phones
+    calibration = calibration_table.coefficients([row.device_model for row in rows]) if calibration_table else None
+    if rows and isinstance(rows[0][3], list):
+        radio_map = RadioMapMatrix.from_rows(floor_id, [row[:4] for row in rows], calibration=calibration)
+    else:
+        ap_bssids = _access_point_bssids(db, packed_access_point_ids(row.payload for row in rows))
+        radio_map = RadioMapMatrix.from_packed_rows(floor_id, [row[:4] for row in rows], ap_bssids, calibration=calibration)
+    radiomap_cache.put(floor_id, radio_map, generation)
+    return radio_map
+
+# Access point statistics
+def _update_access_point_stats(db: Session, floor_id: int, rows, ap_ids, removing: bool = False):
+    """Merge (or, when removing, unmerge) (x, y, wifi_scans) rows into the floor's AP statistics"""
+    moments, samples = scan_moments(rows)
+    
+    floor_stats = db.query(FloorSurveyStats).filter(FloorSurveyStats.floor_id == floor_id).with_for_update().first()
+    if floor_stats is None:
+        if removing:
+            return
+        floor_stats = FloorSurveyStats(floor_id=floor_id, fingerprint_count=0, sample_count=0)
+        db.add(floor_stats)
+    sign = -1 if removing else 1
+    floor_stats.fingerprint_count = max(floor_stats.fingerprint_count + sign * len(rows), 0)
+    floor_stats.sample_count = max(floor_stats.sample_count + sign * samples, 0)
+    
+    wanted = sorted(ap_ids[bssid] for bssid in moments if bssid in ap_ids)
+    existing = {}
+    for start in range(0, len(wanted), BULK_CHUNK_SIZE):
+        existing.update((stats.access_point_id, stats) for stats in db.query(AccessPointStats).filter(
+            AccessPointStats.floor_id == floor_id,
+            AccessPointStats.access_point_id.in_(wanted[start:start + BULK_CHUNK_SIZE])
+        ).with_for_update())
+    
+    for bssid, summary in moments.items():
+        ap_id = ap_ids.get(bssid)
+        if ap_id is None:
+            continue
+        stats = existing.get(ap_id)
+        if removing:
+            if stats is None:
+                continue
+            summary = unmerge_moments(_stats_moments(stats), summary)
+            if summary is None:
+                db.delete(stats)
+                continue
+        elif stats is None:
+            stats = AccessPointStats(floor_id=floor_id, access_point_id=ap_id)
+            db.add(stats)
+        else:
+            summary = merge_moments(_stats_moments(stats), summary)
+        (stats.sample_count, stats.rssi_mean, stats.rssi_m2,
+         stats.min_x, stats.max_x, stats.min_y, stats.max_y) = summary
+    # Later updates in the same transaction must see these rows
+    db.flush()
+
+def _stats_moments(stats: AccessPointStats):
+    return (stats.sample_count, stats.rssi_mean, stats.rssi_m2, stats.min_x, stats.max_x, stats.min_y, stats.max_y)
+
+def _row_bssids(rows):
+    return {scan["bssid"] for _, _, wifi_scans in rows for scan in wifi_scans or []}
+
+def _access_point_ids(db: Session, bssids):
+    bssids = sorted(bssids)
+    ap_ids = {}
+    for start in range(0, len(bssids), BULK_CHUNK_SIZE):
+        ap_ids.update(db.query(AccessPoint.bssid, AccessPoint.id).filter(
+            AccessPoint.bssid.in_(bssids[start:start + BULK_CHUNK_SIZE])
+        ).all())
+    return ap_ids
+
+def rebuild_access_point_stats(db: Session, floor_id: int):
+    """Recompute a floor's AP statistics from its fingerprints, also tightening coverage extents"""
+    _rebuild_access_point_stats(db, floor_id)
+    db.commit()
+    floor_detection_cache.invalidate()
+
+def _rebuild_access_point_stats(db: Session, floor_id: int):
+    db.query(AccessPointStats).filter(AccessPointStats.floor_id == floor_id).delete()
+    db.query(FloorSurveyStats).filter(FloorSurveyStats.floor_id == floor_id).delete()
+    db.add(FloorSurveyStats(floor_id=floor_id, fingerprint_count=0, sample_count=0))
+    db.flush()
+    
+    page = []
+    for row in iter_floor_fingerprints(db, floor_id):
+        page.append((row.x, row.y, row.wifi_scans))
+        if len(page) == BULK_CHUNK_SIZE:
+            _update_access_point_stats(db, floor_id, page, _access_point_ids(db, _row_bssids(page)))
+            page = []
+    if page:
+        _update_access_point_stats(db, floor_id, page, _access_point_ids(db, _row_bssids(page)))
+
+def get_access_point_stats(db: Session, floor_id: int):
+    rows = db.query(AccessPointStats, AccessPoint.bssid).join(
+        AccessPoint, AccessPoint.id == AccessPointStats.access_point_id
+    ).filter(AccessPointStats.floor_id == floor_id).order_by(AccessPointStats.sample_count.desc()).all()
+    return [
+        {
+            "bssid": bssid,
+            "sample_count": stats.sample_count,
+            "rssi_mean": stats.rssi_mean,
+            "rssi_std": (stats.rssi_m2 / stats.sample_count) ** 0.5,
+            "min_x": stats.min_x,
+            "max_x": stats.max_x,
+            "min_y": stats.min_y,
+            "max_y": stats.max_y
+        }
+        for stats, bssid in rows
+    ]
+
+def get_floor_detection_index(db: Session):
+    index = floor_detection_cache.get()
+    if index is not None:
+        return index
+    
+    generation = floor_detection_cache.generation()
+    # Per-floor AP aggregates maintained on ingestion, so no radio map has to be compiled
+    floors = db.query(Floor.id, Floor.building_id, FloorSurveyStats.sample_count).join(
+        FloorSurveyStats, FloorSurveyStats.floor_id == Floor.id
+    ).filter(FloorSurveyStats.fingerprint_count > 0).order_by(Floor.id).all()
+    access_points = db.query(
+        AccessPointStats.floor_id, AccessPoint.bssid, AccessPointStats.sample_count, AccessPointStats.rssi_mean
+    ).join(AccessPoint, AccessPoint.id == AccessPointStats.access_point_id).all()
+    index = FloorDetectionIndex.from_statistics(floors, access_points)
+    floor_detection_cache.put(index, generation)
+    return index
+
+# Localization settings
+def get_localization_engine(db: Session, floor_id: int):
+    settings = db.query(FloorLocalizationSettings).filter(FloorLocalizationSettings.floor_id == floor_id).first()
+    return settings.engine if settings else DEFAULT_ENGINE
+
+def set_localization_engine(db: Session, floor_id: int, engine: str):
+    settings = db.query(FloorLocalizationSettings).filter(FloorLocalizationSettings.floor_id == floor_id).first()
+    if settings is None:
+        settings = FloorLocalizationSettings(floor_id=floor_id)
+        db.add(settings)
+    settings.engine = engine
+    db.commit()
+    db.refresh(settings)
+    return settings
+
+# Persisted radio map artifacts
+def compile_radiomap_grid(db: Session, floor_id: int, resolution: float = 1.0):
+    radio_map = get_compiled_radiomap(db, floor_id)
+    if radio_map.is_empty:
+        raise LookupError("No fingerprints recorded for this floor")
+    
+    # Cover the floor outline, or the surveyed area when the floor has no dimensions
+    floor = get_floor(db, floor_id)
+    width = floor.width or float(radio_map.coords[:, 0].max()) + resolution
+    height = floor.height or float(radio_map.coords[:, 1].max()) + resolution
+    grid = build_radiomap_grid(radio_map, width=width, height=height, resolution=resolution)
+    payload = dump_grid(grid)
+    
+    artifact = db.query(RadioMapArtifact).filter(
+        RadioMapArtifact.floor_id == floor_id, RadioMapArtifact.kind == "grid"
+    ).first()
+    if artifact is None:
+        artifact = RadioMapArtifact(floor_id=floor_id, kind="grid")
+        db.add(artifact)
+    artifact.source_digest = radio_map.digest
+    artifact.payload = payload
+    artifact.created_at = func.now()
+    db.commit()
+    
+    radio_map.attach_engine("grid", GridEngine(radio_map, grid))
+    rows, cols = (int(n) for n in grid["shape"])
+    return {
+        "floor_id": floor_id,
+        "resolution": resolution,
+        "rows": rows,
+        "cols": cols,
+        "access_points": len(radio_map.bssids),
+        "bytes": len(payload),
+        "source_digest": radio_map.digest
+    }
+
+def load_persisted_engine(db: Session, radio_map: RadioMapMatrix, engine: str):
+    """Attach an engine stored as an artifact; returns 'ready', 'stale' or 'missing'"""
+    if engine != "grid" or radio_map.has_engine(engine):
+        return "ready"
+    
+    artifact = db.query(RadioMapArtifact).filter(
+        RadioMapArtifact.floor_id == radio_map.floor_id,
+        RadioMapArtifact.kind == engine
+    ).first()
+    if artifact is None:
+        return "missing"
+    if artifact.source_digest != radio_map.digest:
+        return "stale"
+    radio_map.attach_engine(engine, GridEngine(radio_map, load_grid(artifact.payload)))
+    return "ready"
+
+# Floors with a grid recompile queued, so a burst of locate calls schedules it once
+_pending_grid_rebuilds = set()
+_pending_grid_rebuilds_lock = threading.Lock()
+
+def claim_radiomap_grid_rebuild(floor_id: int):
+    """True if the caller should queue a grid recompile for the floor"""
+    with _pending_grid_rebuilds_lock:
+        if floor_id in _pending_grid_rebuilds:
+            return False
+        _pending_grid_rebuilds.add(floor_id)
+        return True
+
+def rebuild_radiomap_grid(db: Session, floor_id: int):
+    """Recompile a claimed stale grid at the resolution it was compiled with, then release the claim"""
+    try:
+        artifact = db.query(RadioMapArtifact).filter(
+            RadioMapArtifact.floor_id == floor_id, RadioMapArtifact.kind == "grid"
+        ).first()
+        if artifact is not None:
+            try:
+                compile_radiomap_grid(db, floor_id, load_grid_resolution(artifact.payload))
+            except (LookupError, ValueError):
+                # The floor was cleared or outgrew the grid limits; locate keeps falling back
+                pass
+    finally:
+        with _pending_grid_rebuilds_lock:
+            _pending_grid_rebuilds.discard(floor_id)
+
+# Device calibration
+def get_device_calibrations(db: Session):
+    return db.query(DeviceCalibration).order_by(DeviceCalibration.device_model).all()
+
+def get_calibration_table(db: Session):
+    table = calibration_cache.get()
+    if table is not None:
+        return table
+    
+    generation = calibration_cache.generation()
+    table = DeviceCalibrationTable({
+        calibration.device_model: (calibration.scale, calibration.offset)
+        for calibration in get_device_calibrations(db)
+    })
+    calibration_cache.put(table, generation)
+    return table
+
+def fit_device_calibrations(db: Session):
+    # Live fingerprints of every floor: those of the active session, or sessionless ones where none is active
+    rows = db.query(
+        Fingerprint.floor_id, Fingerprint.x, Fingerprint.y, Fingerprint.device_model, Fingerprint.wifi_scans
+    ).outerjoin(FloorActiveSurvey, FloorActiveSurvey.floor_id == Fingerprint.floor_id).filter(
+        Fingerprint.device_model.isnot(None),
+        or_(
+            Fingerprint.survey_session_id == FloorActiveSurvey.survey_session_id,
+            and_(Fingerprint.survey_session_id.is_(None), FloorActiveSurvey.survey_session_id.is_(None))
+        )
+    ).yield_per(1000)
+    fitted = fit_device_calibration(rows)
+    
+    existing = {calibration.device_model: calibration for calibration in get_device_calibrations(db)}
+    for device_model, fit in fitted.items():
+        calibration = existing.get(device_model)
+        if calibration is None:
+            calibration = DeviceCalibration(device_model=device_model)
+            db.add(calibration)
+        calibration.scale = fit["scale"]
+        calibration.offset = fit["offset"]
+        calibration.sample_count = fit["sample_count"]
+    db.commit()
+    
+    # Every compiled radio map was normalised with the old table
+    calibration_cache.invalidate()
+    radiomap_cache.clear()
+    floor_detection_cache.invalidate()
+    return get_device_calibrations(db)
+
 # Access Point CRUD
 def get_access_points(db: Session, skip: int = 0, limit: int = 1000):
     return db.query(AccessPoint).offset(skip).limit(limit).all()
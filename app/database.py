@@ -1,6 +1,6 @@
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, Session
 import os
 from dotenv import load_dotenv
 
@@ -32,6 +32,11 @@ def get_db():
     finally:
         db.close()
 
+def run_in_session(bind, fn, *args):
+    """Call fn(db, *args) in a session of its own; for background tasks, which run after the request's session is closed"""
+    with Session(bind=bind) as db:
+        return fn(db, *args)
+
 # Test database connection
 def test_database_connection():
     """Test if database connection works"""
@@ -0,0 +1,130 @@
+import csv
+import json
+import codecs
+import zlib
+from typing import Optional, Set
+from pydantic import ValidationError
+
+from app.schemas import FingerprintCreate
+
+IMPORT_FORMATS = ("ndjson", "csv")
+IMPORT_CHUNK_SIZE = 1000  # fingerprints per bulk insert and commit
+MAX_REPORTED_ERRORS = 100
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+class FingerprintStreamParser:
+    """Incrementally turn NDJSON or CSV bytes (optionally gzip-compressed) into fingerprints for one floor
+
+    feed() accepts arbitrary byte chunks and yields (line_number, fingerprint, error) tuples with
+    exactly one of fingerprint/error set, so only the current line is ever held in memory.
+    CSV input needs a header with x, y and wifi_scans columns (device_model optional), where
+    wifi_scans is encoded as "bssid=rssi;bssid=rssi". When open_sessions is given, lines naming
+    a survey_session_id outside it are reported like any other bad line.
+    """
+
+    def __init__(self, floor_id: int, fmt: str = "ndjson", gzipped: Optional[bool] = None, open_sessions: Optional[Set[int]] = None):
+        if fmt not in IMPORT_FORMATS:
+            raise ValueError(f"Unknown import format '{fmt}', expected one of {', '.join(IMPORT_FORMATS)}")
+        self.floor_id = floor_id
+        self.fmt = fmt
+        self.gzipped = gzipped  # None sniffs the gzip magic bytes
+        self.open_sessions = open_sessions
+        self.line_number = 0
+        self._inflater = None
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._buffer = ""
+        self._header = None
+
+    def feed(self, data: bytes):
+        if self.gzipped is None:
+            if not data:
+                return
+            self.gzipped = data[:2] == GZIP_MAGIC
+        if self.gzipped:
+            if self._inflater is None:
+                self._inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            try:
+                data = self._inflater.decompress(data)
+            except zlib.error as e:
+                raise ValueError(f"Invalid gzip stream: {e}")
+
+        self._buffer += self._decoder.decode(data)
+        lines = self._buffer.split("\n")
+        self._buffer = lines.pop()
+        for line in lines:
+            yield from self._parse_line(line)
+
+    def close(self):
+        if self._inflater is not None:
+            self._buffer += self._decoder.decode(self._inflater.flush())
+        self._buffer += self._decoder.decode(b"", final=True)
+        line, self._buffer = self._buffer, ""
+        yield from self._parse_line(line)
+
+    def _parse_line(self, line: str):
+        self.line_number += 1
+        line = line.strip()
+        if not line:
+            return
+        if self.fmt == "csv" and self._header is None:
+            # A bad header makes every following row meaningless, so it fails the whole import
+            self._header = [column.strip() for column in next(csv.reader([line]))]
+            missing = {"x", "y", "wifi_scans"} - set(self._header)
+            if missing:
+                raise ValueError(f"CSV header is missing columns: {', '.join(sorted(missing))}")
+            return
+        try:
+            if self.fmt == "ndjson":
+                fingerprint = self._parse_ndjson(line)
+            else:
+                fingerprint = self._parse_csv(line)
+        except ValidationError as e:
+            yield self.line_number, None, "; ".join(
+                f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()
+            )
+            return
+        except ValueError as e:
+            yield self.line_number, None, str(e)
+            return
+        if (
+            self.open_sessions is not None and fingerprint.survey_session_id is not None
+            and fingerprint.survey_session_id not in self.open_sessions
+        ):
+            yield self.line_number, None, f"Survey session {fingerprint.survey_session_id} is not open for floor {self.floor_id}"
+            return
+        yield self.line_number, fingerprint, None
+
+    def _parse_ndjson(self, line: str):
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON: {e.msg}")
+        if not isinstance(record, dict):
+            raise ValueError("Expected a JSON object")
+        if record.setdefault("floor_id", self.floor_id) != self.floor_id:
+            raise ValueError(f"floor_id {record['floor_id']} does not match import floor {self.floor_id}")
+        return FingerprintCreate(**record)
+
+    def _parse_csv(self, line: str):
+        row = next(csv.reader([line]))
+        if len(row) != len(self._header):
+            raise ValueError(f"Expected {len(self._header)} columns, got {len(row)}")
+        record = dict(zip(self._header, row))
+
+        wifi_scans = []
+        for entry in record["wifi_scans"].split(";"):
+            if not entry.strip():
+                continue
+            bssid, separator, rssi = entry.partition("=")
+            if not separator:
+                raise ValueError(f"Invalid wifi scan entry '{entry}', expected bssid=rssi")
+            wifi_scans.append({"bssid": bssid.strip(), "rssi": rssi.strip()})
+
+        return FingerprintCreate(
+            floor_id=self.floor_id,
+            x=record["x"],
+            y=record["y"],
+            device_model=record.get("device_model") or None,
+            wifi_scans=wifi_scans
+        )
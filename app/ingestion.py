@@ -0,0 +1,108 @@
+import os
+import queue
+import logging
+import threading
+from typing import List, Optional
+
+from app.database import SessionLocal
+from app.crud import import_fingerprints
+from app.schemas import FingerprintCreate
+
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", 10000))  # fingerprints waiting to be written
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 500))  # fingerprints per write-behind transaction
+INGEST_DRAIN_TIMEOUT_S = float(os.getenv("INGEST_DRAIN_TIMEOUT_S", 30))  # how long shutdown waits for pending writes
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionQueue:
+    """Bounded in-process write-behind queue drained into the database by one worker thread
+
+    submit() either accepts a whole batch or raises queue.Full, so clients can back off and
+    retry without partial writes. The worker commits micro-batches through the bulk insert
+    path; a batch that fails is retried row by row so one bad fingerprint does not drop the rest.
+    """
+
+    def __init__(self, session_factory=SessionLocal, maxsize: int = INGEST_QUEUE_SIZE, batch_size: int = INGEST_BATCH_SIZE):
+        self.session_factory = session_factory
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.ingested = 0
+        self.failed = 0
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._submit_lock = threading.Lock()
+        self._worker = None
+
+    def submit(self, fingerprints: List[FingerprintCreate]):
+        with self._submit_lock:
+            if self._queue.qsize() + len(fingerprints) > self.maxsize:
+                raise queue.Full(f"Ingestion queue is full ({self._queue.qsize()}/{self.maxsize} fingerprints pending)")
+            for fingerprint in fingerprints:
+                self._queue.put_nowait(fingerprint)
+            self._ensure_worker()
+        return self._queue.qsize()
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self):
+        return {
+            "depth": self.depth(),
+            "capacity": self.maxsize,
+            "ingested": self.ingested,
+            "failed": self.failed
+        }
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """Wait until everything submitted so far has been written; False if timeout passed first
+
+        The worker is restarted first, so fingerprints left behind by a dead one still get written.
+        """
+        with self._submit_lock:
+            self._ensure_worker()
+        with self._queue.all_tasks_done:
+            drained = self._queue.all_tasks_done.wait_for(lambda: self._queue.unfinished_tasks == 0, timeout)
+        if not drained:
+            logger.error("Ingestion queue not drained after %s s; %d fingerprints unwritten", timeout, self.depth())
+        return drained
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="fingerprint-ingestion", daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch: List[FingerprintCreate]):
+        db = self.session_factory()
+        try:
+            try:
+                self.ingested += import_fingerprints(db, batch)
+                return
+            except Exception:
+                db.rollback()
+                logger.exception("Ingestion batch of %d fingerprints failed, retrying one by one", len(batch))
+            for fingerprint in batch:
+                try:
+                    self.ingested += import_fingerprints(db, [fingerprint])
+                except Exception:
+                    db.rollback()
+                    self.failed += 1
+                    logger.exception("Dropped fingerprint at (%s, %s) on floor %s", fingerprint.x, fingerprint.y, fingerprint.floor_id)
+        finally:
+            db.close()
+
+
+ingestion_queue = IngestionQueue()
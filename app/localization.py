@@ -0,0 +1,1020 @@
+import io
+import os
+import struct
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from scipy import sparse
+from scipy.spatial import cKDTree
+from typing import List, Optional
+
+# RSSI value used for access points that were not heard (dBm)
+MISSING_RSSI = -100.0
+
+# Per-AP RMS error (dB) at which confidence drops to 0.5
+CONFIDENCE_SCALE_DB = 8.0
+
+# Candidate pruning: only score fingerprints that heard one of the query's strongest APs
+# at a similar level. Below PRUNE_MIN_FINGERPRINTS a full scan is cheaper than pruning.
+PRUNE_MIN_FINGERPRINTS = int(os.getenv("PRUNE_MIN_FINGERPRINTS", 5000))
+PRUNE_STRONGEST_APS = 3
+PRUNE_RSSI_MARGIN_DB = 20.0
+
+# KD-tree engine: PCA dimensions kept, and tree neighbours fetched per requested neighbour
+# before exact re-ranking in the full BSSID space
+KD_TREE_DIMENSIONS = 8
+KD_TREE_CANDIDATES_PER_K = 4
+
+# Gaussian engine: fingerprints closer than this are one reference location; per-AP std is
+# floored so single-sample locations are not overconfident; never-heard APs are modelled
+# as a weak signal with Laplace-smoothed detection probability
+GAUSSIAN_LOCATION_RESOLUTION_M = 0.01
+GAUSSIAN_MIN_STD_DB = 3.0
+GAUSSIAN_UNHEARD_MEAN_DB = -95.0
+
+# Interpolated grid: inverse-distance weighting over the nearest surveyed points; a grid
+# artifact may not exceed GRID_MAX_CELLS cells, nor GRID_MAX_VALUES cell x AP signals (the
+# float32 signal grid a GridEngine keeps in the radio map cache)
+GRID_IDW_NEIGHBORS = 8
+GRID_IDW_POWER = 2.0
+GRID_MAX_CELLS = 1_000_000
+GRID_MAX_VALUES = int(os.getenv("GRID_MAX_VALUES", 25_000_000))
+
+# Device calibration: fingerprints within this distance count as co-located, a device
+# needs this many shared (location, AP) observations, and scales are kept in a sane band
+CALIBRATION_LOCATION_RESOLUTION_M = 0.5
+CALIBRATION_MIN_SAMPLES = 20
+CALIBRATION_SCALE_RANGE = (0.5, 1.5)
+
+# Compact scan storage: (access point id, rounded dBm) pairs packed little-endian, plus for
+# aggregated reference points a parallel array of (readings, RSSI std) per pair
+PACKED_SCAN_DTYPE = np.dtype([("ap_id", "<i4"), ("rssi", "i1")])
+PACKED_MOMENTS_DTYPE = np.dtype([("count", "<u4"), ("rssi_std", "<f4")])
+
+# Binary radio map export: little-endian header followed by int64 fingerprint ids, float32
+# (x, y) coordinates, an int8 RSSI matrix (EXPORT_MISSING_RSSI where not heard) and the
+# NUL-terminated BSSID table; every array section starts on an 8-byte boundary
+EXPORT_MAGIC = b"IRMB"
+EXPORT_VERSION = 1
+EXPORT_MISSING_RSSI = -128
+EXPORT_HEADER = struct.Struct("<4sHhqIII4x")  # magic, version, missing rssi, floor id, N, M, BSSID table bytes
+
+# Compaction: fingerprints by the same device model within this distance collapse into one
+# aggregated reference point
+COMPACTION_TOLERANCE_M = 0.5
+
+# Spread (dB) of the per-floor mean RSSI model used for floor detection
+FLOOR_DETECTION_SIGMA_DB = 10.0
+
+
+def pack_scans(wifi_scans, ap_ids) -> bytes:
+    """Pack [{bssid, rssi}] scans into (ap_id, int8 rssi) pairs using a BSSID -> access point id map"""
+    packed = np.empty(len(wifi_scans), dtype=PACKED_SCAN_DTYPE)
+    for i, scan in enumerate(wifi_scans):
+        packed[i] = (ap_ids[scan["bssid"]], min(max(round(scan["rssi"]), -128), 127))
+    return packed.tobytes()
+
+
+def pack_scan_moments(wifi_scans) -> Optional[bytes]:
+    """Pack the count and rssi_std of aggregated scans in pack_scans order; None for plain fingerprints"""
+    if not any(scan.get("count") is not None for scan in wifi_scans):
+        return None
+    moments = np.empty(len(wifi_scans), dtype=PACKED_MOMENTS_DTYPE)
+    for i, scan in enumerate(wifi_scans):
+        moments[i] = (scan.get("count") or 1, scan.get("rssi_std") or 0.0)
+    return moments.tobytes()
+
+
+def unpack_scans(payload: bytes, ap_bssids, moments: Optional[bytes] = None):
+    """[{bssid, rssi}] scans (with rssi_std and count when moments are given) from a packed payload"""
+    cells = np.frombuffer(payload, dtype=PACKED_SCAN_DTYPE)
+    scans = [{"bssid": ap_bssids[ap_id], "rssi": float(rssi)} for ap_id, rssi in zip(cells["ap_id"].tolist(), cells["rssi"].tolist())]
+    if moments is not None:
+        extra = np.frombuffer(moments, dtype=PACKED_MOMENTS_DTYPE)
+        for scan, count, rssi_std in zip(scans, extra["count"].tolist(), extra["rssi_std"].tolist()):
+            scan["count"] = count
+            scan["rssi_std"] = round(rssi_std, 3)
+    return scans
+
+
+def packed_access_point_ids(payloads) -> List[int]:
+    """Sorted distinct access point ids referenced by packed scan payloads"""
+    cells = np.frombuffer(b"".join(payloads), dtype=PACKED_SCAN_DTYPE)
+    return [int(ap_id) for ap_id in np.unique(cells["ap_id"])]
+
+
+class RadioMapMatrix:
+    """Dense fingerprints x BSSIDs RSSI matrix compiled from a floor's fingerprints"""
+
+    def __init__(self, floor_id: int, fingerprint_ids, coords, bssids: List[str], rssi):
+        self.floor_id = floor_id
+        self.fingerprint_ids = fingerprint_ids  # (N,) int64
+        self.coords = coords  # (N, 2) float64, meters
+        self.bssids = bssids  # column order of the RSSI matrix
+        self.bssid_index = {bssid: i for i, bssid in enumerate(bssids)}
+        self.rssi = rssi  # (N, M) float32, MISSING_RSSI where not heard
+        # Signals shifted so that "not heard" is 0, with their squared norms, for batch distances
+        self.shifted = rssi - np.float32(MISSING_RSSI)
+        self.shifted_sq = np.einsum("ij,ij->i", self.shifted, self.shifted, dtype=np.float64)
+
+        # Inverted index: for BSSID column c, postings_rows[postings_indptr[c]:postings_indptr[c + 1]]
+        # are the fingerprint rows that heard it and postings_rssi the level they heard it at
+        heard_cols, heard_rows = np.nonzero(rssi.T > MISSING_RSSI)
+        self.postings_rows = heard_rows.astype(np.int64)
+        self.postings_rssi = rssi[heard_rows, heard_cols]
+        self.postings_indptr = np.zeros(len(bssids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(heard_cols, minlength=len(bssids)), out=self.postings_indptr[1:])
+
+        # Alternative matching engines, built lazily and dropped with the compiled map
+        self._engines = {}
+
+    @classmethod
+    def from_rows(cls, floor_id: int, rows, calibration=None):
+        """Compile (id, x, y, wifi_scans) rows into a dense RSSI matrix
+
+        calibration is an optional (scales, offsets) pair of per-row arrays (see apply_calibration).
+        """
+        bssid_index = {}
+        ids, coords = [], []
+        cells_row, cells_col, cells_rssi = [], [], []
+
+        for row_number, (fingerprint_id, x, y, wifi_scans) in enumerate(rows):
+            ids.append(fingerprint_id)
+            coords.append((x, y))
+            for scan in wifi_scans or []:
+                col = bssid_index.setdefault(scan["bssid"], len(bssid_index))
+                cells_row.append(row_number)
+                cells_col.append(col)
+                cells_rssi.append(scan["rssi"])
+
+        rssi = np.full((len(ids), len(bssid_index)), MISSING_RSSI, dtype=np.float32)
+        if cells_row:
+            rssi[cells_row, cells_col] = cells_rssi
+        if calibration is not None:
+            rssi = apply_calibration(rssi, *calibration)
+
+        return cls(
+            floor_id=floor_id,
+            fingerprint_ids=np.asarray(ids, dtype=np.int64),
+            coords=np.asarray(coords, dtype=np.float64).reshape(-1, 2),
+            bssids=list(bssid_index),
+            rssi=rssi,
+        )
+
+    @classmethod
+    def from_packed_rows(cls, floor_id: int, rows, ap_bssids, calibration=None):
+        """Compile (id, x, y, payload) rows of packed scans (see pack_scans) into a dense RSSI matrix
+
+        ap_bssids maps access point ids to BSSIDs; columns follow ascending access point id.
+        """
+        ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        coords = np.array([(row[1], row[2]) for row in rows], dtype=np.float64).reshape(-1, 2)
+        payloads = [row[3] for row in rows]
+        cells = np.frombuffer(b"".join(payloads), dtype=PACKED_SCAN_DTYPE)
+        cells_row = np.repeat(np.arange(len(rows)), [len(payload) // PACKED_SCAN_DTYPE.itemsize for payload in payloads])
+        ap_ids, cells_col = np.unique(cells["ap_id"], return_inverse=True)
+
+        rssi = np.full((len(rows), len(ap_ids)), MISSING_RSSI, dtype=np.float32)
+        rssi[cells_row, cells_col] = cells["rssi"]
+        if calibration is not None:
+            rssi = apply_calibration(rssi, *calibration)
+
+        return cls(
+            floor_id=floor_id,
+            fingerprint_ids=ids,
+            coords=coords,
+            bssids=[ap_bssids[int(ap_id)] for ap_id in ap_ids],
+            rssi=rssi,
+        )
+
+    @property
+    def is_empty(self) -> bool:
+        return len(self.fingerprint_ids) == 0
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory footprint including attached engines and the cached export, used for cache accounting"""
+        index_bytes = sum(len(bssid) + 100 for bssid in self.bssids)
+        arrays = (
+            self.rssi, self.shifted, self.shifted_sq, self.coords, self.fingerprint_ids,
+            self.postings_rows, self.postings_rssi, self.postings_indptr,
+        )
+        engine_bytes = sum(engine.nbytes for engine in self._engines.values())
+        export_bytes = len(self._export[0]) if "_export" in self.__dict__ else 0
+        return sum(array.nbytes for array in arrays) + index_bytes + engine_bytes + export_bytes
+
+    def scan_matrix(self, scans_list, calibration=None):
+        """Project Q scans onto the BSSID columns; returns ((Q, M) matrix, (Q,) known AP counts)
+
+        calibration is an optional (scales, offsets) pair of (Q,) arrays mapping each scan's
+        device RSSI onto the radio map's reference scale.
+        """
+        matrix = np.full((len(scans_list), len(self.bssids)), MISSING_RSSI, dtype=np.float32)
+        known = np.zeros(len(scans_list), dtype=np.int64)
+        for row, wifi_scans in enumerate(scans_list):
+            for scan in wifi_scans:
+                col = self.bssid_index.get(scan.bssid)
+                if col is not None:
+                    matrix[row, col] = scan.rssi
+                    known[row] += 1
+        if calibration is not None:
+            matrix = apply_calibration(matrix, *calibration)
+        return matrix, known
+
+    def project(self, scans_list, calibration=None):
+        """scan_matrix plus each scan's coverage (share of its APs known to the radio map)"""
+        queries, known = self.scan_matrix(scans_list, calibration)
+        sizes = np.asarray([len(wifi_scans) for wifi_scans in scans_list], dtype=np.float64)
+        return queries, known, known / np.maximum(sizes, 1)
+
+    @property
+    def digest(self) -> str:
+        """Content hash of the compiled map, used to detect stale derived artifacts"""
+        if "_digest" not in self.__dict__:
+            sha = hashlib.sha256()
+            for array in (self.fingerprint_ids, self.coords, self.rssi):
+                sha.update(np.ascontiguousarray(array).tobytes())
+            sha.update("\n".join(self.bssids).encode())
+            self._digest = sha.hexdigest()
+        return self._digest
+
+    @property
+    def export(self):
+        """Column-oriented binary export of the compiled map and its strong ETag (see EXPORT_HEADER)"""
+        if "_export" not in self.__dict__:
+            rssi = np.rint(self.rssi)
+            rssi[self.rssi <= MISSING_RSSI] = EXPORT_MISSING_RSSI
+            bssid_table = b"".join(bssid.encode() + b"\0" for bssid in self.bssids)
+            sections = [
+                EXPORT_HEADER.pack(
+                    EXPORT_MAGIC, EXPORT_VERSION, EXPORT_MISSING_RSSI, self.floor_id,
+                    len(self.fingerprint_ids), len(self.bssids), len(bssid_table)
+                ),
+                self.fingerprint_ids.astype("<i8").tobytes(),
+                self.coords.astype("<f4").tobytes(),
+                np.clip(rssi, -128, 127).astype(np.int8).tobytes(),
+            ]
+            # Pad the RSSI matrix so the BSSID table, and any appended section, stays aligned
+            sections.append(b"\0" * (-len(sections[-1]) % 8))
+            sections.append(bssid_table)
+            payload = b"".join(sections)
+            self._export = (payload, f'"{hashlib.sha256(payload).hexdigest()}"')
+            radiomap_cache.resize(self.floor_id, self)
+        return self._export
+
+    def engine(self, name: str):
+        """Matching engine built on this radio map (see LOCALIZATION_ENGINES)"""
+        engine = self._engines.get(name)
+        if engine is None:
+            if name not in ENGINE_BUILDERS:
+                raise LookupError(f"The '{name}' engine has not been compiled for floor {self.floor_id}")
+            engine = self._engines[name] = ENGINE_BUILDERS[name](self)
+            radiomap_cache.resize(self.floor_id, self)
+        return engine
+
+    def attach_engine(self, name: str, engine):
+        """Attach an engine loaded from a persisted artifact"""
+        self._engines[name] = engine
+        radiomap_cache.resize(self.floor_id, self)
+
+    def has_engine(self, name: str) -> bool:
+        return name in self._engines
+
+    def candidate_rows(self, query, min_candidates: int):
+        """Rows sharing one of the query's strongest APs at a similar RSSI, via the inverted index"""
+        heard = np.flatnonzero(query > MISSING_RSSI)
+        if len(heard) == 0:
+            # Nothing to look up; the caller scores every row and reports no fix
+            return np.arange(len(self.fingerprint_ids))
+        strongest = heard[np.argsort(query[heard])[::-1][:PRUNE_STRONGEST_APS]]
+
+        matched, shared = [], []
+        for col in strongest:
+            postings = slice(self.postings_indptr[col], self.postings_indptr[col + 1])
+            rows = self.postings_rows[postings]
+            close = np.abs(self.postings_rssi[postings] - query[col]) <= PRUNE_RSSI_MARGIN_DB
+            matched.append(rows[close])
+            shared.append(rows)
+
+        # Widen progressively so there are always enough neighbours to average
+        for groups in (matched, shared):
+            rows = np.unique(np.concatenate(groups))
+            if len(rows) >= min_candidates:
+                return rows
+        return np.arange(len(self.fingerprint_ids))
+
+
+def apply_calibration(matrix, scales, offsets):
+    """Map each row's heard RSSI values through scale * rssi + offset, leaving misses untouched"""
+    heard = matrix > MISSING_RSSI
+    calibrated = matrix * np.asarray(scales, dtype=np.float32)[:, None] + np.asarray(offsets, dtype=np.float32)[:, None]
+    # Keep calibrated readings inside the heard range so they never turn into misses
+    np.clip(calibrated, MISSING_RSSI + 1.0, 0.0, out=calibrated)
+    return np.where(heard, calibrated, np.float32(MISSING_RSSI)).astype(np.float32)
+
+
+class DeviceCalibrationTable:
+    """Per device_model linear RSSI corrections onto the fleet-wide reference scale"""
+
+    def __init__(self, entries):
+        self.entries = entries  # device_model -> (scale, offset)
+
+    def __bool__(self):
+        return bool(self.entries)
+
+    def coefficients(self, device_models):
+        """(scales, offsets) arrays for a sequence of device models; unknown models are identity"""
+        pairs = [self.entries.get(model, (1.0, 0.0)) for model in device_models]
+        scales = np.asarray([pair[0] for pair in pairs], dtype=np.float32)
+        offsets = np.asarray([pair[1] for pair in pairs], dtype=np.float32)
+        return scales, offsets
+
+
+def scan_samples(wifi_scans) -> int:
+    """Readings a stored scan list stands for: 1 for a raw fingerprint, max(count) once aggregated"""
+    return max((scan.get("count", 1) for scan in wifi_scans or []), default=1)
+
+
+def merge_moments(a, b):
+    """Combine two (count, mean, m2, min_x, max_x, min_y, max_y) summaries (Chan et al. parallel update)"""
+    count = a[0] + b[0]
+    delta = b[1] - a[1]
+    mean = a[1] + delta * b[0] / count
+    m2 = a[2] + b[2] + delta ** 2 * a[0] * b[0] / count
+    return (count, mean, m2, min(a[3], b[3]), max(a[4], b[4]), min(a[5], b[5]), max(a[6], b[6]))
+
+
+def unmerge_moments(total, part):
+    """Remove a summary previously merged into total; None when nothing is left
+
+    The coverage extent cannot shrink without the remaining readings, so it is kept as is.
+    """
+    count = total[0] - part[0]
+    if count <= 0:
+        return None
+    mean = (total[0] * total[1] - part[0] * part[1]) / count
+    delta = part[1] - mean
+    m2 = max(total[2] - part[2] - delta ** 2 * count * part[0] / total[0], 0.0)
+    return (count, mean, m2) + tuple(total[3:])
+
+
+def scan_moments(rows):
+    """Per-BSSID moment summaries (see merge_moments) of (x, y, wifi_scans) rows and their total readings"""
+    moments = {}
+    samples = 0
+    for x, y, wifi_scans in rows:
+        samples += scan_samples(wifi_scans)
+        for scan in wifi_scans or []:
+            count = scan.get("count", 1)
+            summary = (count, scan["rssi"], (scan.get("rssi_std") or 0.0) ** 2 * count, x, x, y, y)
+            current = moments.get(scan["bssid"])
+            moments[scan["bssid"]] = summary if current is None else merge_moments(current, summary)
+    return moments, samples
+
+
+def aggregate_fingerprints(rows, tolerance: float = COMPACTION_TOLERANCE_M):
+    """Collapse (id, x, y, device_model, wifi_scans) rows into aggregated reference points
+
+    Rows by the same device model in the same tolerance-sized cell are merged; each AP keeps
+    the mean, population std and count of the readings that heard it. Already aggregated
+    scans merge with their counts as weights, and a row counts as max(count) samples.
+    Returns one dict (ids, x, y, device_model, wifi_scans) per cell with two or more rows.
+    """
+    groups = {}
+    for row in rows:
+        fingerprint_id, x, y, device_model, wifi_scans = row
+        key = (round(x / tolerance), round(y / tolerance), device_model)
+        groups.setdefault(key, []).append(row)
+
+    aggregated = []
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+        sample_total, x_total, y_total = 0, 0.0, 0.0
+        readings = {}  # bssid -> [count, sum, sum of squares]
+        for fingerprint_id, x, y, device_model, wifi_scans in members:
+            samples = scan_samples(wifi_scans)
+            sample_total += samples
+            x_total += samples * x
+            y_total += samples * y
+            for scan in wifi_scans or []:
+                count = scan.get("count", 1)
+                std = scan.get("rssi_std") or 0.0
+                totals = readings.setdefault(scan["bssid"], [0, 0.0, 0.0])
+                totals[0] += count
+                totals[1] += count * scan["rssi"]
+                totals[2] += count * (std ** 2 + scan["rssi"] ** 2)
+
+        wifi_scans = []
+        for bssid, (count, level_sum, square_sum) in sorted(readings.items()):
+            mean = level_sum / count
+            wifi_scans.append({
+                "bssid": bssid,
+                "rssi": round(mean, 2),
+                "rssi_std": round(float(np.sqrt(max(square_sum / count - mean ** 2, 0.0))), 2),
+                "count": count,
+            })
+        aggregated.append({
+            "ids": [member[0] for member in members],
+            "x": x_total / sample_total,
+            "y": y_total / sample_total,
+            "device_model": members[0][3],
+            "wifi_scans": wifi_scans,
+        })
+    return aggregated
+
+
+def fit_device_calibration(rows, resolution: float = CALIBRATION_LOCATION_RESOLUTION_M):
+    """Least-squares scale/offset per device model from (floor_id, x, y, device_model, wifi_scans) rows
+
+    Readings of the same AP at the same surveyed location by two or more device models are
+    compared against the mean over those models; each model is fitted onto that reference.
+    """
+    cell_index, device_index = {}, {}
+    cells, devices, levels = [], [], []
+    for floor_id, x, y, device_model, wifi_scans in rows:
+        if not device_model:
+            continue
+        device = device_index.setdefault(device_model, len(device_index))
+        location = (floor_id, round(x / resolution), round(y / resolution))
+        for scan in wifi_scans or []:
+            cells.append(cell_index.setdefault(location + (scan["bssid"],), len(cell_index)))
+            devices.append(device)
+            levels.append(scan["rssi"])
+    if not levels:
+        return {}
+
+    device_count, cell_count = len(device_index), len(cell_index)
+    cells, devices, levels = np.asarray(cells), np.asarray(devices), np.asarray(levels, dtype=np.float64)
+
+    # Mean reading per (cell, device), then the reference level per cell across devices
+    pairs, pair_of_reading = np.unique(cells * device_count + devices, return_inverse=True)
+    pair_mean = np.bincount(pair_of_reading, levels) / np.bincount(pair_of_reading)
+    pair_cell, pair_device = pairs // device_count, pairs % device_count
+    devices_per_cell = np.bincount(pair_cell, minlength=cell_count)
+    reference = np.bincount(pair_cell, pair_mean, minlength=cell_count) / np.maximum(devices_per_cell, 1)
+
+    shared = devices_per_cell[pair_cell] >= 2
+    observed, target, device = pair_mean[shared], reference[pair_cell[shared]], pair_device[shared]
+
+    # Closed-form simple linear regression of target on observed, for all devices at once
+    n = np.bincount(device, minlength=device_count).astype(np.float64)
+    sx = np.bincount(device, observed, minlength=device_count)
+    sy = np.bincount(device, target, minlength=device_count)
+    sxx = np.bincount(device, observed ** 2, minlength=device_count)
+    sxy = np.bincount(device, observed * target, minlength=device_count)
+    denominator = n * sxx - sx ** 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scale = np.where(denominator > 1e-9, (n * sxy - sx * sy) / denominator, 1.0)
+        scale = np.clip(scale, *CALIBRATION_SCALE_RANGE)
+        offset = (sy - scale * sx) / n
+
+    return {
+        model: {"scale": float(scale[i]), "offset": float(offset[i]), "sample_count": int(n[i])}
+        for model, i in device_index.items()
+        if n[i] >= CALIBRATION_MIN_SAMPLES
+    }
+
+
+# Upper bound on query x fingerprint distance cells computed at once
+BATCH_DISTANCE_CELLS = 4_000_000
+
+
+def wknn_locate_batch(radio_map: RadioMapMatrix, scans_list, k: int = 3, prune: Optional[bool] = None):
+    """Weighted k-NN estimates for many scans with one matrix-by-matrix distance computation
+
+    On large radio maps (or with prune=True) each scan is instead scored only against the
+    candidate rows found through the inverted BSSID index.
+    Scans that share no access point with the radio map get x/y of None and zero confidence.
+    """
+    return wknn_locate_queries(radio_map, *radio_map.project(scans_list), k=k, prune=prune)
+
+
+def wknn_locate_queries(radio_map: RadioMapMatrix, queries, known, coverage, k: int = 3, prune: Optional[bool] = None):
+    """wknn_locate_batch on scans already projected with RadioMapMatrix.project"""
+    # Squared euclidean distances via |q|^2 + |r|^2 - 2 q.r on signals shifted so that
+    # "not heard" is 0; this keeps the float32 products small and mostly sparse
+    shifted = queries - np.float32(MISSING_RSSI)
+    shifted_sq = np.einsum("ij,ij->i", shifted, shifted, dtype=np.float64)
+
+    if prune is None:
+        prune = len(radio_map.fingerprint_ids) >= PRUNE_MIN_FINGERPRINTS
+    if prune:
+        estimates = []
+        for i in range(len(queries)):
+            if known[i] == 0:
+                estimates.append({"x": None, "y": None, "confidence": 0.0, "neighbors": []})
+                continue
+            rows = radio_map.candidate_rows(queries[i], min_candidates=k)
+            cross = radio_map.shifted[rows] @ shifted[i]
+            distances = np.sqrt(np.maximum(shifted_sq[i] + radio_map.shifted_sq[rows] - 2.0 * cross, 0.0))
+            estimates.append(_weighted_estimate(radio_map, queries[i], distances, k, coverage=coverage[i], rows=rows))
+        return estimates
+
+    chunk = max(1, BATCH_DISTANCE_CELLS // max(len(radio_map.fingerprint_ids), 1))
+    estimates = []
+    for start in range(0, len(queries), chunk):
+        stop = start + chunk
+        cross = shifted[start:stop] @ radio_map.shifted.T
+        distances = shifted_sq[start:stop, None] + radio_map.shifted_sq[None, :] - 2.0 * cross
+        distances = np.sqrt(np.maximum(distances, 0.0))
+        for offset, row_distances in enumerate(distances):
+            i = start + offset
+            if known[i] == 0:
+                estimates.append({"x": None, "y": None, "confidence": 0.0, "neighbors": []})
+                continue
+            estimates.append(_weighted_estimate(radio_map, queries[i], row_distances, k, coverage=coverage[i]))
+    return estimates
+
+
+def wknn_locate(radio_map: RadioMapMatrix, wifi_scans, k: int = 3, prune: Optional[bool] = None):
+    """Weighted k-nearest-neighbour position estimate for a single scan"""
+    estimate = wknn_locate_batch(radio_map, [wifi_scans], k=k, prune=prune)[0]
+    if estimate["x"] is None:
+        raise ValueError("Scan shares no access points with the floor radio map")
+    return estimate
+
+
+class KDTreeEngine:
+    """PCA-reduced cKDTree over a floor's RSSI matrix for logarithmic nearest-neighbour queries"""
+
+    def __init__(self, radio_map: RadioMapMatrix, dimensions: int = KD_TREE_DIMENSIONS):
+        self.radio_map = radio_map
+        self.tree = None
+        if not radio_map.bssids or radio_map.is_empty:
+            # No access point columns to project: every scan is unknown to this map
+            return
+        self.mean = radio_map.shifted.mean(axis=0)
+        centered = radio_map.shifted - self.mean
+        # Principal axes from the BSSID covariance (M x M), cheaper than an SVD of the N x M matrix
+        eigenvalues, eigenvectors = np.linalg.eigh((centered.T @ centered).astype(np.float64))
+        order = np.argsort(eigenvalues)[::-1][:max(1, min(dimensions, len(eigenvalues)))]
+        self.components = eigenvectors[:, order].T.astype(np.float32)
+        self.tree = cKDTree(centered @ self.components.T)
+
+    @property
+    def nbytes(self) -> int:
+        if self.tree is None:
+            return 0
+        # The tree keeps its (N, D) data plus index arrays of about the same size
+        return self.mean.nbytes + self.components.nbytes + 2 * self.tree.data.nbytes
+
+    def locate_queries(self, queries, known, coverage, k: int = 3):
+        radio_map = self.radio_map
+        if self.tree is None:
+            return [{"x": None, "y": None, "confidence": 0.0, "neighbors": []} for _ in range(len(queries))]
+        shifted = queries - np.float32(MISSING_RSSI)
+
+        candidates = min(len(radio_map.fingerprint_ids), k * KD_TREE_CANDIDATES_PER_K)
+        _, neighbours = self.tree.query((shifted - self.mean) @ self.components.T, k=candidates)
+        neighbours = np.asarray(neighbours).reshape(len(queries), candidates)
+
+        estimates = []
+        for i in range(len(queries)):
+            if known[i] == 0:
+                estimates.append({"x": None, "y": None, "confidence": 0.0, "neighbors": []})
+                continue
+            # Re-rank the tree's candidates by their exact distance in the full BSSID space
+            rows = neighbours[i]
+            distances = np.sqrt(((radio_map.shifted[rows] - shifted[i]) ** 2).sum(axis=1))
+            estimates.append(_weighted_estimate(radio_map, queries[i], distances, k, coverage=coverage[i], rows=rows))
+        return estimates
+
+
+class GaussianEngine:
+    """Probabilistic radio map: per reference location and AP, RSSI mean/variance and detection probability"""
+
+    def __init__(self, radio_map: RadioMapMatrix):
+        self.radio_map = radio_map
+
+        # Repeated surveys at the same (x, y) collapse into one reference location
+        cells = np.round(radio_map.coords / GAUSSIAN_LOCATION_RESOLUTION_M).astype(np.int64)
+        _, first_rows, location_of_row = np.unique(cells, axis=0, return_index=True, return_inverse=True)
+        location_of_row = location_of_row.reshape(-1)
+        count = len(first_rows)
+        self.coords = radio_map.coords[first_rows]
+        self.fingerprint_ids = radio_map.fingerprint_ids[first_rows]  # representative row per location
+
+        # Sum rows per location with a sparse (locations x fingerprints) indicator matrix
+        indicator = sparse.csr_matrix(
+            (np.ones(len(location_of_row)), (location_of_row, np.arange(len(location_of_row)))),
+            shape=(count, len(location_of_row)),
+        )
+        heard = (radio_map.rssi > MISSING_RSSI).astype(np.float64)
+        levels = np.where(heard > 0, radio_map.rssi, 0.0).astype(np.float64)
+        samples = np.asarray(indicator.sum(axis=1))  # (L, 1)
+        detections = indicator @ heard
+        sums = indicator @ levels
+        squares = indicator @ (levels ** 2)
+
+        seen = detections > 0
+        mean = np.where(seen, sums / np.maximum(detections, 1), GAUSSIAN_UNHEARD_MEAN_DB)
+        variance = np.where(seen, squares / np.maximum(detections, 1) - mean ** 2, 0.0)
+        variance = np.maximum(variance, GAUSSIAN_MIN_STD_DB ** 2)
+        detection = (detections + 0.5) / (samples + 1.0)
+
+        self.mean = mean.astype(np.float32)  # (L, M)
+        self.variance = variance.astype(np.float32)  # (L, M)
+        self.log_detected = np.log(detection).astype(np.float32)
+        self.log_missed = np.log1p(-detection).astype(np.float32)
+        self.log_missed_total = self.log_missed.sum(axis=1, dtype=np.float64)  # (L,)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (
+            self.coords, self.fingerprint_ids, self.mean, self.variance,
+            self.log_detected, self.log_missed, self.log_missed_total,
+        )
+        return sum(array.nbytes for array in arrays)
+
+    def log_likelihood(self, query):
+        """Log-likelihood of one projected scan at every reference location"""
+        cols = np.flatnonzero(query > MISSING_RSSI)
+        levels = query[cols]
+        variance = self.variance[:, cols]
+        gaussian = -0.5 * ((levels - self.mean[:, cols]) ** 2 / variance + np.log(2 * np.pi * variance))
+        # APs absent from the scan contribute log(1 - p); swap those terms out for the heard ones
+        heard = (self.log_detected[:, cols] + gaussian - self.log_missed[:, cols]).sum(axis=1)
+        return self.log_missed_total + heard
+
+    def locate_queries(self, queries, known, coverage, k: int = 3):
+        estimates = []
+        for i in range(len(queries)):
+            if known[i] == 0:
+                estimates.append({"x": None, "y": None, "confidence": 0.0, "neighbors": []})
+                continue
+            log_likelihood = self.log_likelihood(queries[i])
+            top = min(k, len(log_likelihood))
+            best = np.argpartition(log_likelihood, -top)[-top:]
+            best = best[np.argsort(log_likelihood[best])[::-1]]
+
+            # Posterior over locations (flat prior); the estimate averages the k most likely
+            posterior = np.exp(log_likelihood - log_likelihood.max())
+            posterior /= posterior.sum()
+            weights = posterior[best] / posterior[best].sum()
+            x, y = weights @ self.coords[best]
+
+            # The posterior always sums to one, so score the fit like WKNN does: per-AP RMS
+            # residual between the scan and the mean levels of the chosen locations
+            expected = np.where(self.mean[best] != GAUSSIAN_UNHEARD_MEAN_DB, self.mean[best], MISSING_RSSI)
+            heard = (expected > MISSING_RSSI) | (queries[i] > MISSING_RSSI)
+            residual = np.linalg.norm(queries[i] - expected, axis=1)
+            rms = residual / np.sqrt(np.maximum(heard.sum(axis=1), 1))
+            confidence = coverage[i] / (1.0 + float(np.average(rms, weights=weights)) / CONFIDENCE_SCALE_DB)
+            estimates.append({
+                "x": float(x),
+                "y": float(y),
+                "confidence": round(float(confidence), 4),
+                "neighbors": [int(fingerprint_id) for fingerprint_id in self.fingerprint_ids[best]],
+            })
+        return estimates
+
+
+class GridEngine:
+    """Matches scans against a radio map interpolated onto a regular grid (see build_radiomap_grid)"""
+
+    def __init__(self, radio_map: RadioMapMatrix, grid):
+        self.radio_map = radio_map
+        self.resolution = float(grid["resolution"])
+        rows, cols = (int(n) for n in grid["shape"])
+        self.shape = (rows, cols)
+        # Cell centres in meters, row-major to match the signal rows
+        ys, xs = np.meshgrid((np.arange(rows) + 0.5) * self.resolution, (np.arange(cols) + 0.5) * self.resolution, indexing="ij")
+        self.coords = np.column_stack([xs.ravel(), ys.ravel()])
+        # The artifact was built from this exact map (same digest), so columns line up
+        self.signals = grid["signals"].astype(np.float32)
+        self.signals_sq = np.einsum("ij,ij->i", self.signals, self.signals, dtype=np.float64)
+
+    @property
+    def nbytes(self) -> int:
+        return self.coords.nbytes + self.signals.nbytes + self.signals_sq.nbytes
+
+    def locate_queries(self, queries, known, coverage, k: int = 3):
+        shifted = queries - np.float32(MISSING_RSSI)
+        estimates = []
+        for i in range(len(queries)):
+            if known[i] == 0:
+                estimates.append({"x": None, "y": None, "confidence": 0.0, "neighbors": []})
+                continue
+            squared = float(shifted[i] @ shifted[i]) + self.signals_sq - 2.0 * (self.signals @ shifted[i])
+            distances = np.sqrt(np.maximum(squared, 0.0))
+            top = min(k, len(distances))
+            nearest = np.argpartition(distances, top - 1)[:top]
+            weights = 1.0 / (distances[nearest] + 1e-6)
+            x, y = weights @ self.coords[nearest] / weights.sum()
+
+            heard = (self.signals[nearest] > 0.5) | (shifted[i] > 0)
+            rms = distances[nearest] / np.sqrt(np.maximum(heard.sum(axis=1), 1))
+            confidence = coverage[i] / (1.0 + float(np.average(rms, weights=weights)) / CONFIDENCE_SCALE_DB)
+            estimates.append({"x": float(x), "y": float(y), "confidence": round(float(confidence), 4), "neighbors": []})
+        return estimates
+
+
+def build_radiomap_grid(radio_map: RadioMapMatrix, width: float, height: float, resolution: float = 1.0):
+    """Interpolate every AP's signal onto a width x height grid with inverse-distance weighting"""
+    rows, cols = max(1, int(np.ceil(height / resolution))), max(1, int(np.ceil(width / resolution)))
+    if rows * cols > GRID_MAX_CELLS:
+        raise ValueError(f"Grid of {rows}x{cols} cells exceeds the limit of {GRID_MAX_CELLS}; use a coarser resolution")
+    if rows * cols * len(radio_map.bssids) > GRID_MAX_VALUES:
+        raise ValueError(
+            f"Grid of {rows}x{cols} cells over {len(radio_map.bssids)} access points exceeds the limit of "
+            f"{GRID_MAX_VALUES} signals; use a coarser resolution"
+        )
+
+    ys, xs = np.meshgrid((np.arange(rows) + 0.5) * resolution, (np.arange(cols) + 0.5) * resolution, indexing="ij")
+    centres = np.column_stack([xs.ravel(), ys.ravel()])
+
+    neighbors = min(GRID_IDW_NEIGHBORS, len(radio_map.fingerprint_ids))
+    distances, rows_idx = cKDTree(radio_map.coords).query(centres, k=neighbors)
+    distances = np.asarray(distances).reshape(len(centres), neighbors)
+    rows_idx = np.asarray(rows_idx).reshape(len(centres), neighbors)
+    weights = 1.0 / np.maximum(distances, 1e-3) ** GRID_IDW_POWER
+    weights /= weights.sum(axis=1, keepdims=True)
+
+    # Interpolate signals shifted so that "not heard" is 0, so coverage fades out naturally
+    signals = np.empty((len(centres), len(radio_map.bssids)), dtype=np.uint8)
+    chunk = max(1, BATCH_DISTANCE_CELLS // max(neighbors * len(radio_map.bssids), 1))
+    for start in range(0, len(centres), chunk):
+        stop = start + chunk
+        values = np.einsum("gk,gkm->gm", weights[start:stop], radio_map.shifted[rows_idx[start:stop]])
+        signals[start:stop] = np.clip(np.rint(values), 0, 255)
+
+    return {
+        "resolution": np.float64(resolution),
+        "shape": np.asarray([rows, cols], dtype=np.int64),
+        "bssids": np.asarray(radio_map.bssids, dtype=str),
+        "signals": signals,
+        "source_digest": np.asarray(radio_map.digest),
+    }
+
+
+def load_radiomap_export(payload: bytes):
+    """Parse a binary radio map export into zero-copy arrays over the payload"""
+    magic, version, missing, floor_id, n, m, table_bytes = EXPORT_HEADER.unpack_from(payload)
+    if magic != EXPORT_MAGIC or version != EXPORT_VERSION:
+        raise ValueError("Not a version 1 radio map export")
+    offset = EXPORT_HEADER.size
+    fingerprint_ids = np.frombuffer(payload, dtype="<i8", count=n, offset=offset)
+    offset += 8 * n
+    coords = np.frombuffer(payload, dtype="<f4", count=2 * n, offset=offset).reshape(n, 2)
+    offset += 8 * n
+    rssi = np.frombuffer(payload, dtype=np.int8, count=n * m, offset=offset).reshape(n, m)
+    offset += n * m + (-(n * m) % 8)
+    bssids = payload[offset:offset + table_bytes].decode().split("\0")[:-1] if m else []
+    return {
+        "floor_id": floor_id,
+        "missing_rssi": missing,
+        "fingerprint_ids": fingerprint_ids,
+        "coords": coords,
+        "rssi": rssi,
+        "bssids": bssids,
+    }
+
+
+def dump_grid(grid) -> bytes:
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **grid)
+    return buffer.getvalue()
+
+
+def load_grid(payload: bytes):
+    with np.load(io.BytesIO(payload), allow_pickle=False) as data:
+        return {name: data[name] for name in data.files}
+
+
+def load_grid_resolution(payload: bytes) -> float:
+    """Cell size of a stored grid, without decompressing its signals"""
+    with np.load(io.BytesIO(payload), allow_pickle=False) as data:
+        return float(data["resolution"])
+
+
+ENGINE_BUILDERS = {
+    "kdtree": KDTreeEngine,
+    "gaussian": GaussianEngine,
+}
+# 'grid' needs a compiled artifact and is attached by the loader instead of built on demand
+LOCALIZATION_ENGINES = ("wknn",) + tuple(ENGINE_BUILDERS) + ("grid",)
+DEFAULT_ENGINE = "wknn"
+
+
+def locate_batch(radio_map: RadioMapMatrix, scans_list, k: int = 3, engine: str = DEFAULT_ENGINE, calibration=None):
+    """Position estimates for many scans with the chosen matching engine"""
+    queries, known, coverage = radio_map.project(scans_list, calibration)
+    if engine == "wknn":
+        return wknn_locate_queries(radio_map, queries, known, coverage, k=k)
+    return radio_map.engine(engine).locate_queries(queries, known, coverage, k=k)
+
+
+def locate(radio_map: RadioMapMatrix, wifi_scans, k: int = 3, engine: str = DEFAULT_ENGINE, calibration=None):
+    """Position estimate for a single scan with the chosen matching engine"""
+    estimate = locate_batch(radio_map, [wifi_scans], k=k, engine=engine, calibration=calibration)[0]
+    if estimate["x"] is None:
+        raise ValueError("Scan shares no access points with the floor radio map")
+    return estimate
+
+
+def _weighted_estimate(radio_map: RadioMapMatrix, query, distances, k: int, coverage: float, rows=None):
+    """Combine the k closest rows; distances are over `rows` (all rows when None)"""
+    k = min(k, len(distances))
+    order = np.argpartition(distances, k - 1)[:k]
+    order = order[np.argsort(distances[order])]
+    nearest = order if rows is None else rows[order]
+    distances = distances[order]
+
+    weights = 1.0 / (distances + 1e-6)
+    x, y = weights @ radio_map.coords[nearest] / weights.sum()
+
+    # Normalise the neighbour distances by the APs that actually contributed to them
+    heard = (radio_map.rssi[nearest] > MISSING_RSSI) | (query > MISSING_RSSI)
+    rms = distances / np.sqrt(np.maximum(heard.sum(axis=1), 1))
+    confidence = coverage / (1.0 + float(np.average(rms, weights=weights)) / CONFIDENCE_SCALE_DB)
+
+    return {
+        "x": float(x),
+        "y": float(y),
+        "confidence": round(float(confidence), 4),
+        "neighbors": [int(i) for i in radio_map.fingerprint_ids[nearest]],
+    }
+
+
+class FloorDetectionIndex:
+    """Compact per-floor AP signatures (mean RSSI and detection rate) for coarse floor detection"""
+
+    def __init__(self, floor_ids, building_ids, bssids: List[str], mean_rssi, detection):
+        self.floor_ids = floor_ids  # (F,) int64
+        self.building_ids = building_ids  # (F,) int64
+        self.bssid_index = {bssid: i for i, bssid in enumerate(bssids)}
+        self.mean_rssi = mean_rssi  # (F, V) float32, MISSING_RSSI where never heard on the floor
+        self.detection = detection  # (F, V) float32, share of the floor's fingerprints hearing the AP
+
+    @classmethod
+    def from_statistics(cls, floors, access_points):
+        """Build the index from (floor_id, building_id, sample_count) floors and
+        (floor_id, bssid, sample_count, rssi_mean) access point statistics"""
+        floor_row = {floor_id: row for row, (floor_id, _, _) in enumerate(floors)}
+        floor_samples = np.asarray([floor[2] for floor in floors], dtype=np.float64)
+        bssid_index = {}
+        rows, cols, counts, means = [], [], [], []
+        for floor_id, bssid, sample_count, rssi_mean in access_points:
+            row = floor_row.get(floor_id)
+            if row is None:
+                continue
+            rows.append(row)
+            cols.append(bssid_index.setdefault(bssid, len(bssid_index)))
+            counts.append(sample_count)
+            means.append(rssi_mean)
+
+        mean_rssi = np.full((len(floors), len(bssid_index)), MISSING_RSSI, dtype=np.float32)
+        detection = np.zeros((len(floors), len(bssid_index)), dtype=np.float32)
+        if rows:
+            mean_rssi[rows, cols] = means
+            detection[rows, cols] = np.minimum(np.asarray(counts) / np.maximum(floor_samples[rows], 1), 1.0)
+
+        return cls(
+            floor_ids=np.asarray([floor[0] for floor in floors], dtype=np.int64),
+            building_ids=np.asarray([floor[1] for floor in floors], dtype=np.int64),
+            bssids=list(bssid_index),
+            mean_rssi=mean_rssi,
+            detection=detection,
+        )
+
+    def detect(self, wifi_scans, building_id: Optional[int] = None, calibration=(1.0, 0.0)):
+        """Rank floors by how well their signatures explain the scan, best first"""
+        scale, offset = calibration
+        cols, levels = [], []
+        for scan in wifi_scans:
+            col = self.bssid_index.get(scan.bssid)
+            if col is not None:
+                cols.append(col)
+                levels.append(scan.rssi * scale + offset)
+        if not cols:
+            raise ValueError("Scan shares no access points with any surveyed floor")
+
+        # Each scanned AP contributes its detection rate on the floor, discounted by how far
+        # the observed level is from the floor's mean; only the scan's columns are touched
+        diff = (self.mean_rssi[:, cols] - np.asarray(levels, dtype=np.float32)) / FLOOR_DETECTION_SIGMA_DB
+        scores = (self.detection[:, cols] * np.exp(-0.5 * diff ** 2)).sum(axis=1) / len(wifi_scans)
+
+        rows = np.arange(len(self.floor_ids))
+        if building_id is not None:
+            rows = rows[self.building_ids == building_id]
+        rows = rows[np.argsort(scores[rows])[::-1]]
+
+        return [
+            {
+                "building_id": int(self.building_ids[row]),
+                "floor_id": int(self.floor_ids[row]),
+                "score": round(float(scores[row]), 4),
+            }
+            for row in rows
+        ]
+
+
+class CachedValue:
+    """A single process-wide cached value (e.g. the floor detection index) dropped on writes"""
+
+    def __init__(self):
+        self._value = None
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def generation(self) -> int:
+        with self._lock:
+            return self._generation
+
+    def get(self):
+        with self._lock:
+            return self._value
+
+    def put(self, value, generation: int):
+        with self._lock:
+            if generation == self._generation:
+                self._value = value
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._value = None
+
+
+class RadioMapCache:
+    """Process-level LRU cache of compiled radio maps keyed by floor_id, bounded by memory"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # floor_id -> (radio_map, accounted bytes)
+        self._generations = {}
+        self._epoch = 0
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def generation(self, floor_id: int):
+        """Snapshot to pass to put(); any invalidation in between makes the put a no-op"""
+        with self._lock:
+            return (self._epoch, self._generations.get(floor_id, 0))
+
+    def get(self, floor_id: int) -> Optional[RadioMapMatrix]:
+        with self._lock:
+            entry = self._entries.get(floor_id)
+            if entry is None:
+                return None
+            self._entries.move_to_end(floor_id)
+            return entry[0]
+
+    def put(self, floor_id: int, radio_map: RadioMapMatrix, generation):
+        size = radio_map.nbytes
+        with self._lock:
+            # A write landed while this map was being compiled, so it may already be stale
+            if (self._epoch, self._generations.get(floor_id, 0)) != generation:
+                return
+            if size > self.max_bytes:
+                return
+            self._discard(floor_id)
+            self._entries[floor_id] = (radio_map, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+
+    def resize(self, floor_id: int, radio_map):
+        """Re-count an entry that grew after put() (an engine or export attached to it)
+
+        A no-op unless radio_map is the object cached under floor_id; an entry that alone
+        outgrows the budget is dropped.
+        """
+        size = radio_map.nbytes
+        with self._lock:
+            entry = self._entries.get(floor_id)
+            if entry is None or entry[0] is not radio_map:
+                return
+            self._size += size - entry[1]
+            self._entries[floor_id] = (radio_map, size)
+            if size > self.max_bytes:
+                self._discard(floor_id)
+            while self._size > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+
+    def invalidate(self, floor_id: int):
+        with self._lock:
+            self._generations[floor_id] = self._generations.get(floor_id, 0) + 1
+            self._discard(floor_id)
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            return {"floors": len(self._entries), "bytes": self._size, "max_bytes": self.max_bytes}
+
+    def _discard(self, floor_id: int):
+        entry = self._entries.pop(floor_id, None)
+        if entry is not None:
+            self._size -= entry[1]
+
+
+radiomap_cache = RadioMapCache(max_bytes=int(os.getenv("RADIOMAP_CACHE_MAX_BYTES", 256 * 1024 * 1024)))
+floor_detection_cache = CachedValue()
+calibration_cache = CachedValue()
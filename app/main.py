@@ -1,9 +1,11 @@
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from app.routers import buildings, floors, fingerprints, upload, init, debug, upload_debug
+from app.routers import buildings, floors, fingerprints, upload, init, debug, upload_debug, tracking, calibration, survey_sessions
 from app.database import engine, test_database_connection
 from app.models import Base
+from app.ingestion import ingestion_queue, INGEST_DRAIN_TIMEOUT_S
 from init_database_on_startup import initialize_database
 
 # Create database tables
@@ -21,7 +23,7 @@ try:
         conn.execute(text("SELECT 1"))
     
     # If database works, try importing map models
-    from app.routers import map_authoring
+    from app.routers import map_authoring, routing
     from app.map_models import FloorPlanVersion, PointOfInterest, RoutingNode, RoutingEdge, MapPublishing
     
     # Create map authoring tables
@@ -68,15 +70,25 @@ app.include_router(upload.router, prefix="/api/v1", tags=["upload"])
 app.include_router(init.router, prefix="/api/v1", tags=["init"])
 app.include_router(debug.router, prefix="/api/v1", tags=["debug"])
 app.include_router(upload_debug.router, prefix="/api/v1", tags=["upload-debug"])
+app.include_router(tracking.router, prefix="/api/v1", tags=["tracking"])
+app.include_router(calibration.router, prefix="/api/v1", tags=["calibration"])
+app.include_router(survey_sessions.router, prefix="/api/v1", tags=["survey-sessions"])
 
 # Include map authoring router only if enabled
 if MAP_AUTH_ENABLED:
     app.include_router(map_authoring.router, prefix="/api/v1", tags=["map-authoring"])
+    app.include_router(routing.router, prefix="/api/v1", tags=["routing"])
 
 # Mount static files
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+@app.on_event("shutdown")
+async def flush_ingestion_queue():
+    # Write out acknowledged fingerprints before the process exits, waiting in a thread so the
+    # event loop keeps running and giving up if the database never takes them
+    await asyncio.to_thread(ingestion_queue.drain, INGEST_DRAIN_TIMEOUT_S)
+
 @app.get("/")
 async def root():
     return {"message": "Indoor Navigation API"}
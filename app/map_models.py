@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Text, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Text, ForeignKey, JSON, LargeBinary, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -104,3 +104,16 @@ class MapPublishing(Base):
     # Relationships
     floor = relationship("Floor")
     version = relationship("FloorPlanVersion")
+
+class RoutingArtifact(Base):
+    """Routing data precomputed when a version is published (e.g. contraction hierarchies)"""
+    __tablename__ = "routing_artifacts"
+    __table_args__ = (UniqueConstraint("version_id", "kind"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    version_id = Column(Integer, ForeignKey("floor_plan_versions.id"), nullable=False, index=True)
+    kind = Column(String, nullable=False)  # e.g. 'contraction_hierarchy:distance'
+    digest = Column(String, nullable=False)  # routing graph it was computed from
+    payload = Column(LargeBinary, nullable=False)  # compressed numpy archive
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, JSON
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, JSON, LargeBinary, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -35,6 +35,7 @@ class Floor(Base):
 
 class Fingerprint(Base):
     __tablename__ = "fingerprints"
+    __table_args__ = (Index("ix_fingerprints_floor_id_id", "floor_id", "id"),)  # keyset pagination per floor
     
     id = Column(Integer, primary_key=True, index=True)
     floor_id = Column(Integer, ForeignKey("floors.id"), nullable=False)
@@ -42,10 +43,71 @@ class Fingerprint(Base):
     y = Column(Float, nullable=False)  # ground truth y position in meters
     device_model = Column(String)
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
-    wifi_scans = Column(JSON, nullable=False)  # [{bssid, rssi}, ...]
+    # [{bssid, rssi}, ...]. Temporary dual-write next to fingerprint_scans, which radio maps
+    # and radio map responses read; compaction, AP statistics, device calibration and the
+    # fingerprint endpoints still read this column, so it can only be dropped once they have
+    # moved to the packed scans
+    wifi_scans = Column(JSON, nullable=False)
+    survey_session_id = Column(Integer, ForeignKey("survey_sessions.id"), index=True)  # NULL for pre-session surveys
     
     floor = relationship("Floor", back_populates="fingerprints")
 
+class SurveySession(Base):
+    __tablename__ = "survey_sessions"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    floor_id = Column(Integer, ForeignKey("floors.id"), nullable=False, index=True)
+    name = Column(String)
+    status = Column(String, nullable=False, default="collecting")  # 'collecting', 'active', 'retired', 'purging', 'purged'
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    activated_at = Column(DateTime(timezone=True))
+
+class FloorActiveSurvey(Base):
+    __tablename__ = "floor_active_surveys"
+    
+    floor_id = Column(Integer, ForeignKey("floors.id"), primary_key=True)
+    survey_session_id = Column(Integer, ForeignKey("survey_sessions.id"))  # NULL: fingerprints without a session are live
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class FingerprintScans(Base):
+    __tablename__ = "fingerprint_scans"
+    
+    fingerprint_id = Column(Integer, ForeignKey("fingerprints.id"), primary_key=True)
+    floor_id = Column(Integer, ForeignKey("floors.id"), nullable=False, index=True)
+    payload = Column(LargeBinary, nullable=False)  # packed (int32 access_points.id, int8 rssi) pairs
+    moments = Column(LargeBinary)  # packed (uint32 count, float32 rssi_std) per pair; NULL unless aggregated
+
+class RadioMapRevision(Base):
+    __tablename__ = "radiomap_revisions"
+    
+    floor_id = Column(Integer, ForeignKey("floors.id"), primary_key=True)
+    revision = Column(Integer, nullable=False, default=0)  # bumped by every change to the floor's fingerprints
+    reset_revision = Column(Integer, nullable=False, default=0)  # oldest revision deltas can be served from
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class RadioMapChange(Base):
+    __tablename__ = "radiomap_changes"
+    __table_args__ = (Index("ix_radiomap_changes_floor_revision", "floor_id", "revision"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    floor_id = Column(Integer, ForeignKey("floors.id"), nullable=False)
+    revision = Column(Integer, nullable=False)
+    fingerprint_id = Column(Integer, nullable=False)  # not a foreign key: removed rows are gone
+    operation = Column(String, nullable=False)  # 'add' or 'remove'
+
+class FingerprintArchive(Base):
+    __tablename__ = "fingerprint_archive"
+    
+    id = Column(Integer, primary_key=True)  # id the fingerprint had before compaction
+    floor_id = Column(Integer, ForeignKey("floors.id"), nullable=False, index=True)
+    x = Column(Float, nullable=False)
+    y = Column(Float, nullable=False)
+    device_model = Column(String)
+    timestamp = Column(DateTime(timezone=True))
+    wifi_scans = Column(JSON, nullable=False)
+    compacted_into = Column(Integer, nullable=False)  # id of the aggregated fingerprint
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
 class AccessPoint(Base):
     __tablename__ = "access_points"
     
@@ -54,3 +116,51 @@ class AccessPoint(Base):
     ssid = Column(String)
     first_seen = Column(DateTime(timezone=True), server_default=func.now())
     last_seen = Column(DateTime(timezone=True), server_default=func.now())
+
+class AccessPointStats(Base):
+    __tablename__ = "access_point_stats"
+    
+    floor_id = Column(Integer, ForeignKey("floors.id"), primary_key=True)
+    access_point_id = Column(Integer, ForeignKey("access_points.id"), primary_key=True)
+    sample_count = Column(Integer, nullable=False)  # readings of the AP on the floor
+    rssi_mean = Column(Float, nullable=False)
+    rssi_m2 = Column(Float, nullable=False)  # sum of squared deviations from the mean (Welford)
+    min_x = Column(Float, nullable=False)  # coverage extent in meters; only grows until rebuilt
+    max_x = Column(Float, nullable=False)
+    min_y = Column(Float, nullable=False)
+    max_y = Column(Float, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class FloorSurveyStats(Base):
+    __tablename__ = "floor_survey_stats"
+    
+    floor_id = Column(Integer, ForeignKey("floors.id"), primary_key=True)
+    fingerprint_count = Column(Integer, nullable=False, default=0)
+    sample_count = Column(Integer, nullable=False, default=0)  # readings, counting aggregated points by their count
+
+class FloorLocalizationSettings(Base):
+    __tablename__ = "floor_localization_settings"
+    
+    floor_id = Column(Integer, ForeignKey("floors.id"), primary_key=True)
+    engine = Column(String, nullable=False, default="wknn")  # 'wknn', 'kdtree', 'gaussian', 'grid'
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class RadioMapArtifact(Base):
+    __tablename__ = "radiomap_artifacts"
+    __table_args__ = (UniqueConstraint("floor_id", "kind"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    floor_id = Column(Integer, ForeignKey("floors.id"), nullable=False)
+    kind = Column(String, nullable=False)  # 'grid'
+    source_digest = Column(String, nullable=False)  # digest of the compiled radio map it was built from
+    payload = Column(LargeBinary, nullable=False)  # compressed .npz arrays
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class DeviceCalibration(Base):
+    __tablename__ = "device_calibrations"
+    
+    device_model = Column(String, primary_key=True)
+    scale = Column(Float, nullable=False, default=1.0)  # calibrated = scale * rssi + offset
+    offset = Column(Float, nullable=False, default=0.0)  # dB
+    sample_count = Column(Integer, nullable=False, default=0)  # co-located observations used in the fit
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,18 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+from typing import List
+from app.database import get_db
+from app.schemas import DeviceCalibration
+from app.crud import get_device_calibrations, fit_device_calibrations
+
+router = APIRouter()
+
+@router.get("/calibration/devices", response_model=List[DeviceCalibration])
+async def read_device_calibrations(db: Session = Depends(get_db)):
+    """Get the RSSI calibration learned for each device model"""
+    return get_device_calibrations(db)
+
+@router.post("/calibration/devices/fit", response_model=List[DeviceCalibration])
+async def fit_device_calibration_table(db: Session = Depends(get_db)):
+    """Learn per device model RSSI scale/offset from co-located fingerprints"""
+    return fit_device_calibrations(db)
@@ -1,15 +1,62 @@
-from fastapi import APIRouter, Depends, HTTPException
+import json
+import queue
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, Header, BackgroundTasks
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from typing import List
-from app.database import get_db
-from app.schemas import Fingerprint, FingerprintCreate, FingerprintBatch, RadioMap
+from typing import List, Optional
+from app.database import get_db, run_in_session
+from app.schemas import (
+    Fingerprint,
+    FingerprintCreate,
+    FingerprintBatch,
+    RadioMap,
+    RadioMapDelta,
+    AccessPointStatistics,
+    LocateRequest,
+    LocationEstimate,
+    BatchLocateRequest,
+    BatchLocationEstimate,
+    DetectLocateRequest,
+    PositionEstimate,
+    LocalizationSettings,
+    LocalizationSettingsBase
+)
 from app.crud import (
     get_fingerprint, 
     get_fingerprints_by_floor, 
+    iter_floor_fingerprints,
     create_fingerprint, 
     create_fingerprints_batch,
-    get_radiomap
+    import_fingerprints,
+    check_fingerprint_targets,
+    get_open_survey_session_ids,
+    get_radiomap,
+    get_radiomap_revision,
+    get_radiomap_changes,
+    get_access_point_stats,
+    get_compiled_radiomap,
+    get_floor_detection_index,
+    get_calibration_table,
+    get_localization_engine,
+    set_localization_engine,
+    get_floor,
+    compile_radiomap_grid,
+    load_persisted_engine,
+    claim_radiomap_grid_rebuild,
+    rebuild_radiomap_grid,
+    clear_floor_survey,
+    rebuild_access_point_stats,
+    purge_survey_fingerprints,
+    compact_floor_fingerprints
+)
+from app.localization import locate, locate_batch, LOCALIZATION_ENGINES, DEFAULT_ENGINE, COMPACTION_TOLERANCE_M
+from app.ingestion import ingestion_queue
+from app.fingerprint_import import (
+    FingerprintStreamParser,
+    IMPORT_FORMATS,
+    IMPORT_CHUNK_SIZE,
+    MAX_REPORTED_ERRORS
 )
 
 router = APIRouter()
@@ -17,12 +64,90 @@ router = APIRouter()
 @router.post("/fingerprints", response_model=Fingerprint)
 async def create_new_fingerprint(fingerprint: FingerprintCreate, db: Session = Depends(get_db)):
     """Create a new fingerprint"""
-    return create_fingerprint(db=db, fingerprint=fingerprint)
+    try:
+        return create_fingerprint(db=db, fingerprint=fingerprint)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/fingerprints/batch", response_model=List[Fingerprint])
 async def create_fingerprint_batch(batch: FingerprintBatch, db: Session = Depends(get_db)):
     """Create multiple fingerprints in a batch"""
-    return create_fingerprints_batch(db=db, fingerprints=batch.fingerprints)
+    try:
+        return create_fingerprints_batch(db=db, fingerprints=batch.fingerprints)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/fingerprints/queue", status_code=202)
+async def enqueue_fingerprints(batch: FingerprintBatch, db: Session = Depends(get_db)):
+    """Acknowledge fingerprints immediately and write them behind in micro-batches"""
+    # Reject what the worker could never write while the client can still fix it
+    try:
+        check_fingerprint_targets(db, batch.fingerprints)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        depth = ingestion_queue.submit(batch.fingerprints)
+    except queue.Full as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    return {"accepted": len(batch.fingerprints), "queue_depth": depth}
+
+@router.get("/fingerprints/queue")
+async def read_ingestion_queue():
+    """Get write-behind queue depth and counters"""
+    return ingestion_queue.stats()
+
+@router.post("/floors/{floor_id}/fingerprints/import")
+async def import_floor_fingerprints(
+    floor_id: int,
+    request: Request,
+    format: Optional[str] = Query(None, description="ndjson or csv; inferred from Content-Type when omitted"),
+    db: Session = Depends(get_db)
+):
+    """Stream NDJSON or CSV fingerprints (optionally gzip-compressed) into a floor in bulk chunks"""
+    if get_floor(db, floor_id=floor_id) is None:
+        raise HTTPException(status_code=404, detail="Floor not found")
+    if format is None:
+        format = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    if format not in IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown import format '{format}', expected one of {', '.join(IMPORT_FORMATS)}")
+    gzipped = True if request.headers.get("content-encoding", "").lower() == "gzip" else None
+    parser = FingerprintStreamParser(
+        floor_id, fmt=format, gzipped=gzipped, open_sessions=get_open_survey_session_ids(db, floor_id)
+    )
+    
+    imported = 0
+    failed = 0
+    errors = []
+    pending = []
+    
+    def consume(results):
+        nonlocal imported, failed
+        for line_number, fingerprint, error in results:
+            if error is not None:
+                failed += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({"line": line_number, "error": error})
+                continue
+            pending.append(fingerprint)
+            if len(pending) >= IMPORT_CHUNK_SIZE:
+                imported += import_fingerprints(db, pending)
+                pending.clear()
+    
+    try:
+        async for data in request.stream():
+            consume(parser.feed(data))
+        consume(parser.close())
+        if pending:
+            imported += import_fingerprints(db, pending)
+    except ValueError as e:
+        # Chunks flushed before a fatal error (a bad stream, or a session closed mid-import)
+        # stay committed and are reported
+        db.rollback()
+        raise HTTPException(status_code=400, detail={"error": str(e), "imported": imported, "line": parser.line_number})
+    
+    return {"floor_id": floor_id, "imported": imported, "failed": failed, "errors": errors}
 
 @router.get("/fingerprints/{fingerprint_id}", response_model=Fingerprint)
 async def read_fingerprint(fingerprint_id: int, db: Session = Depends(get_db)):
@@ -35,30 +160,223 @@ async def read_fingerprint(fingerprint_id: int, db: Session = Depends(get_db)):
 @router.get("/floors/{floor_id}/fingerprints", response_model=List[Fingerprint])
 async def read_floor_fingerprints(
     floor_id: int, 
+    response: Response,
     skip: int = 0, 
     limit: int = 1000, 
+    after_id: Optional[int] = Query(None, description="Return fingerprints with ids after this cursor"),
+    survey_session_id: Optional[int] = Query(None, description="List a survey session instead of the live set"),
     db: Session = Depends(get_db)
 ):
     """Get all fingerprints for a floor"""
-    fingerprints = get_fingerprints_by_floor(db, floor_id=floor_id, skip=skip, limit=limit)
+    fingerprints = get_fingerprints_by_floor(
+        db, floor_id=floor_id, skip=skip, limit=limit, after_id=after_id, survey_session_id=survey_session_id
+    )
+    if len(fingerprints) == limit:
+        response.headers["X-Next-After-Id"] = str(fingerprints[-1].id)
     return fingerprints
 
-@router.get("/floors/{floor_id}/radiomap", response_model=RadioMap)
+@router.get("/floors/{floor_id}/fingerprints/export")
+async def export_floor_fingerprints(floor_id: int, db: Session = Depends(get_db)):
+    """Stream every fingerprint of a floor as a JSON array without loading the floor into memory"""
+    if get_floor(db, floor_id=floor_id) is None:
+        raise HTTPException(status_code=404, detail="Floor not found")
+    
+    def generate():
+        yield "["
+        for i, row in enumerate(iter_floor_fingerprints(db, floor_id=floor_id)):
+            record = row._asdict()
+            record["timestamp"] = record["timestamp"].isoformat() if record["timestamp"] else None
+            yield ("," if i else "") + json.dumps(record)
+        yield "]"
+    
+    return StreamingResponse(generate(), media_type="application/json")
+
+@router.get("/floors/{floor_id}/radiomap", response_model=RadioMap, response_model_exclude_none=True)
 async def get_floor_radiomap(floor_id: int, db: Session = Depends(get_db)):
     """Get radio map for Wi-Fi fingerprinting localization"""
+    revision = get_radiomap_revision(db, floor_id=floor_id)
     radio_points = get_radiomap(db, floor_id=floor_id)
     
     return RadioMap(
         floor_id=floor_id,
+        revision=revision,
         points=radio_points
     )
 
+@router.get("/floors/{floor_id}/radiomap/export")
+async def export_floor_radiomap(
+    floor_id: int,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """Get the compiled radio map as a memory-mappable binary file with a strong ETag"""
+    if get_floor(db, floor_id=floor_id) is None:
+        raise HTTPException(status_code=404, detail="Floor not found")
+    payload, etag = get_compiled_radiomap(db, floor_id=floor_id).export
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match is not None:
+        client_etags = [tag.strip() for tag in if_none_match.split(",")]
+        if "*" in client_etags or etag in client_etags:
+            return Response(status_code=304, headers=headers)
+    return Response(content=payload, media_type="application/octet-stream", headers=headers)
+
+@router.get("/floors/{floor_id}/radiomap/changes", response_model=RadioMapDelta, response_model_exclude_none=True)
+async def get_floor_radiomap_changes(
+    floor_id: int,
+    since: int = Query(0, ge=0, description="Radio map revision the client already has"),
+    db: Session = Depends(get_db)
+):
+    """Get fingerprints added or removed since a revision, or a full snapshot if the client is too far behind"""
+    return get_radiomap_changes(db, floor_id=floor_id, since=since)
+
+@router.get("/floors/{floor_id}/access-points/stats", response_model=List[AccessPointStatistics])
+async def read_access_point_stats(floor_id: int, db: Session = Depends(get_db)):
+    """Get per-AP RSSI statistics and coverage extent for a floor, most heard first"""
+    return get_access_point_stats(db, floor_id=floor_id)
+
+@router.post("/floors/{floor_id}/locate", response_model=LocationEstimate)
+async def locate_on_floor(floor_id: int, request: LocateRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    """Estimate a position on a floor from a Wi-Fi scan (weighted k-NN on the radio map)"""
+    radio_map = get_compiled_radiomap(db, floor_id=floor_id)
+    if radio_map.is_empty:
+        raise HTTPException(status_code=404, detail="No fingerprints recorded for this floor")
+    
+    engine = _resolve_engine(db, radio_map, request.engine, background_tasks)
+    try:
+        estimate = locate(
+            radio_map, request.wifi_scans, k=request.k, engine=engine,
+            calibration=get_calibration_table(db).coefficients([request.device_model])
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    return LocationEstimate(floor_id=floor_id, engine=engine, **estimate)
+
+@router.post("/floors/{floor_id}/locate/batch", response_model=BatchLocationEstimate)
+async def locate_batch_on_floor(floor_id: int, request: BatchLocateRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    """Estimate positions for many scans on one floor in a single matrix computation"""
+    radio_map = get_compiled_radiomap(db, floor_id=floor_id)
+    if radio_map.is_empty:
+        raise HTTPException(status_code=404, detail="No fingerprints recorded for this floor")
+    
+    engine = _resolve_engine(db, radio_map, request.engine, background_tasks)
+    calibration = get_calibration_table(db).coefficients([scan.device_model for scan in request.scans])
+    estimates = locate_batch(
+        radio_map, [scan.wifi_scans for scan in request.scans], k=request.k, engine=engine, calibration=calibration
+    )
+    
+    return BatchLocationEstimate(
+        floor_id=floor_id,
+        estimates=[LocationEstimate(floor_id=floor_id, engine=engine, **estimate) for estimate in estimates]
+    )
+
+@router.post("/locate", response_model=PositionEstimate)
+async def locate_anywhere(request: DetectLocateRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    """Detect the building and floor from a raw scan, then position on that floor"""
+    index = get_floor_detection_index(db)
+    scales, offsets = get_calibration_table(db).coefficients([request.device_model])
+    try:
+        candidates = index.detect(
+            request.wifi_scans, building_id=request.building_id, calibration=(scales[0], offsets[0])
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if not candidates:
+        raise HTTPException(status_code=404, detail="No surveyed floors found")
+    
+    best = candidates[0]
+    radio_map = get_compiled_radiomap(db, floor_id=best["floor_id"])
+    engine = _resolve_engine(db, radio_map, request.engine, background_tasks)
+    try:
+        estimate = locate(radio_map, request.wifi_scans, k=request.k, engine=engine, calibration=(scales, offsets))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    return PositionEstimate(
+        floor_id=best["floor_id"],
+        building_id=best["building_id"],
+        floor_score=best["score"],
+        candidates=candidates[:5],
+        engine=engine,
+        **estimate
+    )
+
+@router.post("/floors/{floor_id}/radiomap/grid")
+async def compile_floor_radiomap_grid(
+    floor_id: int,
+    resolution: float = Query(1.0, gt=0, description="Grid cell size in meters"),
+    db: Session = Depends(get_db)
+):
+    """Interpolate the radio map onto a regular grid and persist it for the 'grid' engine"""
+    if get_floor(db, floor_id=floor_id) is None:
+        raise HTTPException(status_code=404, detail="Floor not found")
+    try:
+        return compile_radiomap_grid(db, floor_id=floor_id, resolution=resolution)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/floors/{floor_id}/localization-settings", response_model=LocalizationSettings)
+async def read_localization_settings(floor_id: int, db: Session = Depends(get_db)):
+    """Get the matching engine used for a floor"""
+    return LocalizationSettings(floor_id=floor_id, engine=get_localization_engine(db, floor_id=floor_id))
+
+@router.put("/floors/{floor_id}/localization-settings", response_model=LocalizationSettings)
+async def update_localization_settings(
+    floor_id: int,
+    settings: LocalizationSettingsBase,
+    db: Session = Depends(get_db)
+):
+    """Select the matching engine used for a floor"""
+    if get_floor(db, floor_id=floor_id) is None:
+        raise HTTPException(status_code=404, detail="Floor not found")
+    _check_engine(settings.engine)
+    return set_localization_engine(db, floor_id=floor_id, engine=settings.engine)
+
+def _check_engine(engine: str):
+    if engine not in LOCALIZATION_ENGINES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown localization engine '{engine}', expected one of {', '.join(LOCALIZATION_ENGINES)}"
+        )
+
+def _resolve_engine(db: Session, radio_map, override: Optional[str], background_tasks: BackgroundTasks):
+    engine = override if override is not None else get_localization_engine(db, floor_id=radio_map.floor_id)
+    _check_engine(engine)
+    state = load_persisted_engine(db, radio_map, engine)
+    if state == "stale":
+        # The radio map changed since the artifact was compiled; serve wknn until the recompile lands
+        if claim_radiomap_grid_rebuild(radio_map.floor_id):
+            background_tasks.add_task(run_in_session, db.get_bind(), rebuild_radiomap_grid, radio_map.floor_id)
+        return DEFAULT_ENGINE
+    if state == "missing":
+        raise HTTPException(
+            status_code=409,
+            detail=f"No '{engine}' artifact for floor {radio_map.floor_id}; compile it first"
+        )
+    return engine
+
+@router.post("/floors/{floor_id}/fingerprints/compact")
+async def compact_fingerprints(
+    floor_id: int,
+    tolerance: float = Query(COMPACTION_TOLERANCE_M, gt=0, description="Fingerprints closer than this (meters) are aggregated"),
+    archive: bool = Query(False, description="Keep the raw fingerprints in fingerprint_archive"),
+    db: Session = Depends(get_db)
+):
+    """Collapse repeated scans at the same reference point into aggregated fingerprints"""
+    if get_floor(db, floor_id=floor_id) is None:
+        raise HTTPException(status_code=404, detail="Floor not found")
+    return compact_floor_fingerprints(db, floor_id=floor_id, tolerance=tolerance, archive=archive)
+
 @router.delete("/floors/{floor_id}/fingerprints")
-async def clear_floor_fingerprints(floor_id: int, db: Session = Depends(get_db)):
+async def clear_floor_fingerprints(floor_id: int, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
     """Clear all fingerprints for a floor (useful for resurvey)"""
-    from app.models import Fingerprint
-    
-    deleted_count = db.query(Fingerprint).filter(Fingerprint.floor_id == floor_id).delete()
-    db.commit()
+    if get_floor(db, floor_id=floor_id) is None:
+        raise HTTPException(status_code=404, detail="Floor not found")
+    # The floor switches to an empty survey session at once; old rows are deleted afterwards
+    cleared_count, previous_session_id = clear_floor_survey(db, floor_id=floor_id)
+    background_tasks.add_task(run_in_session, db.get_bind(), rebuild_access_point_stats, floor_id)
+    background_tasks.add_task(run_in_session, db.get_bind(), purge_survey_fingerprints, floor_id, previous_session_id)
     
-    return {"message": f"Deleted {deleted_count} fingerprints from floor {floor_id}"}
+    return {"message": f"Deleted {cleared_count} fingerprints from floor {floor_id}"}
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Query
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Query, BackgroundTasks
 from sqlalchemy.orm import Session
 from typing import List, Optional
 import os
@@ -8,22 +8,23 @@ import io
 import json
 from datetime import datetime
 
-from app.database import get_db
+from app.database import get_db, run_in_session
 from app.models import Building, Floor
 from app.map_models import FloorPlanVersion, PointOfInterest, RoutingNode, RoutingEdge, MapPublishing
+from app.routing import routing_graph_cache, invalidate_poi_matrices, build_poi_matrices
 from app.map_schemas import (
-    FloorPlanVersionCreate, FloorPlanVersionUpdate, FloorPlanVersion,
-    POICreate, POIUpdate, PointOfInterest,
-    RoutingNodeCreate, RoutingNodeUpdate, RoutingNode,
-    RoutingEdgeCreate, RoutingEdgeUpdate, RoutingEdge,
-    MapPublishingCreate, MapPublishingUpdate, MapPublishing,
+    FloorPlanVersionCreate, FloorPlanVersionUpdate, FloorPlanVersion as FloorPlanVersionSchema,
+    POICreate, POIUpdate, PointOfInterest as PointOfInterestSchema,
+    RoutingNodeCreate, RoutingNodeUpdate, RoutingNode as RoutingNodeSchema,
+    RoutingEdgeCreate, RoutingEdgeUpdate, RoutingEdge as RoutingEdgeSchema,
+    MapPublishingCreate, MapPublishingUpdate, MapPublishing as MapPublishingSchema,
     MapValidationResult, MapPublishingWorkflow
 )
 
 router = APIRouter()
 
 # Floor Plan Version Management
-@router.post("/floors/{floor_id}/versions", response_model=FloorPlanVersion)
+@router.post("/floors/{floor_id}/versions", response_model=FloorPlanVersionSchema)
 async def create_floor_plan_version(
     floor_id: int,
     file: UploadFile = File(...),
@@ -112,7 +113,7 @@ async def create_floor_plan_version(
             os.remove(file_path)
         raise HTTPException(status_code=500, detail=f"Failed to process file: {str(e)}")
 
-@router.get("/floors/{floor_id}/versions", response_model=List[FloorPlanVersion])
+@router.get("/floors/{floor_id}/versions", response_model=List[FloorPlanVersionSchema])
 async def get_floor_plan_versions(floor_id: int, db: Session = Depends(get_db)):
     """Get all versions of a floor plan"""
     versions = db.query(FloorPlanVersion).filter(
@@ -144,7 +145,7 @@ async def get_floor_plan_version(version_id: int, db: Session = Depends(get_db))
         "updated_at": version.updated_at
     }
 
-@router.put("/floors/{floor_id}/versions/{version_id}", response_model=FloorPlanVersion)
+@router.put("/floors/{floor_id}/versions/{version_id}", response_model=FloorPlanVersionSchema)
 async def update_floor_plan_version(
     floor_id: int, 
     version_id: int,
@@ -164,6 +165,8 @@ async def update_floor_plan_version(
     
     db.commit()
     db.refresh(version)
+    # The scale converts drawn coordinates to meters for the A* heuristic and building graphs
+    routing_graph_cache.invalidate(version_id)
     return version
 
 # Points of Interest Management
@@ -178,6 +181,7 @@ async def create_poi(poi: POICreate, db: Session = Depends(get_db)):
     db.add(db_poi)
     db.commit()
     db.refresh(db_poi)
+    invalidate_poi_matrices(db_poi.version_id)
     
     return {
         "id": db_poi.id,
@@ -215,7 +219,7 @@ async def get_pois(version_id: int, db: Session = Depends(get_db)):
         "updated_at": poi.updated_at
     } for poi in pois]
 
-@router.put("/pois/{poi_id}", response_model=PointOfInterest)
+@router.put("/pois/{poi_id}", response_model=PointOfInterestSchema)
 async def update_poi(poi_id: int, poi_update: POIUpdate, db: Session = Depends(get_db)):
     """Update a Point of Interest"""
     poi = db.query(PointOfInterest).filter(PointOfInterest.id == poi_id).first()
@@ -228,6 +232,7 @@ async def update_poi(poi_id: int, poi_update: POIUpdate, db: Session = Depends(g
     poi.updated_at = datetime.utcnow()
     db.commit()
     db.refresh(poi)
+    invalidate_poi_matrices(poi.version_id)
     return poi
 
 @router.delete("/pois/{poi_id}")
@@ -239,6 +244,7 @@ async def delete_poi(poi_id: int, db: Session = Depends(get_db)):
     
     poi.is_active = False
     db.commit()
+    invalidate_poi_matrices(poi.version_id)
     return {"message": "POI deleted successfully"}
 
 # Routing Graph Management
@@ -253,6 +259,7 @@ async def create_routing_node(node: RoutingNodeCreate, db: Session = Depends(get
     db.add(db_node)
     db.commit()
     db.refresh(db_node)
+    routing_graph_cache.invalidate(node.version_id)
     
     return {
         "id": db_node.id,
@@ -302,6 +309,7 @@ async def create_routing_edge(edge: RoutingEdgeCreate, db: Session = Depends(get
     db.add(db_edge)
     db.commit()
     db.refresh(db_edge)
+    routing_graph_cache.invalidate(edge.version_id)
     
     return {
         "id": db_edge.id,
@@ -414,6 +422,7 @@ async def validate_map(version_id: int, db: Session = Depends(get_db)):
 @router.post("/versions/{version_id}/publish", response_model=MapPublishingWorkflow)
 async def publish_map_version(
     version_id: int,
+    background_tasks: BackgroundTasks,
     published_by: Optional[str] = Query(None),
     db: Session = Depends(get_db)
 ):
@@ -444,6 +453,8 @@ async def publish_map_version(
         next_steps.extend(["Fix validation errors", "Re-validate map"])
     else:
         next_steps.extend(["Review map", "Approve for publishing"])
+        # POI-to-POI tables are cheap (one search per POI), so every valid publish gets them
+        background_tasks.add_task(run_in_session, db.get_bind(), build_poi_matrices, version_id)
     
     return MapPublishingWorkflow(
         version_id=version_id,
@@ -452,10 +463,32 @@ async def publish_map_version(
         next_steps=next_steps
     )
 
-@router.get("/floors/{floor_id}/publishing", response_model=List[MapPublishing])
+@router.get("/floors/{floor_id}/publishing", response_model=List[MapPublishingSchema])
 async def get_publishing_history(floor_id: int, db: Session = Depends(get_db)):
     """Get publishing history for a floor"""
     publishing = db.query(MapPublishing).filter(
         MapPublishing.floor_id == floor_id
     ).order_by(MapPublishing.created_at.desc()).all()
     return publishing
+
+@router.post("/publishing/{publishing_id}/approve", response_model=MapPublishingSchema)
+async def approve_publishing(publishing_id: int, db: Session = Depends(get_db)):
+    """Make a reviewed version the floor's current published version"""
+    publishing = db.query(MapPublishing).filter(MapPublishing.id == publishing_id).first()
+    if not publishing:
+        raise HTTPException(status_code=404, detail="Publishing record not found")
+    if publishing.status not in ("review", "approved", "published"):
+        raise HTTPException(status_code=400, detail=f"Cannot approve a publishing record in status '{publishing.status}'")
+    
+    # The previous current version is archived; building routes pick up the change on their next query
+    db.query(MapPublishing).filter(
+        MapPublishing.floor_id == publishing.floor_id,
+        MapPublishing.is_current == True,
+        MapPublishing.id != publishing.id
+    ).update({"is_current": False, "status": "archived"}, synchronize_session=False)
+    publishing.status = "published"
+    publishing.is_current = True
+    publishing.published_at = datetime.now()
+    db.commit()
+    db.refresh(publishing)
+    return publishing
@@ -0,0 +1,101 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from app.database import get_db
+from app.models import Building
+from app.map_models import FloorPlanVersion
+from app.routing import (
+    get_routing_graph, get_building_graph, get_contraction_hierarchy, get_poi_matrix, ROUTE_WEIGHTS, ROUTE_ALGORITHMS
+)
+
+router = APIRouter()
+
+@router.get("/versions/{version_id}/route")
+async def get_route(
+    version_id: int,
+    from_node_id: int = Query(..., alias="from", description="Start routing node id"),
+    to_node_id: int = Query(..., alias="to", description="Destination routing node id"),
+    weight: str = Query("distance", description="Minimise 'distance' or 'travel_time'"),
+    algorithm: str = Query(
+        "dijkstra",
+        description="Search with 'dijkstra', 'astar' or 'ch'; 'ch' needs a hierarchy built by "
+                    "build_contraction_hierarchies.py"
+    ),
+    db: Session = Depends(get_db)
+):
+    """Shortest route between two routing nodes of a floor plan version"""
+    _check_route_options(weight, algorithm)
+    if db.query(FloorPlanVersion.id).filter(FloorPlanVersion.id == version_id).first() is None:
+        raise HTTPException(status_code=404, detail="Version not found")
+    
+    graph = get_routing_graph(db, version_id)
+    if algorithm == "ch" and get_contraction_hierarchy(db, graph, weight) is None:
+        raise HTTPException(
+            status_code=409,
+            detail="No current contraction hierarchy for this version; run build_contraction_hierarchies.py for it"
+        )
+    route = _find_route(graph, from_node_id, to_node_id, weight, algorithm)
+    return {"version_id": version_id, "from": from_node_id, "to": to_node_id, "weight": weight, **route}
+
+@router.get("/versions/{version_id}/pois/route")
+async def get_poi_route(
+    version_id: int,
+    from_poi_id: int = Query(..., alias="from", description="Start point of interest id"),
+    to_poi_id: int = Query(..., alias="to", description="Destination point of interest id"),
+    weight: str = Query("distance", description="Minimise 'distance' or 'travel_time'"),
+    db: Session = Depends(get_db)
+):
+    """Route between two points of interest from the tables precomputed at publish"""
+    if weight not in ROUTE_WEIGHTS:
+        raise HTTPException(status_code=400, detail=f"Unknown route weight '{weight}', expected one of {', '.join(ROUTE_WEIGHTS)}")
+    if db.query(FloorPlanVersion.id).filter(FloorPlanVersion.id == version_id).first() is None:
+        raise HTTPException(status_code=404, detail="Version not found")
+    
+    graph = get_routing_graph(db, version_id)
+    poi_matrix = get_poi_matrix(db, graph, weight)
+    if poi_matrix is None:
+        raise HTTPException(status_code=409, detail="No current POI distance matrix for this version; publish it again")
+    for poi_id in (from_poi_id, to_poi_id):
+        if poi_id not in poi_matrix.poi_index:
+            raise HTTPException(status_code=404, detail=f"Point of interest {poi_id} is not an active POI of version {version_id}")
+    route = graph.poi_route(poi_matrix, from_poi_id, to_poi_id, weight)
+    if route is None:
+        raise HTTPException(status_code=404, detail=f"No route from POI {from_poi_id} to POI {to_poi_id}")
+    
+    return {"version_id": version_id, "from": from_poi_id, "to": to_poi_id, "weight": weight, **route}
+
+@router.get("/buildings/{building_id}/route")
+async def get_building_route(
+    building_id: int,
+    from_node_id: int = Query(..., alias="from", description="Start routing node id on any published floor"),
+    to_node_id: int = Query(..., alias="to", description="Destination routing node id on any published floor"),
+    weight: str = Query("distance", description="Minimise 'distance' or 'travel_time'"),
+    algorithm: str = Query("dijkstra", description="Search with 'dijkstra' or 'astar'"),
+    db: Session = Depends(get_db)
+):
+    """Shortest route across the published floors of a building, changing floors by elevator or stairs"""
+    _check_route_options(weight, algorithm)
+    if algorithm == "ch":
+        raise HTTPException(status_code=400, detail="Contraction hierarchies are only built per version")
+    if db.query(Building.id).filter(Building.id == building_id).first() is None:
+        raise HTTPException(status_code=404, detail="Building not found")
+    
+    graph = get_building_graph(db, building_id)
+    if graph is None:
+        raise HTTPException(status_code=404, detail="Building has no published floors")
+    route = _find_route(graph, from_node_id, to_node_id, weight, algorithm)
+    return {"building_id": building_id, "from": from_node_id, "to": to_node_id, "weight": weight, **route}
+
+def _check_route_options(weight: str, algorithm: str):
+    if weight not in ROUTE_WEIGHTS:
+        raise HTTPException(status_code=400, detail=f"Unknown route weight '{weight}', expected one of {', '.join(ROUTE_WEIGHTS)}")
+    if algorithm not in ROUTE_ALGORITHMS:
+        raise HTTPException(status_code=400, detail=f"Unknown route algorithm '{algorithm}', expected one of {', '.join(ROUTE_ALGORITHMS)}")
+
+def _find_route(graph, from_node_id: int, to_node_id: int, weight: str, algorithm: str):
+    try:
+        route = graph.shortest_path(from_node_id, to_node_id, weight=weight, algorithm=algorithm)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    if route is None:
+        raise HTTPException(status_code=404, detail=f"No route from node {from_node_id} to node {to_node_id}")
+    return route
@@ -0,0 +1,60 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, BackgroundTasks
+from sqlalchemy.orm import Session
+from typing import List
+from app.database import get_db, run_in_session
+from app.schemas import SurveySession, SurveySessionCreate
+from app.crud import (
+    get_floor,
+    get_survey_session,
+    get_survey_sessions,
+    create_survey_session,
+    activate_survey_session,
+    get_active_survey_session_id,
+    rebuild_access_point_stats,
+    purge_survey_fingerprints
+)
+
+router = APIRouter()
+
+@router.post("/floors/{floor_id}/survey-sessions", response_model=SurveySession)
+async def create_floor_survey_session(floor_id: int, survey_session: SurveySessionCreate, db: Session = Depends(get_db)):
+    """Start collecting fingerprints into a new session while the current one stays live"""
+    if get_floor(db, floor_id=floor_id) is None:
+        raise HTTPException(status_code=404, detail="Floor not found")
+    return create_survey_session(db, floor_id=floor_id, survey_session=survey_session)
+
+@router.get("/floors/{floor_id}/survey-sessions", response_model=List[SurveySession])
+async def read_floor_survey_sessions(floor_id: int, db: Session = Depends(get_db)):
+    """Get a floor's survey sessions with their fingerprint counts"""
+    return get_survey_sessions(db, floor_id=floor_id)
+
+@router.post("/survey-sessions/{survey_session_id}/activate", response_model=SurveySession)
+async def activate_floor_survey_session(
+    survey_session_id: int,
+    background_tasks: BackgroundTasks,
+    purge_previous: bool = Query(False, description="Delete the replaced session's fingerprints in the background"),
+    db: Session = Depends(get_db)
+):
+    """Atomically make a session the floor's live fingerprint set"""
+    survey_session = get_survey_session(db, survey_session_id=survey_session_id)
+    if survey_session is None:
+        raise HTTPException(status_code=404, detail="Survey session not found")
+    if survey_session.status not in ("collecting", "retired", "active"):
+        raise HTTPException(status_code=409, detail=f"Survey session is {survey_session.status}")
+    if survey_session.status != "active":
+        previous_session_id = activate_survey_session(db, survey_session)
+        background_tasks.add_task(run_in_session, db.get_bind(), rebuild_access_point_stats, survey_session.floor_id)
+        if purge_previous:
+            background_tasks.add_task(run_in_session, db.get_bind(), purge_survey_fingerprints, survey_session.floor_id, previous_session_id)
+    return survey_session
+
+@router.delete("/survey-sessions/{survey_session_id}")
+async def purge_floor_survey_session(survey_session_id: int, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    """Delete a session's fingerprints in the background"""
+    survey_session = get_survey_session(db, survey_session_id=survey_session_id)
+    if survey_session is None:
+        raise HTTPException(status_code=404, detail="Survey session not found")
+    if get_active_survey_session_id(db, survey_session.floor_id) == survey_session.id:
+        raise HTTPException(status_code=409, detail="The active survey session cannot be purged; activate another one first")
+    background_tasks.add_task(run_in_session, db.get_bind(), purge_survey_fingerprints, survey_session.floor_id, survey_session.id)
+    return {"message": f"Purging survey session {survey_session_id}"}
@@ -0,0 +1,44 @@
+import json
+from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
+from sqlalchemy.orm import Session
+from pydantic import ValidationError
+from app.database import get_db
+from app.schemas import TrackingScan
+from app.crud import get_compiled_radiomap, get_calibration_table
+from app.tracking import tracking_sessions
+
+router = APIRouter()
+
+@router.websocket("/floors/{floor_id}/track")
+async def track_device(websocket: WebSocket, floor_id: int, device_id: str, db: Session = Depends(get_db)):
+    """Stream scans for one device and receive particle-filter smoothed positions"""
+    await websocket.accept()
+    
+    try:
+        while True:
+            message = await websocket.receive_text()
+            try:
+                scan = TrackingScan(**json.loads(message))
+            except (ValueError, ValidationError, TypeError) as e:
+                await websocket.send_json({"error": f"Invalid scan: {e}"})
+                continue
+            
+            radio_map = get_compiled_radiomap(db, floor_id=floor_id)
+            calibration = get_calibration_table(db).coefficients([scan.device_model])
+            # Do not hold a database transaction open for the lifetime of the socket
+            db.rollback()
+            if radio_map.is_empty:
+                await websocket.send_json({"error": "No fingerprints recorded for this floor"})
+                continue
+            
+            session = tracking_sessions.get(device_id, floor_id)
+            try:
+                position = session.step(radio_map, scan.wifi_scans, timestamp=scan.timestamp, calibration=calibration)
+            except ValueError as e:
+                await websocket.send_json({"error": str(e)})
+                continue
+            tracking_sessions.touch(device_id)
+            
+            await websocket.send_json({"floor_id": floor_id, "device_id": device_id, **position})
+    except WebSocketDisconnect:
+        pass
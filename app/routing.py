@@ -0,0 +1,568 @@
+import io
+import os
+import heapq
+import hashlib
+import math
+from typing import Optional
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import dijkstra
+from scipy.spatial import cKDTree
+from sqlalchemy.orm import Session
+
+from app.localization import RadioMapCache
+from app.contraction import ContractionHierarchy
+from app.models import Floor
+from app.map_models import FloorPlanVersion, PointOfInterest, RoutingNode, RoutingEdge, MapPublishing, RoutingArtifact
+
+# Assumed walking speed for edges without a travel time (m/s)
+WALKING_SPEED_MPS = 1.4
+
+# Zero-length edges (e.g. two nodes of one doorway) get this weight so the sparse
+# matrix keeps them as edges
+MIN_EDGE_WEIGHT = 1e-6
+
+ROUTE_WEIGHTS = ("distance", "travel_time")
+ROUTE_ALGORITHMS = ("dijkstra", "astar", "ch")
+CH_ARTIFACT_KIND = "contraction_hierarchy:{weight}"
+POI_MATRIX_ARTIFACT_KIND = "poi_matrix:{weight}"
+
+# Floor changes in building routes. Connector edges cost the vertical travel plus a fixed
+# penalty in both weights, so routes only change floors when it saves real walking
+CONNECTOR_TYPES = ("elevator", "stairs")
+FLOOR_HEIGHT_M = 4.0
+FLOOR_CHANGE_PENALTY_M = 10.0
+FLOOR_CHANGE_PENALTY_S = {"elevator": 30.0, "stairs": 5.0}  # waiting for the car / entering the stairwell
+CONNECTOR_SECONDS_PER_FLOOR = {"elevator": 3.0, "stairs": 15.0}
+CONNECTOR_MATCH_RADIUS_M = 5.0  # how far apart unnamed connectors on two floors may be
+
+
+class RoutingGraph:
+    """Compressed sparse row adjacency of a version's active routing nodes and edges"""
+
+    def __init__(self, version_id: int, node_ids, coords, distances, travel_times, scale: float = 1.0):
+        self.version_id = version_id
+        self.node_ids = node_ids  # (V,) int64, routing_nodes.id per row/column
+        self.node_index = {int(node_id): i for i, node_id in enumerate(node_ids)}
+        self.coords = coords  # (V, 2) float64, pixel coordinates
+        self.scale = scale or 1.0  # pixels per meter
+        self.distances = distances  # (V, V) CSR, meters
+        self.travel_times = travel_times  # (V, V) CSR with the same sparsity, seconds
+        self._search = {}  # weight -> plain-list adjacency and heuristic factor for A*
+        self.hierarchies = {}  # weight -> ContractionHierarchy loaded for this exact graph
+        self._digests = {}
+        self._tree = None
+
+    @classmethod
+    def from_rows(cls, version_id: int, nodes, edges, scale: float = 1.0):
+        """Compile (id, x, y) nodes and (from_id, to_id, distance, travel_time, is_bidirectional) edges
+
+        Bidirectional edges are stored in both directions; of parallel edges between the same
+        ordered pair the shortest is kept. Edges touching unknown nodes are ignored.
+        """
+        node_ids = np.asarray([node[0] for node in nodes], dtype=np.int64)
+        coords = np.asarray([(node[1], node[2]) for node in nodes], dtype=np.float64).reshape(-1, 2)
+        node_index = {int(node_id): i for i, node_id in enumerate(node_ids)}
+
+        sources, targets, lengths, times = [], [], [], []
+        for from_id, to_id, distance, travel_time, is_bidirectional in edges:
+            u, v = node_index.get(from_id), node_index.get(to_id)
+            if u is None or v is None or u == v:
+                continue
+            seconds = travel_time if travel_time is not None else distance / WALKING_SPEED_MPS
+            pairs = [(u, v), (v, u)] if is_bidirectional or is_bidirectional is None else [(u, v)]
+            for a, b in pairs:
+                sources.append(a)
+                targets.append(b)
+                lengths.append(distance)
+                times.append(seconds)
+
+        sources, targets = np.asarray(sources, dtype=np.int64), np.asarray(targets, dtype=np.int64)
+        lengths = np.maximum(np.asarray(lengths, dtype=np.float64), MIN_EDGE_WEIGHT)
+        times = np.maximum(np.asarray(times, dtype=np.float64), MIN_EDGE_WEIGHT)
+
+        # Keep the shortest of parallel edges: sort by (pair, length) and take each pair's first
+        order = np.lexsort((lengths, targets, sources))
+        sources, targets, lengths, times = sources[order], targets[order], lengths[order], times[order]
+        first = np.ones(len(sources), dtype=bool)
+        first[1:] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])
+
+        shape = (len(node_ids), len(node_ids))
+        return cls(
+            version_id=version_id,
+            node_ids=node_ids,
+            coords=coords,
+            distances=sparse.csr_matrix((lengths[first], (sources[first], targets[first])), shape=shape),
+            travel_times=sparse.csr_matrix((times[first], (sources[first], targets[first])), shape=shape),
+            scale=scale,
+        )
+
+    @property
+    def cache_key(self):
+        """Key of this graph in routing_graph_cache"""
+        return self.version_id
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory footprint including search lists and attached hierarchies, used for cache accounting"""
+        matrices = (self.distances, self.travel_times)
+        arrays = sum(m.data.nbytes + m.indices.nbytes + m.indptr.nbytes for m in matrices)
+        # A list item is a pointer plus, for most of them, a boxed int or float
+        search = sum(32 * len(values) for arrays in self._search.values() for values in arrays[:5])
+        hierarchies = sum(hierarchy.nbytes for hierarchy in self.hierarchies.values())
+        return arrays + self.node_ids.nbytes + self.coords.nbytes + 100 * len(self.node_index) + search + hierarchies
+
+    def attach_hierarchy(self, weight: str, hierarchy: ContractionHierarchy):
+        """Attach a hierarchy built or loaded for this graph and re-count the cache entry"""
+        self.hierarchies[weight] = hierarchy
+        routing_graph_cache.resize(self.cache_key, self)
+
+    def poi_route(self, poi_matrix: "POIDistanceMatrix", from_poi_id: int, to_poi_id: int, weight: str):
+        """Route between two POIs from their precomputed tables; None when unreachable
+
+        The cost in the route's weight is the stored table entry; the path is walked along
+        the next-hop table. Raises KeyError for POIs that are not in the tables.
+        """
+        rows = poi_matrix.path_rows(from_poi_id, to_poi_id)
+        if rows is None:
+            return None
+        route = self._route(rows)
+        route[weight] = round(poi_matrix.cost(from_poi_id, to_poi_id), 3)
+        return route
+
+    def shortest_path(self, from_node_id: int, to_node_id: int, weight: str = "distance", algorithm: str = "dijkstra"):
+        """Cheapest path between two node ids with A* or Dijkstra; None when unreachable
+
+        Raises KeyError for node ids that are not active nodes of this version.
+        """
+        source, target = self._index(from_node_id), self._index(to_node_id)
+        if algorithm == "ch":
+            rows = self.hierarchies[weight].shortest_path(source, target)
+            return self._route(rows) if rows is not None else None
+        if algorithm == "astar":
+            predecessors, _ = self._astar(source, target, weight)
+        else:
+            matrix = self.distances if weight == "distance" else self.travel_times
+            _, predecessors = dijkstra(matrix, directed=True, indices=source, return_predecessors=True)
+        if source != target and predecessors[target] < 0:
+            return None
+
+        rows = [target]
+        while rows[-1] != source:
+            rows.append(int(predecessors[rows[-1]]))
+        rows.reverse()
+        return self._route(rows)
+
+    def _astar(self, source: int, target: int, weight: str):
+        """A* over the CSR rows with a binary heap; returns (predecessors, expanded node count)
+
+        The heuristic is the straight-line distance in meters times the smallest cost per
+        straight-line meter of any edge, so it stays admissible when authored edge lengths
+        are shorter than the drawn geometry and when costs are seconds.
+        """
+        indptr, indices, costs, xs, ys, cost_per_meter = self._search_arrays(weight)
+        goal_x, goal_y = xs[target], ys[target]
+
+        g_score = [math.inf] * len(xs)
+        predecessors = [-1] * len(xs)
+        closed = [False] * len(xs)
+        g_score[source] = 0.0
+        heap = [(cost_per_meter * math.hypot(xs[source] - goal_x, ys[source] - goal_y), source)]
+        expanded = 0
+        while heap:
+            _, u = heapq.heappop(heap)
+            if closed[u]:
+                continue
+            closed[u] = True
+            expanded += 1
+            if u == target:
+                break
+            g_u = g_score[u]
+            for k in range(indptr[u], indptr[u + 1]):
+                v = indices[k]
+                tentative = g_u + costs[k]
+                if tentative < g_score[v]:
+                    g_score[v] = tentative
+                    predecessors[v] = u
+                    h = cost_per_meter * math.hypot(xs[v] - goal_x, ys[v] - goal_y)
+                    heapq.heappush(heap, (tentative + h, v))
+        return predecessors, expanded
+
+    def nearest_rows(self, points):
+        """Row of the node nearest to each (x, y) point, in the same units as coords"""
+        if self._tree is None:
+            self._tree = cKDTree(self.coords)
+        return self._tree.query(points)[1]
+
+    def digest(self, weight: str) -> str:
+        """Hash of the nodes and weighted edges, so precomputed artifacts can tell they are current"""
+        if weight not in self._digests:
+            matrix = self.distances if weight == "distance" else self.travel_times
+            digest = hashlib.sha1(self.node_ids.tobytes())
+            for array in (matrix.indptr, matrix.indices, matrix.data):
+                digest.update(np.ascontiguousarray(array).tobytes())
+            self._digests[weight] = digest.hexdigest()
+        return self._digests[weight]
+
+    def _search_arrays(self, weight: str):
+        # Plain lists index much faster than numpy scalars inside the Python search loop
+        arrays = self._search.get(weight)
+        if arrays is None:
+            matrix = self.distances if weight == "distance" else self.travel_times
+            meters = self.coords / self.scale
+            coo = matrix.tocoo()
+            straight = np.hypot(*(meters[coo.row] - meters[coo.col]).T)
+            ratios = coo.data[straight > 0] / straight[straight > 0]
+            cost_per_meter = float(ratios.min()) if len(ratios) else 0.0
+            arrays = (
+                matrix.indptr.tolist(), matrix.indices.tolist(), matrix.data.tolist(),
+                meters[:, 0].tolist(), meters[:, 1].tolist(), cost_per_meter
+            )
+            self._search[weight] = arrays
+            routing_graph_cache.resize(self.cache_key, self)
+        return arrays
+
+    def _index(self, node_id: int) -> int:
+        index = self.node_index.get(node_id)
+        if index is None:
+            raise KeyError(f"Routing node {node_id} is not an active node of version {self.version_id}")
+        return index
+
+    def _route(self, rows):
+        sources, targets = rows[:-1], rows[1:]
+        distances = np.asarray(self.distances[sources, targets]).ravel() if sources else np.zeros(0)
+        travel_times = np.asarray(self.travel_times[sources, targets]).ravel() if sources else np.zeros(0)
+        return {
+            "path": [int(self.node_ids[row]) for row in rows],
+            "distance": round(float(distances.sum()), 3),
+            "travel_time": round(float(travel_times.sum()), 3),
+        }
+
+
+class POIDistanceMatrix:
+    """Shortest costs between a version's POIs plus, for every node, the next hop toward each POI
+
+    POIs are attached to the routing node nearest to them. A POI-to-POI route is one
+    table lookup for the cost and a walk along next_hops for the path. next_hops is P x V,
+    so it is stored in the narrowest integer type that holds a row index.
+    """
+
+    def __init__(self, digest: str, graph_digest: str, poi_ids, poi_rows, costs, next_hops):
+        self.digest = digest  # graph digest combined with the POI attachment
+        self.graph_digest = graph_digest  # RoutingGraph.digest() of the graph it was built on
+        self.poi_ids = poi_ids  # (P,) int64
+        self.poi_rows = poi_rows  # (P,) int64 graph row each POI is attached to
+        self.costs = costs  # (P, P) float32, inf when unreachable
+        self.next_hops = next_hops  # (P, V) int16 or int32, next row toward POI j from row v, -1 if none
+        self.poi_index = {int(poi_id): i for i, poi_id in enumerate(poi_ids)}
+
+    @classmethod
+    def build(cls, graph: RoutingGraph, weight: str, poi_ids, poi_rows, digest: str):
+        matrix = graph.distances if weight == "distance" else graph.travel_times
+        # Searching the transposed graph from each POI yields costs *to* it, and each node's
+        # predecessor in that search is its next hop toward the POI
+        to_poi, predecessors = dijkstra(matrix.T.tocsr(), directed=True, indices=poi_rows, return_predecessors=True)
+        row_dtype = np.int16 if matrix.shape[0] <= np.iinfo(np.int16).max else np.int32
+        return cls(
+            digest,
+            graph.digest(weight),
+            np.asarray(poi_ids, dtype=np.int64),
+            np.asarray(poi_rows, dtype=np.int64),
+            to_poi[:, poi_rows].T.astype(np.float32),
+            np.where(predecessors < 0, -1, predecessors).astype(row_dtype),
+        )
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self.poi_ids, self.poi_rows, self.costs, self.next_hops)
+        return sum(array.nbytes for array in arrays) + 100 * len(self.poi_index)
+
+    def cost(self, from_poi_id: int, to_poi_id: int) -> float:
+        """Stored cost from one POI to another, inf when unreachable"""
+        return float(self.costs[self.poi_index[from_poi_id], self.poi_index[to_poi_id]])
+
+    def path_rows(self, from_poi_id: int, to_poi_id: int):
+        """Graph rows from one POI's node to another's; None when unreachable"""
+        i, j = self.poi_index[from_poi_id], self.poi_index[to_poi_id]
+        target = int(self.poi_rows[j])
+        rows = [int(self.poi_rows[i])]
+        hops = self.next_hops[j]
+        while rows[-1] != target:
+            row = int(hops[rows[-1]])
+            if row < 0:
+                return None
+            rows.append(row)
+        return rows
+
+    def to_bytes(self) -> bytes:
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer, digest=np.array(self.digest), graph_digest=np.array(self.graph_digest), poi_ids=self.poi_ids,
+            poi_rows=self.poi_rows, costs=self.costs, next_hops=self.next_hops
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, payload: bytes):
+        with np.load(io.BytesIO(payload)) as data:
+            return cls(
+                str(data["digest"]), str(data["graph_digest"]),
+                data["poi_ids"], data["poi_rows"], data["costs"], data["next_hops"]
+            )
+
+
+class BuildingGraph(RoutingGraph):
+    """Routing graph stitching the currently published version of every floor of a building
+
+    Coordinates are in meters (scale 1.0) because floors are drawn at different scales.
+    """
+
+    def __init__(self, building_id: int, signature, node_floors, **graph):
+        super().__init__(version_id=None, **graph)
+        self.building_id = building_id
+        self.signature = signature  # ((floor_id, version_id, version generation), ...) it was built from
+        self.node_floors = node_floors  # (V,) floor id per row
+
+    @property
+    def cache_key(self):
+        return ("building", self.building_id)
+
+    @property
+    def nbytes(self) -> int:
+        return super().nbytes + self.node_floors.nbytes
+
+    def _index(self, node_id: int) -> int:
+        index = self.node_index.get(node_id)
+        if index is None:
+            raise KeyError(f"Routing node {node_id} is not on a published floor of building {self.building_id}")
+        return index
+
+    def _route(self, rows):
+        route = super()._route(rows)
+        floors = [int(self.node_floors[row]) for row in rows]
+        route["floors"] = floors
+        route["floor_changes"] = sum(a != b for a, b in zip(floors, floors[1:]))
+        return route
+
+
+def connector_edges(floors, connectors):
+    """Edges linking elevator and stair nodes of different floors
+
+    floors is [(floor_id, floor_number)] and connectors maps floor_id to
+    [(node_id, x_m, y_m, kind, name)]. Connectors with the same name are linked; unnamed
+    ones are linked to the nearest connector of the same kind within
+    CONNECTOR_MATCH_RADIUS_M, assuming the floor plans share one frame. Elevators link
+    every pair of floors they serve, stairs only neighbouring floors.
+    """
+    edges = []
+    for i, (lower_id, lower_number) in enumerate(floors):
+        for upper_id, upper_number in floors[i + 1:]:
+            levels = abs(upper_number - lower_number)
+            for kind in CONNECTOR_TYPES:
+                if kind == "stairs" and upper_id != floors[i + 1][0]:
+                    continue
+                lower = [c for c in connectors.get(lower_id, []) if c[3] == kind]
+                upper = [c for c in connectors.get(upper_id, []) if c[3] == kind]
+                if not lower or not upper:
+                    continue
+                distance = levels * FLOOR_HEIGHT_M + FLOOR_CHANGE_PENALTY_M
+                seconds = FLOOR_CHANGE_PENALTY_S[kind] + levels * CONNECTOR_SECONDS_PER_FLOOR[kind]
+
+                named = {c[4]: c[0] for c in upper if c[4] is not None}
+                tree = cKDTree([(c[1], c[2]) for c in upper])
+                for node_id, x, y, _, name in lower:
+                    if name is not None:
+                        match = named.get(name)
+                    else:
+                        gap, j = tree.query((x, y))
+                        match = upper[j][0] if gap <= CONNECTOR_MATCH_RADIUS_M and upper[j][4] is None else None
+                    if match is not None:
+                        edges.append((node_id, match, distance, seconds, True))
+    return edges
+
+
+def get_routing_graph(db: Session, version_id: int) -> RoutingGraph:
+    """Compiled routing graph of a version, built from the node and edge tables on a cache miss"""
+    graph = routing_graph_cache.get(version_id)
+    if graph is not None:
+        return graph
+
+    generation = routing_graph_cache.generation(version_id)
+    scale = db.query(FloorPlanVersion.scale).filter(FloorPlanVersion.id == version_id).scalar()
+    nodes = db.query(RoutingNode.id, RoutingNode.x_coordinate, RoutingNode.y_coordinate).filter(
+        RoutingNode.version_id == version_id, RoutingNode.is_active == True
+    ).order_by(RoutingNode.id).all()
+    edges = db.query(
+        RoutingEdge.from_node_id, RoutingEdge.to_node_id, RoutingEdge.distance,
+        RoutingEdge.travel_time, RoutingEdge.is_bidirectional
+    ).filter(RoutingEdge.version_id == version_id, RoutingEdge.is_active == True).all()
+    graph = RoutingGraph.from_rows(version_id, nodes, edges, scale=scale or 1.0)
+    routing_graph_cache.put(version_id, graph, generation)
+    return graph
+
+
+def get_building_graph(db: Session, building_id: int) -> Optional[BuildingGraph]:
+    """Stitched graph of a building's published floors; None when no floor has a published version
+
+    The cached graph is reused until a floor's current version changes or a published
+    version's graph is edited (which bumps its routing_graph_cache generation).
+    """
+    published = db.query(Floor.id, Floor.floor_number, FloorPlanVersion.id, FloorPlanVersion.scale).join(
+        MapPublishing, MapPublishing.floor_id == Floor.id
+    ).join(FloorPlanVersion, FloorPlanVersion.id == MapPublishing.version_id).filter(
+        Floor.building_id == building_id, MapPublishing.is_current == True
+    ).order_by(Floor.floor_number, Floor.id).all()
+    if not published:
+        return None
+    signature = tuple(
+        (floor_id, version_id, routing_graph_cache.generation(version_id)) for floor_id, _, version_id, _ in published
+    )
+
+    key = ("building", building_id)
+    graph = routing_graph_cache.get(key)
+    if graph is not None and graph.signature == signature:
+        return graph
+
+    generation = routing_graph_cache.generation(key)
+    floor_of = {version_id: (floor_id, scale or 1.0) for floor_id, _, version_id, scale in published}
+    node_rows = db.query(
+        RoutingNode.id, RoutingNode.version_id, RoutingNode.x_coordinate, RoutingNode.y_coordinate,
+        RoutingNode.node_type, RoutingNode.properties
+    ).filter(RoutingNode.version_id.in_(floor_of), RoutingNode.is_active == True).order_by(RoutingNode.id).all()
+    edges = db.query(
+        RoutingEdge.from_node_id, RoutingEdge.to_node_id, RoutingEdge.distance,
+        RoutingEdge.travel_time, RoutingEdge.is_bidirectional, RoutingEdge.edge_type
+    ).filter(RoutingEdge.version_id.in_(floor_of), RoutingEdge.is_active == True).all()
+
+    # Elevator and stair nodes: typed as such, or only reached through elevator/stairs edges
+    # (the corridor node in front of a lift also touches walkways, so it is not one)
+    edge_kinds = {}
+    for from_id, to_id, _, _, _, edge_type in edges:
+        for node_id in (from_id, to_id):
+            edge_kinds.setdefault(node_id, set()).add(edge_type)
+
+    nodes, node_floors, connectors = [], [], {}
+    for node_id, version_id, x, y, node_type, properties in node_rows:
+        floor_id, scale = floor_of[version_id]
+        nodes.append((node_id, x / scale, y / scale))
+        node_floors.append(floor_id)
+        kinds = edge_kinds.get(node_id, set())
+        kind = node_type if node_type in CONNECTOR_TYPES else (min(kinds) if kinds and kinds <= set(CONNECTOR_TYPES) else None)
+        if kind is not None:
+            name = (properties or {}).get("connector")
+            connectors.setdefault(floor_id, []).append((node_id, x / scale, y / scale, kind, name))
+
+    floors = [(floor_id, floor_number) for floor_id, floor_number, _, _ in published]
+    stitched = [edge[:5] for edge in edges] + connector_edges(floors, connectors)
+    base = RoutingGraph.from_rows(None, nodes, stitched)
+    graph = BuildingGraph(
+        building_id, signature, np.asarray(node_floors, dtype=np.int64),
+        node_ids=base.node_ids, coords=base.coords, distances=base.distances, travel_times=base.travel_times
+    )
+    routing_graph_cache.put(key, graph, generation)
+    return graph
+
+
+def build_contraction_hierarchies(db: Session, version_id: int):
+    """Contract the version's graph for every route weight and store the hierarchies with it
+
+    Takes minutes on large graphs and holds the GIL throughout, so it is run by
+    build_contraction_hierarchies.py rather than by the API.
+    """
+    graph = get_routing_graph(db, version_id)
+    for weight in ROUTE_WEIGHTS:
+        matrix = graph.distances if weight == "distance" else graph.travel_times
+        hierarchy = ContractionHierarchy.build(matrix, graph.digest(weight))
+        _store_artifact(db, version_id, CH_ARTIFACT_KIND.format(weight=weight), hierarchy.digest, hierarchy.to_bytes())
+        graph.attach_hierarchy(weight, hierarchy)
+
+def get_contraction_hierarchy(db: Session, graph: RoutingGraph, weight: str) -> Optional[ContractionHierarchy]:
+    """The stored hierarchy for a graph and weight; None if never built or built before the last edit"""
+    hierarchy = graph.hierarchies.get(weight)
+    if hierarchy is not None:
+        return hierarchy
+    payload = _load_artifact(db, graph.version_id, CH_ARTIFACT_KIND.format(weight=weight), graph.digest(weight))
+    if payload is None:
+        return None
+    hierarchy = ContractionHierarchy.from_bytes(payload)
+    graph.attach_hierarchy(weight, hierarchy)
+    return hierarchy
+
+def _poi_attachment(db: Session, graph: RoutingGraph):
+    """Active POIs of the graph's version and the row of the node nearest each"""
+    pois = db.query(PointOfInterest.id, PointOfInterest.x_coordinate, PointOfInterest.y_coordinate).filter(
+        PointOfInterest.version_id == graph.version_id, PointOfInterest.is_active == True
+    ).order_by(PointOfInterest.id).all()
+    if not pois or not len(graph.node_ids):
+        return [], []
+    return [poi_id for poi_id, _, _ in pois], graph.nearest_rows([(x, y) for _, x, y in pois]).tolist()
+
+def _poi_digest(graph: RoutingGraph, weight: str, poi_ids, poi_rows) -> str:
+    digest = hashlib.sha1(graph.digest(weight).encode())
+    digest.update(np.asarray([poi_ids, poi_rows], dtype=np.int64).tobytes())
+    return digest.hexdigest()
+
+def build_poi_matrices(db: Session, version_id: int):
+    """Compute and store the POI-to-POI cost and next-hop tables of a version for every route weight"""
+    graph = get_routing_graph(db, version_id)
+    generations = {weight: poi_matrix_cache.generation((version_id, weight)) for weight in ROUTE_WEIGHTS}
+    poi_ids, poi_rows = _poi_attachment(db, graph)
+    if not poi_ids:
+        return
+    for weight in ROUTE_WEIGHTS:
+        digest = _poi_digest(graph, weight, poi_ids, poi_rows)
+        poi_matrix = POIDistanceMatrix.build(graph, weight, poi_ids, poi_rows, digest)
+        _store_artifact(db, version_id, POI_MATRIX_ARTIFACT_KIND.format(weight=weight), digest, poi_matrix.to_bytes())
+        poi_matrix_cache.put((version_id, weight), poi_matrix, generations[weight])
+
+def get_poi_matrix(db: Session, graph: RoutingGraph, weight: str) -> Optional[POIDistanceMatrix]:
+    """The stored POI tables for a graph and weight; None if never built or POIs/graph changed since
+
+    Tables are cached apart from the graph so a large one never evicts it. A cached table
+    built on this graph is current, since POI edits drop it (invalidate_poi_matrices), so
+    only a miss reads the POIs.
+    """
+    key = (graph.version_id, weight)
+    poi_matrix = poi_matrix_cache.get(key)
+    if poi_matrix is not None and poi_matrix.graph_digest == graph.digest(weight):
+        return poi_matrix
+    generation = poi_matrix_cache.generation(key)
+    poi_ids, poi_rows = _poi_attachment(db, graph)
+    if not poi_ids:
+        return None
+    digest = _poi_digest(graph, weight, poi_ids, poi_rows)
+    payload = _load_artifact(db, graph.version_id, POI_MATRIX_ARTIFACT_KIND.format(weight=weight), digest)
+    if payload is None:
+        return None
+    poi_matrix = POIDistanceMatrix.from_bytes(payload)
+    poi_matrix_cache.put(key, poi_matrix, generation)
+    return poi_matrix
+
+def invalidate_poi_matrices(version_id: int):
+    """Drop a version's cached POI tables after its POIs changed"""
+    for weight in ROUTE_WEIGHTS:
+        poi_matrix_cache.invalidate((version_id, weight))
+
+def _store_artifact(db: Session, version_id: int, kind: str, digest: str, payload: bytes):
+    artifact = db.query(RoutingArtifact).filter(
+        RoutingArtifact.version_id == version_id, RoutingArtifact.kind == kind
+    ).first()
+    if artifact is None:
+        artifact = RoutingArtifact(version_id=version_id, kind=kind)
+        db.add(artifact)
+    artifact.payload = payload
+    artifact.digest = digest
+    db.commit()
+
+def _load_artifact(db: Session, version_id: int, kind: str, digest: str) -> Optional[bytes]:
+    return db.query(RoutingArtifact.payload).filter(
+        RoutingArtifact.version_id == version_id, RoutingArtifact.kind == kind, RoutingArtifact.digest == digest
+    ).scalar()
+
+
+# Same generation-guarded LRU as compiled radio maps, keyed by version id for floor
+# graphs and ("building", building_id) for stitched building graphs
+routing_graph_cache = RadioMapCache(max_bytes=int(os.getenv("ROUTING_GRAPH_CACHE_MAX_BYTES", 64 * 1024 * 1024)))
+# POI-to-POI tables keyed by (version_id, weight); next_hops grows with POIs x nodes, so
+# they get their own budget instead of sharing the graphs'
+poi_matrix_cache = RadioMapCache(max_bytes=int(os.getenv("POI_MATRIX_CACHE_MAX_BYTES", 128 * 1024 * 1024)))
@@ -44,6 +44,8 @@ class Floor(FloorBase):
 class WifiScan(BaseModel):
     bssid: str
     rssi: float
+    rssi_std: Optional[float] = Field(None, description="Set on aggregated reference points")
+    count: Optional[int] = Field(None, description="Readings aggregated into rssi, set on aggregated reference points")
 
 class FingerprintBase(BaseModel):
     floor_id: int
@@ -51,6 +53,7 @@ class FingerprintBase(BaseModel):
     y: float = Field(..., description="Ground truth y position in meters")
     device_model: Optional[str] = None
     wifi_scans: List[WifiScan]
+    survey_session_id: Optional[int] = Field(None, description="Defaults to the floor's active survey session")
 
 class FingerprintCreate(FingerprintBase):
     pass
@@ -68,14 +71,110 @@ class FingerprintBatch(BaseModel):
 
 # Radio map response for localization
 class RadioMapPoint(BaseModel):
+    id: Optional[int] = None
     x: float
     y: float
     wifi_scans: List[WifiScan]
 
 class RadioMap(BaseModel):
     floor_id: int
+    revision: Optional[int] = None
     points: List[RadioMapPoint]
 
+class RadioMapDelta(BaseModel):
+    floor_id: int
+    since: int
+    revision: int
+    full: bool = Field(False, description="True when added is a full snapshot replacing the client's copy")
+    added: List[RadioMapPoint]
+    removed: List[int]
+
+class AccessPointStatistics(BaseModel):
+    bssid: str
+    sample_count: int
+    rssi_mean: float
+    rssi_std: float
+    min_x: float
+    max_x: float
+    min_y: float
+    max_y: float
+
+# Survey sessions
+class SurveySessionCreate(BaseModel):
+    name: Optional[str] = None
+
+class SurveySession(SurveySessionCreate):
+    id: int
+    floor_id: int
+    status: str
+    created_at: Optional[datetime] = None
+    activated_at: Optional[datetime] = None
+    fingerprint_count: Optional[int] = None
+    
+    class Config:
+        from_attributes = True
+
+# Localization
+class ScanQuery(BaseModel):
+    wifi_scans: List[WifiScan]
+    device_model: Optional[str] = Field(None, description="Applies the model's RSSI calibration when known")
+
+class LocateRequest(ScanQuery):
+    k: int = Field(3, ge=1, le=50, description="Number of nearest reference points to average")
+    engine: Optional[str] = Field(None, description="Override the floor's matching engine")
+
+class BatchLocateRequest(BaseModel):
+    scans: List[ScanQuery] = Field(..., max_length=10000)
+    k: int = Field(3, ge=1, le=50, description="Number of nearest reference points to average")
+    engine: Optional[str] = Field(None, description="Override the floor's matching engine")
+
+class LocationEstimate(BaseModel):
+    floor_id: int
+    x: Optional[float] = None  # None when the scan shares no AP with the radio map
+    y: Optional[float] = None
+    confidence: float = Field(..., description="0..1, combines AP coverage and signal match quality")
+    neighbors: List[int] = Field(default_factory=list, description="Fingerprint ids used for the estimate")
+    engine: Optional[str] = None
+
+class DetectLocateRequest(LocateRequest):
+    building_id: Optional[int] = Field(None, description="Restrict floor detection to one building")
+
+class FloorCandidate(BaseModel):
+    building_id: int
+    floor_id: int
+    score: float
+
+class PositionEstimate(LocationEstimate):
+    building_id: int
+    floor_score: float
+    candidates: List[FloorCandidate] = []
+
+class TrackingScan(ScanQuery):
+    timestamp: Optional[float] = Field(None, description="Scan time in seconds; server time when omitted")
+
+class BatchLocationEstimate(BaseModel):
+    floor_id: int
+    estimates: List[LocationEstimate]
+
+class LocalizationSettingsBase(BaseModel):
+    engine: str = Field("wknn", description="Matching engine: 'wknn' (brute force), 'kdtree', 'gaussian' or 'grid'")
+
+class LocalizationSettings(LocalizationSettingsBase):
+    floor_id: int
+    
+    class Config:
+        from_attributes = True
+
+class DeviceCalibration(BaseModel):
+    device_model: str
+    scale: float
+    offset: float
+    sample_count: int
+    updated_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
 # Access Point schemas
 class AccessPointBase(BaseModel):
     bssid: str
@@ -0,0 +1,142 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+from scipy.spatial import cKDTree
+from typing import Optional
+
+from app.localization import RadioMapMatrix, MISSING_RSSI, wknn_locate_queries
+
+PARTICLE_COUNT = 500
+INITIAL_SPREAD_M = 3.0  # std of the particle cloud around the first WKNN fix
+MOTION_SIGMA_M = 1.0  # random-walk std per second of elapsed time
+MEASUREMENT_SIGMA_DB = 6.0  # per-AP RMS signal mismatch treated as one standard deviation
+MAX_STEP_SECONDS = 10.0
+
+SESSION_IDLE_TIMEOUT_S = float(os.getenv("TRACKING_SESSION_IDLE_TIMEOUT", 300))
+MAX_TRACKING_SESSIONS = int(os.getenv("MAX_TRACKING_SESSIONS", 10000))
+
+
+class ParticleFilter:
+    """Per-device particle filter over (x, y) using the floor's fingerprints as measurement model"""
+
+    def __init__(self, floor_id: int, count: int = PARTICLE_COUNT, rng=None):
+        self.floor_id = floor_id
+        self.count = count
+        self.rng = rng or np.random.default_rng()
+        self.particles = None  # (P, 2) meters
+        self.weights = np.full(count, 1.0 / count)
+        self.last_timestamp = None
+        self._tree = None
+        self._tree_map = None
+
+    def step(self, radio_map: RadioMapMatrix, wifi_scans, timestamp: Optional[float] = None, calibration=None):
+        """Apply motion and measurement updates for one scan; returns the smoothed position"""
+        now = timestamp if timestamp is not None else time.time()
+        queries, known, coverage = radio_map.project([wifi_scans], calibration)
+
+        if self.particles is None:
+            fix = wknn_locate_queries(radio_map, queries, known, coverage)[0]
+            if fix["x"] is None:
+                raise ValueError("Scan shares no access points with the floor radio map")
+            self.particles = self.rng.normal((fix["x"], fix["y"]), INITIAL_SPREAD_M, size=(self.count, 2))
+        else:
+            elapsed = min(max(now - self.last_timestamp, 0.0), MAX_STEP_SECONDS)
+            self.particles += self.rng.normal(0.0, MOTION_SIGMA_M * np.sqrt(max(elapsed, 0.1)), size=(self.count, 2))
+            if known[0] > 0:
+                self._reweight(radio_map, queries[0])
+        self.last_timestamp = now
+
+        # Keep particles on the surveyed area
+        low, high = radio_map.coords.min(axis=0), radio_map.coords.max(axis=0)
+        np.clip(self.particles, low, high, out=self.particles)
+
+        return self.estimate()
+
+    def estimate(self):
+        mean = self.weights @ self.particles
+        spread = np.sqrt(self.weights @ ((self.particles - mean) ** 2).sum(axis=1))
+        return {
+            "x": float(mean[0]),
+            "y": float(mean[1]),
+            "spread": round(float(spread), 3),
+            "effective_particles": round(float(1.0 / (self.weights ** 2).sum()), 1),
+        }
+
+    def _reweight(self, radio_map: RadioMapMatrix, query):
+        # Per-AP RMS mismatch between the scan and every reference point, in one pass
+        shifted = query - np.float32(MISSING_RSSI)
+        squared = float(shifted @ shifted) + radio_map.shifted_sq - 2.0 * (radio_map.shifted @ shifted)
+        heard = radio_map.rssi > MISSING_RSSI
+        query_cols = np.flatnonzero(query > MISSING_RSSI)
+        active = heard.sum(axis=1) + len(query_cols) - heard[:, query_cols].sum(axis=1)
+        rms = np.sqrt(np.maximum(squared, 0.0) / np.maximum(active, 1))
+
+        # Each particle is scored by the reference point it stands closest to
+        log_likelihood = -0.5 * (rms[self._nearest_rows(radio_map)] / MEASUREMENT_SIGMA_DB) ** 2
+        weights = self.weights * np.exp(log_likelihood - log_likelihood.max())
+        self.weights = weights / weights.sum()
+
+        if 1.0 / (self.weights ** 2).sum() < self.count / 2:
+            self._resample()
+
+    def _nearest_rows(self, radio_map: RadioMapMatrix):
+        if self._tree_map is not radio_map:
+            self._tree = cKDTree(radio_map.coords)
+            self._tree_map = radio_map
+        return self._tree.query(self.particles)[1]
+
+    def _resample(self):
+        # Systematic resampling
+        positions = (self.rng.random() + np.arange(self.count)) / self.count
+        indexes = np.minimum(np.searchsorted(np.cumsum(self.weights), positions), self.count - 1)
+        self.particles = self.particles[indexes]
+        self.weights = np.full(self.count, 1.0 / self.count)
+
+
+class TrackingSessionStore:
+    """Particle filters keyed by device id, expired after SESSION_IDLE_TIMEOUT_S without scans"""
+
+    def __init__(self, idle_timeout: float = SESSION_IDLE_TIMEOUT_S, max_sessions: int = MAX_TRACKING_SESSIONS):
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()  # device_id -> (ParticleFilter, last_used)
+        self._lock = threading.Lock()
+
+    def get(self, device_id: str, floor_id: int) -> ParticleFilter:
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._sessions.pop(device_id, None)
+            session = entry[0] if entry else None
+            # Moving to another floor starts a fresh track
+            if session is None or session.floor_id != floor_id:
+                session = ParticleFilter(floor_id)
+            self._sessions[device_id] = (session, now)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return session
+
+    def touch(self, device_id: str):
+        with self._lock:
+            entry = self._sessions.get(device_id)
+            if entry is not None:
+                self._sessions[device_id] = (entry[0], time.monotonic())
+                self._sessions.move_to_end(device_id)
+
+    def __len__(self):
+        with self._lock:
+            self._expire(time.monotonic())
+            return len(self._sessions)
+
+    def _expire(self, now: float):
+        # Least recently used first, so stop at the first live session
+        while self._sessions:
+            device_id, (_, last_used) = next(iter(self._sessions.items()))
+            if now - last_used < self.idle_timeout:
+                break
+            del self._sessions[device_id]
+
+
+tracking_sessions = TrackingSessionStore()
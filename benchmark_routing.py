@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Compare Dijkstra, A* and contraction hierarchy route search on synthetic floor-sized routing graphs
+"""
+
+import os
+import sys
+import time
+import argparse
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+from app.routing import RoutingGraph
+from app.contraction import ContractionHierarchy
+
+SCALE = 10.0  # pixels per meter
+SPACING_M = 2.0
+
+def build_grid(size: int, rng):
+    """size x size corridor grid with jittered nodes and a few missing edges, like a large floor"""
+    nodes = []
+    for col in range(size):
+        for row in range(size):
+            x, y = (np.array([col, row]) + rng.uniform(-0.2, 0.2, 2)) * SPACING_M * SCALE
+            nodes.append((col * size + row + 1, float(x), float(y)))
+    coords = {node_id: (x, y) for node_id, x, y in nodes}
+
+    edges = []
+    for col in range(size):
+        for row in range(size):
+            node_id = col * size + row + 1
+            for neighbor in ((col + 1, row), (col, row + 1)):
+                if neighbor[0] >= size or neighbor[1] >= size or rng.random() < 0.1:
+                    continue
+                other = neighbor[0] * size + neighbor[1] + 1
+                (x1, y1), (x2, y2) = coords[node_id], coords[other]
+                distance = float(np.hypot(x2 - x1, y2 - y1)) / SCALE
+                edges.append((node_id, other, distance, None, True))
+    return RoutingGraph.from_rows(0, nodes, edges, scale=SCALE)
+
+def benchmark(size: int, queries: int, seed: int, hierarchy: bool):
+    rng = np.random.default_rng(seed)
+    graph = build_grid(size, rng)
+    pairs = rng.choice(graph.node_ids, size=(queries, 2))
+    # Build the A* adjacency lists once, as a cached graph would have them
+    graph._search_arrays("distance")
+
+    timings = {"dijkstra": 0.0, "astar": 0.0}
+    if hierarchy:
+        start = time.perf_counter()
+        graph.hierarchies["distance"] = ContractionHierarchy.build(graph.distances, graph.digest("distance"))
+        build_seconds = time.perf_counter() - start
+        timings["ch"] = 0.0
+    expanded, mismatches, unreachable = 0, 0, 0
+    for from_id, to_id in pairs:
+        results = {}
+        for algorithm in timings:
+            start = time.perf_counter()
+            results[algorithm] = graph.shortest_path(int(from_id), int(to_id), algorithm=algorithm)
+            timings[algorithm] += time.perf_counter() - start
+        if results["dijkstra"] is None:
+            unreachable += 1
+            continue
+        if any(abs(results["dijkstra"]["distance"] - route["distance"]) > 1e-3 for route in results.values()):
+            mismatches += 1
+        expanded += graph._astar(graph._index(int(from_id)), graph._index(int(to_id)), "distance")[1]
+
+    routed = max(queries - unreachable, 1)
+    print(f"{size}x{size} grid: {len(graph.node_ids)} nodes, {graph.distances.nnz} directed edges, {queries} queries")
+    for algorithm, seconds in timings.items():
+        print(f"  {algorithm:<8} {1000 * seconds / queries:8.2f} ms/query")
+    if hierarchy:
+        print(f"  contraction took {build_seconds:.1f} s and added {len(graph.hierarchies['distance'].shortcuts)} shortcuts")
+    print(f"  A* expanded {expanded / routed:.0f} nodes/query on average "
+          f"({100 * expanded / routed / len(graph.node_ids):.1f}% of the graph; Dijkstra settles all reachable nodes)")
+    print(f"  {unreachable} unreachable pairs, {mismatches} distance mismatches")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 100, 200])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ch", action="store_true", help="also build and query contraction hierarchies (slow to build)")
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        benchmark(size, args.queries, args.seed, args.ch)
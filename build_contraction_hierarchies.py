@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Precompute contraction hierarchies for the 'ch' route algorithm outside the API process
+"""
+
+import os
+import sys
+import time
+import argparse
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import SessionLocal
+from app.map_models import MapPublishing
+from app.routing import build_contraction_hierarchies, get_contraction_hierarchy, get_routing_graph, ROUTE_WEIGHTS
+
+def build_hierarchies(version_ids, force: bool = False):
+    """Contract the given versions, or every published version whose hierarchies are missing or stale"""
+    with SessionLocal() as db:
+        if not version_ids:
+            rows = db.query(MapPublishing.version_id).filter(MapPublishing.status == "published").distinct().all()
+            version_ids = [version_id for version_id, in rows]
+
+        for version_id in version_ids:
+            graph = get_routing_graph(db, version_id)
+            if not force and all(get_contraction_hierarchy(db, graph, weight) is not None for weight in ROUTE_WEIGHTS):
+                print(f"Version {version_id}: hierarchies are current")
+                continue
+            start = time.perf_counter()
+            build_contraction_hierarchies(db, version_id)
+            print(f"Version {version_id}: contracted {len(graph.node_ids)} nodes in {time.perf_counter() - start:.1f} s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("version_ids", type=int, nargs="*", help="versions to contract (default: all published)")
+    parser.add_argument("--force", action="store_true", help="rebuild hierarchies that are still current")
+    args = parser.parse_args()
+
+    build_hierarchies(args.version_ids, force=args.force)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Bring an existing database up to the current schema and backfill derived data
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import LargeBinary, inspect, text
+from app.database import engine, SessionLocal, DATABASE_URL
+from app.models import Base, Floor, FloorSurveyStats
+import app.map_models  # registers the map authoring tables (e.g. routing_artifacts) on Base.metadata
+from app.crud import backfill_packed_scans, rebuild_access_point_stats
+
+def migrate_database():
+    """Create missing tables and backfill them from existing rows"""
+    
+    print(f"Using database: {DATABASE_URL}")
+    
+    # New tables only; existing tables are left untouched
+    print("Creating missing tables...")
+    Base.metadata.create_all(bind=engine)
+    
+    # Columns added to tables that already existed
+    print("Adding missing columns...")
+    fingerprint_columns = {column["name"] for column in inspect(engine).get_columns("fingerprints")}
+    if "survey_session_id" not in fingerprint_columns:
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE fingerprints ADD COLUMN survey_session_id INTEGER REFERENCES survey_sessions(id)"))
+        print("Column survey_session_id added to fingerprints table")
+    scan_columns = {column["name"] for column in inspect(engine).get_columns("fingerprint_scans")}
+    if "moments" not in scan_columns:
+        # Aggregated points packed without their counts are repacked by the backfill below
+        with engine.begin() as conn:
+            binary = LargeBinary().compile(dialect=engine.dialect)  # BLOB on SQLite, BYTEA on PostgreSQL
+            conn.execute(text(f"ALTER TABLE fingerprint_scans ADD COLUMN moments {binary}"))
+            conn.execute(text("DELETE FROM fingerprint_scans"))
+        print("Column moments added to fingerprint_scans table")
+    
+    # create_all skips indexes on tables that already existed
+    print("Creating missing indexes...")
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    
+    db = SessionLocal()
+    try:
+        print("Packing fingerprint scans against interned access point ids...")
+        converted = backfill_packed_scans(db)
+        print(f"Packed scans for {converted} fingerprints")
+        
+        print("Computing access point statistics for floors surveyed before they existed...")
+        counted_floors = db.query(FloorSurveyStats.floor_id)
+        floor_ids = [floor_id for (floor_id,) in db.query(Floor.id).filter(~Floor.id.in_(counted_floors)).all()]
+        for floor_id in floor_ids:
+            rebuild_access_point_stats(db, floor_id)
+        print(f"Computed statistics for {len(floor_ids)} floors")
+    finally:
+        db.close()
+    
+    print("Migration complete!")
+
+if __name__ == "__main__":
+    migrate_database()
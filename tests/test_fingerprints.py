@@ -3,7 +3,7 @@ from fastapi.testclient import TestClient
 from sqlalchemy.orm import Session
 from app.main import app
 from app.database import get_db, Base
-from app.models import Building, Floor, Fingerprint
+from app.models import Building, Floor, Fingerprint, AccessPoint
 from app.schemas import BuildingCreate, FloorCreate, FingerprintCreate
 
 @pytest.fixture
@@ -102,6 +102,30 @@ def test_create_fingerprint_batch(client, sample_building_and_floor):
     data = response.json()
     assert len(data) == 2
 
+def test_create_fingerprint_batch_shares_access_points(client, db_session, sample_building_and_floor):
+    building_id, floor_id = sample_building_and_floor
+    
+    batch_data = {
+        "fingerprints": [
+            {
+                "floor_id": floor_id,
+                "x": float(i),
+                "y": 0.0,
+                "wifi_scans": [{"bssid": "12:34:56:78:9a:bc", "rssi": -40.0 - i}]
+            }
+            for i in range(5)
+        ]
+    }
+    
+    response = client.post("/api/v1/fingerprints/batch", json=batch_data)
+    assert response.status_code == 200
+    
+    data = response.json()
+    assert [point["x"] for point in data] == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert all(point["id"] for point in data)
+    assert [point["id"] for point in data] == sorted(point["id"] for point in data)
+    assert db_session.query(AccessPoint).filter(AccessPoint.bssid == "12:34:56:78:9a:bc").count() == 1
+
 def test_get_radiomap(client, sample_building_and_floor):
     building_id, floor_id = sample_building_and_floor
     
@@ -122,3 +146,277 @@ def test_get_radiomap(client, sample_building_and_floor):
     assert len(data["points"]) == 1
     assert data["points"][0]["x"] == 10.5
     assert data["points"][0]["y"] == 20.3
+
+def test_import_fingerprints_ndjson_gzip(client, sample_building_and_floor):
+    import gzip
+    import json
+    building_id, floor_id = sample_building_and_floor
+    
+    lines = [
+        json.dumps({"x": 1.0, "y": 2.0, "wifi_scans": [{"bssid": "00:11:22:33:44:55", "rssi": -45.0}]}),
+        "{not json",
+        json.dumps({"x": 3.0, "wifi_scans": []}),
+        json.dumps({"x": 4.0, "y": 5.0, "device_model": "Pixel 7", "wifi_scans": [{"bssid": "00:11:22:33:44:55", "rssi": -60.0}]})
+    ]
+    body = gzip.compress("\n".join(lines).encode())
+    
+    response = client.post(
+        f"/api/v1/floors/{floor_id}/fingerprints/import",
+        content=body,
+        headers={"Content-Type": "application/x-ndjson", "Content-Encoding": "gzip"}
+    )
+    assert response.status_code == 200
+    
+    data = response.json()
+    assert data["imported"] == 2
+    assert data["failed"] == 2
+    assert [error["line"] for error in data["errors"]] == [2, 3]
+    
+    points = client.get(f"/api/v1/floors/{floor_id}/fingerprints").json()
+    assert sorted(point["x"] for point in points)[-2:] == [1.0, 4.0]
+
+def test_import_fingerprints_csv(client, sample_building_and_floor):
+    building_id, floor_id = sample_building_and_floor
+    
+    body = (
+        "x,y,device_model,wifi_scans\n"
+        "1.5,2.5,Pixel 7,00:11:22:33:44:55=-45;aa:bb:cc:dd:ee:ff=-70\n"
+        "3.5,4.5,,00:11:22:33:44:55\n"
+    )
+    response = client.post(
+        f"/api/v1/floors/{floor_id}/fingerprints/import",
+        content=body,
+        headers={"Content-Type": "text/csv"}
+    )
+    assert response.status_code == 200
+    
+    data = response.json()
+    assert data["imported"] == 1
+    assert data["errors"][0]["line"] == 3
+    
+    response = client.post(
+        f"/api/v1/floors/{floor_id}/fingerprints/import?format=csv",
+        content="x,y\n1,2\n"
+    )
+    assert response.status_code == 400
+
+def test_import_rejects_closed_survey_sessions(client, sample_building_and_floor):
+    import json
+    building_id, floor_id = sample_building_and_floor
+    
+    retired = client.post(f"/api/v1/floors/{floor_id}/survey-sessions", json={"name": "old"}).json()["id"]
+    client.post(f"/api/v1/survey-sessions/{retired}/activate")
+    current = client.post(f"/api/v1/floors/{floor_id}/survey-sessions", json={"name": "new"}).json()["id"]
+    client.post(f"/api/v1/survey-sessions/{current}/activate")
+    
+    scans = [{"bssid": "00:11:22:33:44:55", "rssi": -50.0}]
+    lines = [
+        json.dumps({"x": 1.0, "y": 1.0, "survey_session_id": current, "wifi_scans": scans}),
+        json.dumps({"x": 2.0, "y": 2.0, "survey_session_id": retired, "wifi_scans": scans}),
+        json.dumps({"x": 3.0, "y": 3.0, "survey_session_id": 999999, "wifi_scans": scans}),
+    ]
+    # The retired session is on the last line, so it lands in the final flush
+    response = client.post(f"/api/v1/floors/{floor_id}/fingerprints/import", content="\n".join(lines))
+    assert response.status_code == 200
+    
+    data = response.json()
+    assert data["imported"] == 1
+    assert [error["line"] for error in data["errors"]] == [2, 3]
+    assert "not open" in data["errors"][0]["error"]
+
+def test_ingestion_queue_writes_behind(client, db_session, sample_building_and_floor):
+    import queue
+    from sqlalchemy.orm import sessionmaker
+    from app.ingestion import IngestionQueue
+    building_id, floor_id = sample_building_and_floor
+    
+    ingestion = IngestionQueue(sessionmaker(bind=db_session.get_bind()), maxsize=10, batch_size=4)
+    fingerprints = [
+        FingerprintCreate(floor_id=floor_id, x=float(i), y=1.0, wifi_scans=[{"bssid": "00:11:22:33:44:55", "rssi": -50.0}])
+        for i in range(6)
+    ]
+    ingestion.submit(fingerprints)
+    with pytest.raises(queue.Full):
+        ingestion.submit(fingerprints * 2)
+    ingestion.drain()
+    
+    assert ingestion.stats() == {"depth": 0, "capacity": 10, "ingested": 6, "failed": 0}
+    assert db_session.query(Fingerprint).filter(Fingerprint.floor_id == floor_id).count() == 6
+
+def test_ingestion_queue_drain_times_out(client, db_session, sample_building_and_floor):
+    import threading
+    from sqlalchemy.orm import sessionmaker
+    from app.ingestion import IngestionQueue
+    building_id, floor_id = sample_building_and_floor
+    
+    # A database that stalls must not hang shutdown
+    released = threading.Event()
+    factory = sessionmaker(bind=db_session.get_bind())
+    def stalled_session():
+        released.wait()
+        return factory()
+    ingestion = IngestionQueue(stalled_session, maxsize=10, batch_size=4)
+    ingestion.submit([FingerprintCreate(floor_id=floor_id, x=1.0, y=1.0, wifi_scans=[{"bssid": "00:11:22:33:44:55", "rssi": -50.0}])])
+    assert ingestion.drain(timeout=0.1) is False
+    released.set()
+    assert ingestion.drain(timeout=10) is True
+    assert ingestion.stats()["ingested"] == 1
+
+def test_ingestion_queue_endpoint(client, sample_building_and_floor):
+    building_id, floor_id = sample_building_and_floor
+    response = client.get("/api/v1/fingerprints/queue")
+    assert response.status_code == 200
+    assert response.json()["capacity"] > 0
+    
+    # Fingerprints the worker could never write are rejected up front instead of acknowledged
+    scans = [{"bssid": "00:11:22:33:44:55", "rssi": -50.0}]
+    unknown_floor = {"fingerprints": [{"floor_id": 999999, "x": 1.0, "y": 1.0, "wifi_scans": scans}]}
+    assert client.post("/api/v1/fingerprints/queue", json=unknown_floor).status_code == 404
+    retired = client.post(f"/api/v1/floors/{floor_id}/survey-sessions", json={"name": "old"}).json()["id"]
+    client.post(f"/api/v1/survey-sessions/{retired}/activate")
+    current = client.post(f"/api/v1/floors/{floor_id}/survey-sessions", json={"name": "new"}).json()["id"]
+    client.post(f"/api/v1/survey-sessions/{current}/activate")
+    closed = {"fingerprints": [{"floor_id": floor_id, "x": 1.0, "y": 1.0, "survey_session_id": retired, "wifi_scans": scans}]}
+    response = client.post("/api/v1/fingerprints/queue", json=closed)
+    assert response.status_code == 400
+    assert "not open" in response.json()["detail"]
+
+def test_radiomap_changes_since_revision(client, sample_building_and_floor):
+    building_id, floor_id = sample_building_and_floor
+    fingerprint_data = {
+        "floor_id": floor_id,
+        "x": 1.0,
+        "y": 1.0,
+        "wifi_scans": [{"bssid": "00:11:22:33:44:55", "rssi": -45.0}]
+    }
+    first_id = client.post("/api/v1/fingerprints", json=fingerprint_data).json()["id"]
+    
+    radio_map = client.get(f"/api/v1/floors/{floor_id}/radiomap").json()
+    assert radio_map["points"][0]["id"] == first_id
+    revision = radio_map["revision"]
+    
+    response = client.get(f"/api/v1/floors/{floor_id}/radiomap/changes?since={revision}")
+    assert response.json()["added"] == [] and response.json()["full"] is False
+    
+    second_id = client.post("/api/v1/fingerprints", json={**fingerprint_data, "x": 2.0}).json()["id"]
+    delta = client.get(f"/api/v1/floors/{floor_id}/radiomap/changes?since={revision}").json()
+    assert delta["full"] is False
+    assert delta["revision"] == revision + 1
+    assert [point["id"] for point in delta["added"]] == [second_id]
+    
+    # Too far behind: the first revision predates the change log
+    snapshot = client.get(f"/api/v1/floors/{floor_id}/radiomap/changes?since=0").json()
+    assert snapshot["full"] is True
+    assert [point["id"] for point in snapshot["added"]] == [first_id, second_id]
+    
+    client.delete(f"/api/v1/floors/{floor_id}/fingerprints")
+    after_reset = client.get(f"/api/v1/floors/{floor_id}/radiomap/changes?since={delta['revision']}").json()
+    assert after_reset["full"] is True
+    assert after_reset["added"] == []
+
+def test_compact_floor_fingerprints(client, db_session, sample_building_and_floor):
+    from app.models import FingerprintArchive
+    building_id, floor_id = sample_building_and_floor
+    
+    batch_data = {
+        "fingerprints": [
+            {
+                "floor_id": floor_id,
+                "x": 10.0 + offset,
+                "y": 10.0,
+                "wifi_scans": [{"bssid": "00:11:22:33:44:55", "rssi": rssi}]
+            }
+            for offset, rssi in [(0.0, -40.0), (0.1, -50.0), (0.2, -60.0)]
+        ] + [
+            {
+                "floor_id": floor_id,
+                "x": 30.0,
+                "y": 30.0,
+                "wifi_scans": [{"bssid": "00:11:22:33:44:55", "rssi": -80.0}]
+            }
+        ]
+    }
+    client.post("/api/v1/fingerprints/batch", json=batch_data)
+    
+    response = client.post(f"/api/v1/floors/{floor_id}/fingerprints/compact?archive=true")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["fingerprints_before"] == 4
+    assert data["fingerprints_after"] == 2
+    assert data["archived"] == 3
+    
+    points = client.get(f"/api/v1/floors/{floor_id}/radiomap").json()["points"]
+    aggregated = next(point for point in points if point["x"] < 20)
+    assert aggregated["x"] == pytest.approx(10.1)
+    assert aggregated["wifi_scans"][0]["rssi"] == pytest.approx(-50.0)
+    assert aggregated["wifi_scans"][0]["rssi_std"] == pytest.approx(8.16, abs=0.01)
+    assert aggregated["wifi_scans"][0]["count"] == 3
+    assert db_session.query(FingerprintArchive).filter(FingerprintArchive.floor_id == floor_id).count() == 3
+    
+    # Compacting again is a no-op
+    assert client.post(f"/api/v1/floors/{floor_id}/fingerprints/compact").json()["aggregated_points"] == 0
+
+def test_keyset_pagination_and_streaming_export(client, sample_building_and_floor):
+    building_id, floor_id = sample_building_and_floor
+    
+    batch_data = {
+        "fingerprints": [
+            {
+                "floor_id": floor_id,
+                "x": float(i),
+                "y": 0.0,
+                "wifi_scans": [{"bssid": "00:11:22:33:44:55", "rssi": -50.0}]
+            }
+            for i in range(5)
+        ]
+    }
+    created_ids = [point["id"] for point in client.post("/api/v1/fingerprints/batch", json=batch_data).json()]
+    
+    page = client.get(f"/api/v1/floors/{floor_id}/fingerprints?limit=2")
+    assert [point["id"] for point in page.json()] == created_ids[:2]
+    cursor = page.headers["x-next-after-id"]
+    page = client.get(f"/api/v1/floors/{floor_id}/fingerprints?limit=2&after_id={cursor}")
+    assert [point["id"] for point in page.json()] == created_ids[2:4]
+    
+    response = client.get(f"/api/v1/floors/{floor_id}/fingerprints/export")
+    assert response.status_code == 200
+    exported = response.json()
+    assert [point["id"] for point in exported] == created_ids
+    assert exported[0]["wifi_scans"] == [{"bssid": "00:11:22:33:44:55", "rssi": -50.0}]
+
+def test_access_point_stats_maintained_incrementally(client, db_session, sample_building_and_floor):
+    from app import crud
+    building_id, floor_id = sample_building_and_floor
+    
+    readings = [(0.0, -40.0), (0.1, -50.0), (0.2, -60.0), (8.0, -70.0)]
+    batch_data = {
+        "fingerprints": [
+            {"floor_id": floor_id, "x": x, "y": 1.0, "wifi_scans": [{"bssid": "0a:0b:0c:0d:0e:0f", "rssi": rssi}]}
+            for x, rssi in readings
+        ]
+    }
+    client.post("/api/v1/fingerprints/batch", json=batch_data)
+    
+    def stats():
+        response = client.get(f"/api/v1/floors/{floor_id}/access-points/stats")
+        assert response.status_code == 200
+        return response.json()[0]
+    
+    expected = stats()
+    assert expected["sample_count"] == 4
+    assert expected["rssi_mean"] == pytest.approx(-55.0)
+    assert expected["rssi_std"] == pytest.approx(11.18, abs=0.01)
+    assert (expected["min_x"], expected["max_x"]) == (0.0, 8.0)
+    
+    # Compaction swaps rows for aggregates without changing the statistics
+    client.post(f"/api/v1/floors/{floor_id}/fingerprints/compact")
+    compacted = stats()
+    assert compacted["sample_count"] == 4
+    assert compacted["rssi_mean"] == pytest.approx(expected["rssi_mean"])
+    assert compacted["rssi_std"] == pytest.approx(expected["rssi_std"], abs=0.02)
+    
+    crud.rebuild_access_point_stats(db_session, floor_id)
+    assert stats()["rssi_mean"] == pytest.approx(expected["rssi_mean"])
+    
+    client.delete(f"/api/v1/floors/{floor_id}/fingerprints")
+    assert client.get(f"/api/v1/floors/{floor_id}/access-points/stats").json() == []
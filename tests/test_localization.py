@@ -0,0 +1,483 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.database import get_db, Base
+
+@pytest.fixture
+def db_session():
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    
+    engine = create_engine("sqlite:///./test.db")
+    Base.metadata.create_all(bind=engine)
+    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    
+    session = TestingSessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+@pytest.fixture
+def client(db_session):
+    def override_get_db():
+        try:
+            yield db_session
+        finally:
+            pass
+    
+    app.dependency_overrides[get_db] = override_get_db
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+def scan_at(x, y):
+    # Three synthetic APs whose signal decays with distance from their corner
+    aps = {"00:00:00:00:00:01": (0, 0), "00:00:00:00:00:02": (40, 0), "00:00:00:00:00:03": (0, 40)}
+    return [
+        {"bssid": bssid, "rssi": round(-30.0 - ((x - ax) ** 2 + (y - ay) ** 2) ** 0.5, 1)}
+        for bssid, (ax, ay) in aps.items()
+    ]
+
+@pytest.fixture
+def surveyed_floor(client):
+    building_id = client.post("/api/v1/buildings", json={"name": "Survey Building"}).json()["id"]
+    floor_id = client.post("/api/v1/floors", json={
+        "building_id": building_id,
+        "floor_number": 1,
+        "width": 40.0,
+        "height": 40.0
+    }).json()["id"]
+    
+    fingerprints = [
+        {"floor_id": floor_id, "x": float(x), "y": float(y), "wifi_scans": scan_at(x, y)}
+        for x in range(0, 41, 10) for y in range(0, 41, 10)
+    ]
+    client.post("/api/v1/fingerprints/batch", json={"fingerprints": fingerprints})
+    return building_id, floor_id
+
+def test_locate_on_floor(client, surveyed_floor):
+    building_id, floor_id = surveyed_floor
+    
+    response = client.post(f"/api/v1/floors/{floor_id}/locate", json={"wifi_scans": scan_at(20, 10), "k": 1})
+    assert response.status_code == 200
+    
+    data = response.json()
+    assert data["floor_id"] == floor_id
+    assert (data["x"], data["y"]) == pytest.approx((20.0, 10.0))
+    assert 0.9 < data["confidence"] <= 1.0
+    assert len(data["neighbors"]) == 1
+
+def test_locate_interpolates_between_neighbors(client, surveyed_floor):
+    building_id, floor_id = surveyed_floor
+    
+    response = client.post(f"/api/v1/floors/{floor_id}/locate", json={"wifi_scans": scan_at(15, 15), "k": 4})
+    assert response.status_code == 200
+    
+    data = response.json()
+    assert 10.0 <= data["x"] <= 20.0
+    assert 10.0 <= data["y"] <= 20.0
+
+def test_locate_with_unknown_access_points(client, surveyed_floor):
+    building_id, floor_id = surveyed_floor
+    
+    response = client.post(f"/api/v1/floors/{floor_id}/locate", json={
+        "wifi_scans": [{"bssid": "ff:ff:ff:ff:ff:ff", "rssi": -50.0}]
+    })
+    assert response.status_code == 422
+
+def test_radiomap_cache_invalidated_by_writes(client, surveyed_floor):
+    building_id, floor_id = surveyed_floor
+    query = {"wifi_scans": [{"bssid": "00:00:00:00:00:99", "rssi": -40.0}], "k": 1}
+    
+    # Unknown AP until a fingerprint containing it is written
+    assert client.post(f"/api/v1/floors/{floor_id}/locate", json=query).status_code == 422
+    client.post("/api/v1/fingerprints", json={
+        "floor_id": floor_id, "x": 5.0, "y": 35.0, "wifi_scans": query["wifi_scans"]
+    })
+    response = client.post(f"/api/v1/floors/{floor_id}/locate", json=query)
+    assert response.status_code == 200
+    assert (response.json()["x"], response.json()["y"]) == pytest.approx((5.0, 35.0))
+    
+    client.delete(f"/api/v1/floors/{floor_id}/fingerprints")
+    assert client.post(f"/api/v1/floors/{floor_id}/locate", json=query).status_code == 404
+
+def test_radiomap_cache_evicts_least_recently_used():
+    import numpy as np
+    from app.localization import RadioMapCache, RadioMapMatrix
+    
+    def radio_map(floor_id):
+        return RadioMapMatrix(floor_id, np.arange(10), np.zeros((10, 2)), ["ap"], np.zeros((10, 1), dtype=np.float32))
+    
+    cache = RadioMapCache(max_bytes=radio_map(0).nbytes * 2)
+    for floor_id in (1, 2):
+        cache.put(floor_id, radio_map(floor_id), cache.generation(floor_id))
+    cache.get(1)
+    cache.put(3, radio_map(3), cache.generation(3))
+    
+    assert cache.get(1) is not None
+    assert cache.get(2) is None
+    assert cache.get(3) is not None
+    
+    # A map compiled before an invalidation must not be cached
+    generation = cache.generation(1)
+    cache.invalidate(1)
+    cache.put(1, radio_map(1), generation)
+    assert cache.get(1) is None
+
+def test_radiomap_cache_counts_attached_engines():
+    import numpy as np
+    from app.localization import RadioMapCache, RadioMapMatrix
+    
+    def radio_map(floor_id):
+        rng = np.random.default_rng(floor_id)
+        rssi = rng.uniform(-90, -40, (50, 8)).astype(np.float32)
+        return RadioMapMatrix(floor_id, np.arange(50), rng.uniform(0, 40, (50, 2)), [f"ap{i}" for i in range(8)], rssi)
+    
+    first, second = radio_map(1), radio_map(2)
+    bare = first.nbytes
+    cache = RadioMapCache(max_bytes=bare * 2 + bare // 2)
+    cache.put(1, first, cache.generation(1))
+    cache.put(2, second, cache.generation(2))
+    
+    # Building an engine grows the entry, and the budget then evicts the least recently used map
+    second.attach_engine("gaussian", radio_map(2).engine("gaussian"))
+    assert second.nbytes > bare
+    cache.resize(2, second)
+    assert cache.stats()["bytes"] == second.nbytes
+    assert cache.get(1) is None
+    assert cache.get(2) is second
+    
+    # So does the binary export once it has been built
+    before = second.nbytes
+    payload, _ = second.export
+    assert second.nbytes == before + len(payload)
+
+def test_locate_batch_matches_single_scans(client, surveyed_floor):
+    building_id, floor_id = surveyed_floor
+    points = [(0, 0), (20, 10), (33, 27), (40, 40)]
+    scans = [{"wifi_scans": scan_at(x, y)} for x, y in points]
+    scans.append({"wifi_scans": [{"bssid": "ff:ff:ff:ff:ff:ff", "rssi": -50.0}]})
+    
+    response = client.post(f"/api/v1/floors/{floor_id}/locate/batch", json={"scans": scans, "k": 3})
+    assert response.status_code == 200
+    
+    estimates = response.json()["estimates"]
+    assert len(estimates) == len(scans)
+    for scan, estimate in zip(scans[:-1], estimates):
+        single = client.post(f"/api/v1/floors/{floor_id}/locate", json={**scan, "k": 3}).json()
+        assert (estimate["x"], estimate["y"]) == pytest.approx((single["x"], single["y"]), abs=1e-3)
+        assert estimate["neighbors"] == single["neighbors"]
+    assert estimates[-1]["x"] is None
+    assert estimates[-1]["confidence"] == 0.0
+
+def test_inverted_index_pruning_matches_full_scan():
+    import numpy as np
+    from types import SimpleNamespace
+    from app.localization import RadioMapMatrix, wknn_locate, wknn_locate_batch
+    
+    # 30 x 30 grid with an AP every 10 m that is only heard within 15 m
+    aps = [(f"ap-{ax}-{ay}", ax, ay) for ax in range(0, 30, 10) for ay in range(0, 30, 10)]
+    def scan(x, y):
+        return [
+            {"bssid": bssid, "rssi": -30.0 - 2.0 * np.hypot(x - ax, y - ay)}
+            for bssid, ax, ay in aps if np.hypot(x - ax, y - ay) <= 15
+        ]
+    rows = [(i, float(x), float(y), scan(x, y)) for i, (x, y) in enumerate((x, y) for x in range(30) for y in range(30))]
+    radio_map = RadioMapMatrix.from_rows(1, rows)
+    
+    for x, y in [(2.5, 3.5), (14.2, 18.7), (27.0, 1.0)]:
+        query = [SimpleNamespace(**s) for s in scan(x, y)]
+        candidates = radio_map.candidate_rows(radio_map.scan_matrix([query])[0][0], min_candidates=3)
+        assert len(candidates) < len(rows)
+        pruned = wknn_locate(radio_map, query, k=3, prune=True)
+        full = wknn_locate(radio_map, query, k=3, prune=False)
+        assert pruned["neighbors"] == full["neighbors"]
+    
+    # A scan whose known APs are all at the noise floor has nothing to look up, so every row is scored
+    floor_scan = [SimpleNamespace(bssid="ap-0-0", rssi=-100.0)]
+    assert len(radio_map.candidate_rows(radio_map.scan_matrix([floor_scan])[0][0], min_candidates=3)) == len(rows)
+    pruned = wknn_locate_batch(radio_map, [floor_scan], k=3, prune=True)
+    assert pruned == wknn_locate_batch(radio_map, [floor_scan], k=3, prune=False)
+
+def test_locate_detects_building_and_floor(client):
+    import uuid
+    
+    building_id = client.post("/api/v1/buildings", json={"name": "Two Storey"}).json()["id"]
+    floors = {}
+    for floor_number in (1, 2):
+        floor_id = client.post("/api/v1/floors", json={"building_id": building_id, "floor_number": floor_number}).json()["id"]
+        # Unique BSSIDs per floor so earlier test data cannot match
+        prefix = uuid.uuid4().hex[:6]
+        floors[floor_id] = [f"{prefix}:{n}" for n in range(3)]
+        client.post("/api/v1/fingerprints/batch", json={"fingerprints": [
+            {
+                "floor_id": floor_id,
+                "x": float(x),
+                "y": 0.0,
+                "wifi_scans": [{"bssid": bssid, "rssi": -40.0 - abs(x - 10 * n)} for n, bssid in enumerate(floors[floor_id])]
+            }
+            for x in range(0, 21, 5)
+        ]})
+    
+    upper_floor_id = max(floors)
+    # The lower floor's strongest AP bleeds through faintly
+    scan = [{"bssid": bssid, "rssi": -40.0 - abs(10 - 10 * n)} for n, bssid in enumerate(floors[upper_floor_id])]
+    scan.append({"bssid": floors[min(floors)][0], "rssi": -88.0})
+    
+    response = client.post("/api/v1/locate", json={"wifi_scans": scan, "k": 1})
+    assert response.status_code == 200
+    
+    data = response.json()
+    assert data["building_id"] == building_id
+    assert data["floor_id"] == upper_floor_id
+    assert data["candidates"][0]["score"] > data["candidates"][1]["score"]
+    assert (data["x"], data["y"]) == pytest.approx((10.0, 0.0))
+    
+    restricted = client.post("/api/v1/locate", json={"wifi_scans": scan, "building_id": building_id})
+    assert {c["building_id"] for c in restricted.json()["candidates"]} == {building_id}
+
+def test_kdtree_engine_selectable_per_floor(client, surveyed_floor):
+    building_id, floor_id = surveyed_floor
+    
+    assert client.get(f"/api/v1/floors/{floor_id}/localization-settings").json()["engine"] == "wknn"
+    assert client.put(f"/api/v1/floors/{floor_id}/localization-settings", json={"engine": "bogus"}).status_code == 400
+    response = client.put(f"/api/v1/floors/{floor_id}/localization-settings", json={"engine": "kdtree"})
+    assert response.status_code == 200
+    assert response.json() == {"floor_id": floor_id, "engine": "kdtree"}
+    
+    scan = {"wifi_scans": scan_at(30, 20), "k": 1}
+    data = client.post(f"/api/v1/floors/{floor_id}/locate", json=scan).json()
+    assert data["engine"] == "kdtree"
+    assert (data["x"], data["y"]) == pytest.approx((30.0, 20.0))
+    
+    brute_force = client.post(f"/api/v1/floors/{floor_id}/locate", json={**scan, "k": 3, "engine": "wknn"}).json()
+    kdtree = client.post(f"/api/v1/floors/{floor_id}/locate", json={**scan, "k": 3}).json()
+    assert kdtree["neighbors"] == brute_force["neighbors"]
+
+def test_tracking_session_smooths_positions(client, surveyed_floor):
+    building_id, floor_id = surveyed_floor
+    
+    with client.websocket_connect(f"/api/v1/floors/{floor_id}/track?device_id=test-device") as websocket:
+        websocket.send_json({"wifi_scans": [{"bssid": "ff:ff:ff:ff:ff:ff", "rssi": -50.0}]})
+        assert "error" in websocket.receive_json()
+        
+        positions = []
+        for second, (x, y) in enumerate([(10, 10), (11, 10), (12, 10), (13, 10), (14, 10)]):
+            websocket.send_json({"wifi_scans": scan_at(x, y), "timestamp": float(second)})
+            positions.append(websocket.receive_json())
+    
+    last = positions[-1]
+    assert last["floor_id"] == floor_id
+    assert last["device_id"] == "test-device"
+    assert abs(last["x"] - 14.0) < 5.0
+    assert abs(last["y"] - 10.0) < 5.0
+    assert last["effective_particles"] > 0
+
+def test_tracking_sessions_expire_when_idle():
+    from app.tracking import TrackingSessionStore
+    
+    store = TrackingSessionStore(idle_timeout=0.0)
+    store.get("device", floor_id=1)
+    assert len(store) == 0
+    
+    store = TrackingSessionStore(idle_timeout=60.0, max_sessions=2)
+    first = store.get("a", floor_id=1)
+    store.get("b", floor_id=1)
+    store.get("c", floor_id=1)
+    assert len(store) == 2
+    assert store.get("a", floor_id=1) is not first
+
+def test_engines_reject_floor_without_access_points(client):
+    building_id = client.post("/api/v1/buildings", json={"name": "Silent Building"}).json()["id"]
+    floor_id = client.post("/api/v1/floors", json={"building_id": building_id, "floor_number": 1}).json()["id"]
+    fingerprints = [{"floor_id": floor_id, "x": float(x), "y": 0.0, "wifi_scans": []} for x in range(3)]
+    client.post("/api/v1/fingerprints/batch", json={"fingerprints": fingerprints})
+    
+    for engine in ("wknn", "kdtree", "gaussian"):
+        response = client.post(f"/api/v1/floors/{floor_id}/locate", json={"wifi_scans": scan_at(1, 0), "engine": engine})
+        assert response.status_code == 422, engine
+
+def test_gaussian_engine_groups_repeated_surveys():
+    import numpy as np
+    from types import SimpleNamespace
+    from app.localization import RadioMapMatrix, locate
+    
+    rng = np.random.default_rng(7)
+    rows = []
+    for x, y in [(float(x), float(y)) for x in range(0, 41, 10) for y in range(0, 41, 10)]:
+        for _ in range(4):
+            wifi_scans = [dict(s, rssi=s["rssi"] + rng.normal(0, 2)) for s in scan_at(x, y)]
+            rows.append((len(rows) + 1, x, y, wifi_scans))
+    radio_map = RadioMapMatrix.from_rows(1, rows)
+    
+    engine = radio_map.engine("gaussian")
+    assert engine.mean.shape == (25, 3)
+    
+    query = [SimpleNamespace(**s) for s in scan_at(30, 20)]
+    estimate = locate(radio_map, query, k=1, engine="gaussian")
+    assert (estimate["x"], estimate["y"]) == pytest.approx((30.0, 20.0))
+    assert 0.0 < estimate["confidence"] <= 1.0
+    
+    # A scan 15 dB weaker than anything surveyed still lands somewhere, but with lower confidence,
+    # and the confidence is on the same scale as WKNN's
+    offset = [SimpleNamespace(**dict(s, rssi=s["rssi"] - 15)) for s in scan_at(30, 20)]
+    weak = locate(radio_map, offset, k=1, engine="gaussian")
+    assert weak["confidence"] < estimate["confidence"] / 1.5
+    wknn = locate(radio_map, offset, k=1, engine="wknn")
+    assert weak["confidence"] == pytest.approx(wknn["confidence"], abs=0.15)
+
+def test_interpolated_grid_engine(client, surveyed_floor):
+    building_id, floor_id = surveyed_floor
+    scan = {"wifi_scans": scan_at(25, 15), "k": 1, "engine": "grid"}
+    
+    assert client.post(f"/api/v1/floors/{floor_id}/locate", json=scan).status_code == 409
+    
+    response = client.post(f"/api/v1/floors/{floor_id}/radiomap/grid?resolution=1.0")
+    assert response.status_code == 200
+    assert (response.json()["rows"], response.json()["cols"]) == (40, 40)
+    
+    # The signal grid is cells x APs floats, so that product is capped as well as the cell count
+    import app.localization
+    limit = app.localization.GRID_MAX_VALUES
+    app.localization.GRID_MAX_VALUES = 40 * 40
+    try:
+        assert client.post(f"/api/v1/floors/{floor_id}/radiomap/grid?resolution=1.0").status_code == 400
+    finally:
+        app.localization.GRID_MAX_VALUES = limit
+    
+    data = client.post(f"/api/v1/floors/{floor_id}/locate", json=scan).json()
+    assert data["engine"] == "grid"
+    # Interpolation resolves positions between the 10 m survey points
+    assert abs(data["x"] - 25.0) <= 3.0
+    assert abs(data["y"] - 15.0) <= 3.0
+    
+    # New fingerprints make the persisted grid stale: locate falls back to wknn and queues a recompile
+    client.post("/api/v1/fingerprints", json={"floor_id": floor_id, "x": 1.0, "y": 1.0, "wifi_scans": scan_at(1, 1)})
+    response = client.post(f"/api/v1/floors/{floor_id}/locate", json=scan)
+    assert response.status_code == 200
+    assert response.json()["engine"] == "wknn"
+    assert client.post(f"/api/v1/floors/{floor_id}/locate", json=scan).json()["engine"] == "grid"
+
+def test_device_calibration_fit_and_apply(client, surveyed_floor):
+    import uuid
+    building_id, floor_id = surveyed_floor
+    reference_phone, loud_phone = f"ref-{uuid.uuid4().hex[:6]}", f"loud-{uuid.uuid4().hex[:6]}"
+    
+    fingerprints = []
+    for x in range(0, 41, 10):
+        for y in range(0, 41, 10):
+            for device_model, bias in ((reference_phone, 0.0), (loud_phone, 10.0)):
+                wifi_scans = [dict(s, rssi=s["rssi"] + bias) for s in scan_at(x, y)]
+                fingerprints.append({"floor_id": floor_id, "x": float(x), "y": float(y), "device_model": device_model, "wifi_scans": wifi_scans})
+    client.post("/api/v1/fingerprints/batch", json={"fingerprints": fingerprints})
+    
+    response = client.post("/api/v1/calibration/devices/fit")
+    assert response.status_code == 200
+    fitted = {c["device_model"]: c for c in response.json()}
+    assert fitted[loud_phone]["sample_count"] == 75
+    # Both phones meet halfway on the fleet reference
+    assert fitted[loud_phone]["scale"] == pytest.approx(1.0, abs=1e-3)
+    assert fitted[loud_phone]["offset"] == pytest.approx(-5.0, abs=1e-2)
+    assert fitted[reference_phone]["offset"] == pytest.approx(5.0, abs=1e-2)
+    
+    loud_scan = [dict(s, rssi=s["rssi"] + 10.0) for s in scan_at(20, 30)]
+    data = client.post(f"/api/v1/floors/{floor_id}/locate", json={
+        "wifi_scans": loud_scan, "device_model": loud_phone, "k": 1
+    }).json()
+    assert (data["x"], data["y"]) == pytest.approx((20.0, 30.0))
+
+def test_packed_scans_match_json_compilation(db_session, surveyed_floor):
+    import numpy as np
+    from app import crud
+    from app.models import Fingerprint, FingerprintScans
+    from app.localization import radiomap_cache
+    building_id, floor_id = surveyed_floor
+    
+    packed_map = crud.get_compiled_radiomap(db_session, floor_id)
+    assert db_session.query(FingerprintScans).filter(FingerprintScans.floor_id == floor_id).count() == 25
+    
+    # Rows written before packed storage compile from JSON until the backfill runs
+    db_session.add(Fingerprint(floor_id=floor_id, x=5.0, y=5.0, wifi_scans=scan_at(5, 5)))
+    db_session.commit()
+    radiomap_cache.clear()
+    legacy_map = crud.get_compiled_radiomap(db_session, floor_id)
+    assert len(legacy_map.fingerprint_ids) == 26
+    
+    assert crud.backfill_packed_scans(db_session) >= 1
+    migrated_map = crud.get_compiled_radiomap(db_session, floor_id)
+    assert migrated_map is not legacy_map
+    assert list(migrated_map.fingerprint_ids) == list(legacy_map.fingerprint_ids)
+    order = [legacy_map.bssid_index[bssid] for bssid in migrated_map.bssids]
+    assert np.allclose(migrated_map.rssi, np.round(legacy_map.rssi[:, order]))
+    assert np.allclose(migrated_map.rssi[:25], packed_map.rssi)
+    
+    # Radio map responses decode the packed scans too, falling back to JSON only for unconverted rows
+    legacy = db_session.query(Fingerprint).filter(Fingerprint.floor_id == floor_id, Fingerprint.x == 5.0).one()
+    legacy.wifi_scans = []
+    db_session.commit()
+    point = next(point for point in crud.get_radiomap(db_session, floor_id) if point["id"] == legacy.id)
+    assert sorted(scan["bssid"] for scan in point["wifi_scans"]) == sorted(scan["bssid"] for scan in scan_at(5, 5))
+    assert all(scan["rssi"] == round(scan["rssi"]) for scan in point["wifi_scans"])
+
+def test_binary_radiomap_export_with_etag(client, surveyed_floor):
+    from app.localization import load_radiomap_export
+    building_id, floor_id = surveyed_floor
+    
+    response = client.get(f"/api/v1/floors/{floor_id}/radiomap/export")
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    
+    export = load_radiomap_export(response.content)
+    assert export["floor_id"] == floor_id
+    assert export["coords"].shape == (25, 2)
+    assert sorted(export["bssids"]) == ["00:00:00:00:00:01", "00:00:00:00:00:02", "00:00:00:00:00:03"]
+    row = list(export["coords"].tolist()).index([20.0, 10.0])
+    expected = {scan["bssid"]: round(scan["rssi"]) for scan in scan_at(20, 10)}
+    assert dict(zip(export["bssids"], export["rssi"][row].tolist())) == expected
+    
+    response = client.get(f"/api/v1/floors/{floor_id}/radiomap/export", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    
+    client.post("/api/v1/fingerprints", json={"floor_id": floor_id, "x": 5.0, "y": 5.0, "wifi_scans": scan_at(5, 5)})
+    response = client.get(f"/api/v1/floors/{floor_id}/radiomap/export", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+def test_survey_session_swap_keeps_floor_live(client, surveyed_floor):
+    building_id, floor_id = surveyed_floor
+    query = {"wifi_scans": scan_at(20, 10), "k": 1}
+    
+    survey_session = client.post(f"/api/v1/floors/{floor_id}/survey-sessions", json={"name": "resurvey"}).json()
+    assert survey_session["status"] == "collecting"
+    
+    # The resurvey sees a shifted AP layout; collecting it does not touch the live map
+    shifted = [{"floor_id": floor_id, "x": float(x), "y": 0.0, "wifi_scans": scan_at(x + 5, 0),
+                "survey_session_id": survey_session["id"]} for x in range(0, 41, 10)]
+    assert client.post("/api/v1/fingerprints/batch", json={"fingerprints": shifted}).status_code == 200
+    assert len(client.get(f"/api/v1/floors/{floor_id}/radiomap").json()["points"]) == 25
+    assert client.post(f"/api/v1/floors/{floor_id}/locate", json=query).json()["y"] == pytest.approx(10.0)
+    
+    response = client.post(f"/api/v1/survey-sessions/{survey_session['id']}/activate?purge_previous=true")
+    assert response.status_code == 200
+    assert response.json()["status"] == "active"
+    assert len(client.get(f"/api/v1/floors/{floor_id}/radiomap").json()["points"]) == 5
+    assert client.post(f"/api/v1/floors/{floor_id}/locate", json=query).json()["y"] == 0.0
+    # AP statistics are rebuilt for the new set after the switch has committed
+    stats = client.get(f"/api/v1/floors/{floor_id}/access-points/stats").json()
+    assert {s["sample_count"] for s in stats} == {5}
+    
+    sessions = client.get(f"/api/v1/floors/{floor_id}/survey-sessions").json()
+    assert [(s["status"], s["fingerprint_count"]) for s in sessions] == [("active", 5)]
+    
+    # Fingerprints without a session id join the active session; closed sessions refuse new ones
+    client.post("/api/v1/fingerprints", json={"floor_id": floor_id, "x": 1.0, "y": 1.0, "wifi_scans": scan_at(1, 1)})
+    assert client.get(f"/api/v1/floors/{floor_id}/survey-sessions").json()[0]["fingerprint_count"] == 6
+    assert client.delete(f"/api/v1/survey-sessions/{survey_session['id']}").status_code == 409
+    
+    client.delete(f"/api/v1/floors/{floor_id}/fingerprints")
+    sessions = client.get(f"/api/v1/floors/{floor_id}/survey-sessions").json()
+    assert [(s["status"], s["fingerprint_count"]) for s in sessions] == [("purged", 0), ("active", 0)]
+    response = client.post("/api/v1/fingerprints", json={
+        "floor_id": floor_id, "x": 1.0, "y": 1.0, "wifi_scans": scan_at(1, 1), "survey_session_id": survey_session["id"]
+    })
+    assert response.status_code == 400
@@ -0,0 +1,260 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.database import get_db, Base
+from app.models import Building, Floor
+from app.map_models import FloorPlanVersion, PointOfInterest, RoutingNode, RoutingEdge
+
+@pytest.fixture
+def db_session():
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    
+    engine = create_engine("sqlite:///./test.db")
+    Base.metadata.create_all(bind=engine)
+    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    
+    session = TestingSessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+@pytest.fixture
+def client(db_session):
+    def override_get_db():
+        try:
+            yield db_session
+        finally:
+            pass
+    
+    app.dependency_overrides[get_db] = override_get_db
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+@pytest.fixture
+def routing_version(db_session):
+    # A 3x3 grid of nodes 10 m apart; node ids are returned by (column, row)
+    building = Building(name="Routing Building")
+    db_session.add(building)
+    db_session.flush()
+    floor = Floor(building_id=building.id, floor_number=1)
+    db_session.add(floor)
+    db_session.flush()
+    version = FloorPlanVersion(floor_id=floor.id, version_number=1, file_path="plan.png", file_type="image", scale=10.0)
+    db_session.add(version)
+    db_session.flush()
+    
+    nodes = {}
+    for col in range(3):
+        for row in range(3):
+            node = RoutingNode(version_id=version.id, x_coordinate=col * 100.0, y_coordinate=row * 100.0, node_type="junction")
+            db_session.add(node)
+            db_session.flush()
+            nodes[(col, row)] = node.id
+    for (col, row), node_id in nodes.items():
+        for neighbor in ((col + 1, row), (col, row + 1)):
+            if neighbor in nodes:
+                db_session.add(RoutingEdge(
+                    version_id=version.id, from_node_id=node_id, to_node_id=nodes[neighbor],
+                    distance=10.0, edge_type="walkway"
+                ))
+    db_session.commit()
+    return version.id, nodes
+
+def test_route_between_nodes(client, routing_version):
+    version_id, nodes = routing_version
+    
+    response = client.get(f"/api/v1/versions/{version_id}/route", params={"from": nodes[(0, 0)], "to": nodes[(2, 2)]})
+    assert response.status_code == 200
+    
+    data = response.json()
+    assert data["path"][0] == nodes[(0, 0)]
+    assert data["path"][-1] == nodes[(2, 2)]
+    assert len(data["path"]) == 5
+    assert data["distance"] == pytest.approx(40.0)
+    assert data["travel_time"] == pytest.approx(40.0 / 1.4, abs=0.01)
+
+def test_route_respects_edge_flags(client, db_session, routing_version):
+    from app.routing import routing_graph_cache
+    version_id, nodes = routing_version
+    start, end = nodes[(0, 0)], nodes[(2, 0)]
+    assert client.get(f"/api/v1/versions/{version_id}/route", params={"from": start, "to": end}).json()["distance"] == 20.0
+    
+    # A one-way shortcut is only usable forwards, a parallel longer edge is ignored,
+    # and inactive edges are skipped
+    db_session.add_all([
+        RoutingEdge(version_id=version_id, from_node_id=start, to_node_id=end, distance=12.0, edge_type="walkway", is_bidirectional=False),
+        RoutingEdge(version_id=version_id, from_node_id=start, to_node_id=end, distance=15.0, edge_type="walkway"),
+        RoutingEdge(version_id=version_id, from_node_id=start, to_node_id=end, distance=1.0, edge_type="walkway", is_active=False),
+    ])
+    db_session.commit()
+    routing_graph_cache.invalidate(version_id)
+    
+    forward = client.get(f"/api/v1/versions/{version_id}/route", params={"from": start, "to": end}).json()
+    assert forward["path"] == [start, end]
+    assert forward["distance"] == 12.0
+    backward = client.get(f"/api/v1/versions/{version_id}/route", params={"from": end, "to": start}).json()
+    assert backward["distance"] == 15.0
+    
+    response = client.get(f"/api/v1/versions/{version_id}/route", params={"from": start, "to": 999999})
+    assert response.status_code == 404
+
+def test_astar_matches_dijkstra(client, db_session, routing_version):
+    from app.routing import routing_graph_cache
+    version_id, nodes = routing_version
+    # A diagonal edge drawn 14.1 m long but authored shorter must not break the heuristic
+    db_session.add(RoutingEdge(
+        version_id=version_id, from_node_id=nodes[(0, 0)], to_node_id=nodes[(1, 1)], distance=5.0, edge_type="walkway"
+    ))
+    db_session.commit()
+    routing_graph_cache.invalidate(version_id)
+    
+    for weight in ("distance", "travel_time"):
+        for start in nodes.values():
+            for end in nodes.values():
+                params = {"from": start, "to": end, "weight": weight}
+                dijkstra = client.get(f"/api/v1/versions/{version_id}/route", params=params).json()
+                astar = client.get(f"/api/v1/versions/{version_id}/route", params={**params, "algorithm": "astar"}).json()
+                assert astar[weight] == pytest.approx(dijkstra[weight])
+    
+    response = client.get(f"/api/v1/versions/{version_id}/route", params={"from": start, "to": end, "algorithm": "bfs"})
+    assert response.status_code == 400
+    
+    # Rescaling the plan rebuilds the cached graph with the new pixels per meter
+    assert routing_graph_cache.get(version_id).scale == 10.0
+    floor_id = db_session.get(FloorPlanVersion, version_id).floor_id
+    assert client.put(f"/api/v1/floors/{floor_id}/versions/{version_id}", json={"scale": 20.0}).status_code == 200
+    client.get(f"/api/v1/versions/{version_id}/route", params={"from": start, "to": end, "algorithm": "astar"})
+    assert routing_graph_cache.get(version_id).scale == 20.0
+
+def _publish(client, version_id, floor_id):
+    assert client.post(f"/api/v1/versions/{version_id}/publish").json()["publishing_status"] == "review"
+    publishing = client.get(f"/api/v1/floors/{floor_id}/publishing").json()
+    pending = next(record for record in publishing if record["version_id"] == version_id and not record["is_current"])
+    response = client.post(f"/api/v1/publishing/{pending['id']}/approve")
+    assert response.status_code == 200
+    assert response.json()["is_current"] is True
+
+def test_building_route_changes_floors(client, db_session, routing_version):
+    version_id, nodes = routing_version
+    floor = db_session.get(FloorPlanVersion, version_id).floor_id
+    building_id = db_session.get(Floor, floor).building_id
+    
+    # Floor 2 is a corridor drawn at another scale with an elevator above the ground floor's (2, 2) corner
+    upper_floor = Floor(building_id=building_id, floor_number=2)
+    db_session.add(upper_floor)
+    db_session.flush()
+    upper = FloorPlanVersion(floor_id=upper_floor.id, version_number=1, file_path="plan2.png", file_type="image", scale=20.0)
+    db_session.add(upper)
+    db_session.flush()
+    lift, office = RoutingNode(version_id=upper.id, x_coordinate=400.0, y_coordinate=400.0, node_type="elevator"), \
+        RoutingNode(version_id=upper.id, x_coordinate=0.0, y_coordinate=400.0, node_type="junction")
+    db_session.add_all([lift, office])
+    db_session.flush()
+    db_session.add(RoutingEdge(version_id=upper.id, from_node_id=lift.id, to_node_id=office.id, distance=20.0, edge_type="walkway"))
+    # The ground floor lift is only recognised by its elevator edge
+    ground_lift = RoutingNode(version_id=version_id, x_coordinate=200.0, y_coordinate=200.0, node_type="decision_point")
+    db_session.add(ground_lift)
+    db_session.flush()
+    db_session.add(RoutingEdge(version_id=version_id, from_node_id=nodes[(2, 2)], to_node_id=ground_lift.id, distance=0.5, edge_type="elevator"))
+    db_session.commit()
+    
+    url = f"/api/v1/buildings/{building_id}/route"
+    params = {"from": nodes[(0, 0)], "to": office.id}
+    assert client.get(url, params=params).status_code == 404  # nothing published yet
+    
+    _publish(client, version_id, floor)
+    _publish(client, upper.id, upper_floor.id)
+    data = client.get(url, params=params).json()
+    assert len(data["path"]) == 8
+    assert data["path"][-4:] == [nodes[(2, 2)], ground_lift.id, lift.id, office.id]
+    assert data["floor_changes"] == 1
+    assert data["floors"][0] == floor and data["floors"][-1] == upper_floor.id
+    assert data["distance"] == pytest.approx(40.0 + 0.5 + 4.0 + 10.0 + 20.0)
+    
+    # Publishing a new upper floor version without the elevator drops the cross-floor route
+    replacement = FloorPlanVersion(floor_id=upper_floor.id, version_number=2, file_path="plan3.png", file_type="image", scale=20.0)
+    db_session.add(replacement)
+    db_session.flush()
+    db_session.add(RoutingNode(version_id=replacement.id, x_coordinate=0.0, y_coordinate=0.0, node_type="junction"))
+    db_session.commit()
+    _publish(client, replacement.id, upper_floor.id)
+    assert client.get(url, params=params).status_code == 404
+    history = client.get(f"/api/v1/floors/{upper_floor.id}/publishing").json()
+    assert {record["version_id"]: record["status"] for record in history} == {upper.id: "archived", replacement.id: "published"}
+
+def test_contraction_hierarchy_routes(client, db_session, routing_version):
+    from app.routing import routing_graph_cache, build_contraction_hierarchies
+    version_id, nodes = routing_version
+    url = f"/api/v1/versions/{version_id}/route"
+    assert client.get(url, params={"from": nodes[(0, 0)], "to": nodes[(2, 2)], "algorithm": "ch"}).status_code == 409
+    
+    # Contraction runs outside the API, from build_contraction_hierarchies.py
+    build_contraction_hierarchies(db_session, version_id)
+    routing_graph_cache.clear()  # force loading the stored hierarchy
+    for weight in ("distance", "travel_time"):
+        for start in nodes.values():
+            for end in nodes.values():
+                params = {"from": start, "to": end, "weight": weight}
+                dijkstra = client.get(url, params=params).json()
+                ch = client.get(url, params={**params, "algorithm": "ch"}).json()
+                assert ch[weight] == pytest.approx(dijkstra[weight])
+                assert ch["path"][0] == start and ch["path"][-1] == end
+    
+    # Loaded hierarchies and search lists count against the cache budget
+    graph = routing_graph_cache.get(version_id)
+    assert set(graph.hierarchies) == {"distance", "travel_time"}
+    assert routing_graph_cache.stats()["bytes"] == graph.nbytes
+    
+    # Editing the graph makes the stored hierarchy stale
+    db_session.add(RoutingEdge(version_id=version_id, from_node_id=nodes[(0, 0)], to_node_id=nodes[(2, 2)], distance=1.0, edge_type="walkway"))
+    db_session.commit()
+    routing_graph_cache.invalidate(version_id)
+    assert client.get(url, params={"from": nodes[(0, 0)], "to": nodes[(2, 2)], "algorithm": "ch"}).status_code == 409
+
+def test_poi_route_from_precomputed_matrix(client, db_session, routing_version):
+    import numpy as np
+    from app.routing import routing_graph_cache, poi_matrix_cache
+    version_id, nodes = routing_version
+    pois = [
+        PointOfInterest(version_id=version_id, name="Room 201", category="room", poi_type="office", x_coordinate=5.0, y_coordinate=-8.0),
+        PointOfInterest(version_id=version_id, name="Restroom", category="restroom", poi_type="restroom", x_coordinate=190.0, y_coordinate=210.0),
+        PointOfInterest(version_id=version_id, name="Cafe", category="room", poi_type="cafe", x_coordinate=200.0, y_coordinate=0.0),
+    ]
+    db_session.add_all(pois)
+    db_session.commit()
+    room, restroom, cafe = (poi.id for poi in pois)
+    url = f"/api/v1/versions/{version_id}/pois/route"
+    assert client.get(url, params={"from": room, "to": restroom}).status_code == 409
+    
+    routing_graph_cache.clear()
+    assert client.post(f"/api/v1/versions/{version_id}/publish").status_code == 200
+    data = client.get(url, params={"from": room, "to": restroom}).json()
+    assert data["path"][0] == nodes[(0, 0)] and data["path"][-1] == nodes[(2, 2)]
+    assert len(data["path"]) == 5
+    assert data["distance"] == pytest.approx(40.0)
+    
+    data = client.get(url, params={"from": cafe, "to": room, "weight": "travel_time"}).json()
+    assert data["path"] == [nodes[(2, 0)], nodes[(1, 0)], nodes[(0, 0)]]
+    assert data["travel_time"] == pytest.approx(20.0 / 1.4, abs=0.01)
+    assert client.get(url, params={"from": room, "to": 999999}).status_code == 404
+    
+    # The route is served from cached tables kept apart from the graph, with one small
+    # next-hop row per POI and node
+    poi_matrix = poi_matrix_cache.get((version_id, "distance"))
+    assert poi_matrix.cost(room, restroom) == pytest.approx(40.0)
+    assert poi_matrix.next_hops.dtype == np.int16
+    graph = routing_graph_cache.get(version_id)
+    assert routing_graph_cache.stats()["bytes"] == graph.nbytes
+    
+    # A new POI makes the stored tables stale until the version is published again
+    lab = {"version_id": version_id, "name": "Lab", "category": "room", "poi_type": "lab", "x_coordinate": 100.0, "y_coordinate": 100.0}
+    lab_id = client.post(f"/api/v1/versions/{version_id}/pois", json=lab).json()["id"]
+    assert poi_matrix_cache.get((version_id, "distance")) is None
+    assert client.get(url, params={"from": room, "to": restroom}).status_code == 409
+    
+    assert client.post(f"/api/v1/versions/{version_id}/publish").status_code == 200
+    assert client.get(url, params={"from": room, "to": lab_id}).status_code == 200
+    assert client.delete(f"/api/v1/pois/{lab_id}").status_code == 200
+    assert client.get(url, params={"from": room, "to": restroom}).status_code == 409